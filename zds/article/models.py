@@ -17,6 +17,7 @@ from PIL import Image
 from zds.utils import get_current_user
 from zds.utils import slugify
 from zds.utils.articles import export_article
+from zds.utils.misc import get_unread_pks
 from zds.utils.models import SubCategory, Comment
 from django.core.urlresolvers import reverse
 
@@ -145,6 +146,17 @@ class Article(models.Model):
 
         return txt_contenu.decode('utf-8')
 
+    def get_text_online(self):
+        path = os.path.join(self.get_path(), self.text + '.html')
+        if os.path.isfile(path):
+            txt = open(path, "r")
+            txt_contenu = txt.read()
+            txt.close()
+
+            return txt_contenu.decode('utf-8')
+        else:
+            return None
+
     def save(
             self,
             force_update=False,
@@ -270,6 +282,7 @@ def get_last_articles():
     return Article.objects.all()\
         .exclude(sha_public__isnull=True)\
         .exclude(sha_public__exact='')\
+        .select_related('last_reaction')\
         .order_by('-pubdate')[:5]
 
 
@@ -347,6 +360,16 @@ def never_read(article, user=None):
         .count() == 0
 
 
+def get_unread_articles(articles, user=None):
+    """Returns the pks of the articles which have been never read by the user
+    since their last reaction was added."""
+    if user is None:
+        user = get_current_user()
+
+    return get_unread_pks(ArticleRead, articles, user,
+                          'article', 'reaction', 'last_reaction')
+
+
 def mark_read(article):
     """Mark a article as read for the user."""
     if article.last_reaction is not None:
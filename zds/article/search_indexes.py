@@ -1,5 +1,6 @@
 # coding: utf-8
 
+from django.utils.html import strip_tags
 from haystack import indexes
 
 from zds.article.models import Article
@@ -20,7 +21,10 @@ class ArticleIndex(indexes.SearchIndex, indexes.Indexable):
     def prepare_tags(self, obj):
         return [tag.name for tag in obj.tags.all()]
 
+    def prepare_txt(self, obj):
+        """Text of the published version, without HTML."""
+        return strip_tags(obj.get_text_online() or u'')
+
     def index_queryset(self, using=None):
-        """Used when the entire index for model is updated."""
-        return self.get_model().objects\
-            .filter(is_visible=True)
+        """Only articles online."""
+        return self.get_model().objects.filter(sha_public__isnull=False)
@@ -1,11 +1,14 @@
 # coding: utf-8
+from StringIO import StringIO
 import os
 import shutil
+import tarfile
+import tempfile
 
 from django.conf import settings
-from django.core import mail
 from django.core.urlresolvers import reverse
 from django.test import TestCase
+from django.test.client import RequestFactory
 from django.test.utils import override_settings
 
 from zds.article.factories import ArticleFactory, ReactionFactory
@@ -13,7 +16,8 @@ from zds.article.models import Validation, Reaction, Article
 from zds.member.factories import ProfileFactory, StaffProfileFactory
 from zds.mp.models import PrivateTopic
 from zds.settings import SITE_ROOT
-from zds.utils.models import Alert
+from zds.utils.downloads import serve_file
+from zds.utils.models import Alert, QueuedMail
 
 
 @override_settings(MEDIA_ROOT=os.path.join(SITE_ROOT, 'media-test'))
@@ -82,8 +86,8 @@ class ArticleTests(TestCase):
             },
             follow=False)
         self.assertEqual(pub.status_code, 302)
-        self.assertEquals(len(mail.outbox), 1)
-        mail.outbox = []
+        self.assertEquals(QueuedMail.objects.count(), 1)
+        QueuedMail.objects.all().delete()
 
     def test_delete_image_on_change(self):
         """test que l'image est bien supprimée quand on la change"""
@@ -178,7 +182,7 @@ class ArticleTests(TestCase):
             PrivateTopic.objects.filter(
                 author=self.user).count(),
             1)
-        self.assertEquals(len(mail.outbox), 0)
+        self.assertEquals(QueuedMail.objects.count(), 0)
 
     def test_add_reaction(self):
         """To test add reaction for article."""
@@ -359,8 +363,79 @@ class ArticleTests(TestCase):
             follow=True)
         self.assertEqual(result.status_code, 200)
 
+    def test_download(self):
+        """The archive of the article is streamed out of git."""
+        url = reverse('zds.article.views.download') \
+            + '?article={0}'.format(self.article.pk)
+        result = self.client.get(url)
+        self.assertEqual(result.status_code, 200)
+        self.assertTrue(result.streaming)
+        archive = tarfile.open(
+            fileobj=StringIO(''.join(result.streaming_content)))
+        self.assertIn('manifest.json', archive.getnames())
+        self.assertFalse(os.path.exists(
+            os.path.join(settings.REPO_ARTICLE_PATH,
+                         self.article.slug + '.tar')))
+
+        result = self.client.get(url, HTTP_IF_NONE_MATCH=result['ETag'])
+        self.assertEqual(result.status_code, 304)
+
     def tearDown(self):
         if os.path.isdir(settings.REPO_ARTICLE_PATH):
             shutil.rmtree(settings.REPO_ARTICLE_PATH)
         if os.path.isdir(settings.MEDIA_ROOT):
             shutil.rmtree(settings.MEDIA_ROOT)
+
+
+class DownloadTests(TestCase):
+
+    def setUp(self):
+        fd, self.path = tempfile.mkstemp()
+        os.write(fd, '0123456789' * 10)
+        os.close(fd)
+        self.factory = RequestFactory()
+
+    def get(self, **headers):
+        return serve_file(self.factory.get('/', **headers), self.path,
+                          'application/pdf', 'fichier.pdf')
+
+    def test_serve_file(self):
+        """Files are streamed, by ranges if asked."""
+        response = self.get()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(''.join(response.streaming_content),
+                         '0123456789' * 10)
+        self.assertEqual(response['Content-Length'], '100')
+        self.assertEqual(response['Content-Disposition'],
+                         'attachment; filename=fichier.pdf')
+        etag = response['ETag']
+
+        self.assertEqual(self.get(HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        response = self.get(HTTP_RANGE='bytes=10-14')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(''.join(response.streaming_content), '01234')
+        self.assertEqual(response['Content-Range'], 'bytes 10-14/100')
+
+        response = self.get(HTTP_RANGE='bytes=-3')
+        self.assertEqual(''.join(response.streaming_content), '789')
+        response = self.get(HTTP_RANGE='bytes=95-')
+        self.assertEqual(''.join(response.streaming_content), '56789')
+        # the range is of another version of the file
+        response = self.get(HTTP_RANGE='bytes=95-', HTTP_IF_RANGE='"1-2"')
+        self.assertEqual(response.status_code, 200)
+
+        self.assertEqual(self.get(HTTP_RANGE='bytes=100-').status_code, 416)
+
+    def test_sendfile(self):
+        """The web server can send the files itself."""
+        with self.settings(DOWNLOAD_SENDFILE='X-Sendfile'):
+            self.assertEqual(self.get()['X-Sendfile'], self.path)
+        directory, name = os.path.split(self.path)
+        with self.settings(DOWNLOAD_SENDFILE='X-Accel-Redirect',
+                           DOWNLOAD_ACCEL_REDIRECT={directory: '/prive/'}):
+            self.assertEqual(self.get()['X-Accel-Redirect'],
+                             '/prive/' + name)
+
+    def tearDown(self):
+        os.remove(self.path)
@@ -11,7 +11,7 @@ from django.contrib import messages
 from django.contrib.auth.decorators import login_required, permission_required
 from django.contrib.auth.models import User
 from django.core.exceptions import PermissionDenied
-from django.core.paginator import Paginator, PageNotAnInteger, EmptyPage
+from django.core.paginator import EmptyPage
 from django.core.urlresolvers import reverse
 from django.db import transaction
 from django.db.models import Q
@@ -25,12 +25,16 @@ from zds.member.decorator import can_write_and_read_now
 from zds.member.views import get_client_ip
 from zds.utils import render_template
 from zds.utils import slugify
+from zds.utils.downloads import serve_archive
 from zds.utils.articles import *
+from zds.utils.messages import prepare_messages
 from zds.utils.mps import send_mp
+from zds.utils.misc import invalidate_home_cache
 from zds.utils.models import SubCategory, Category, CommentLike, \
     CommentDislike, Alert
-from zds.utils.paginator import paginator_range
+from zds.utils.paginator import paginator_range, seek_page
 from zds.utils.templatetags.emarkdown import emarkdown
+from zds.utils.tutorials import get_blob
 
 from .forms import ArticleForm, ReactionForm
 from .models import Article, get_prev_article, get_next_article, Validation, \
@@ -158,41 +162,28 @@ def view_online(request, article_pk, article_slug):
             mark_read(article)
 
     # Find all reactions of the article.
-    reactions = Reaction.objects\
-        .filter(article__pk=article.pk)\
-        .order_by('position')\
-        .all()
+    reactions = Reaction.objects.filter(article__pk=article.pk)\
+        .select_related('author__profile', 'editor')
 
     # Retrieve pk of the last reaction. If there aren't reactions
     # for the article, we initialize this last reaction at 0.
     last_reaction_pk = 0
+    last_position = 0
     if article.last_reaction:
         last_reaction_pk = article.last_reaction.pk
-
-    # Handle pagination.
-    paginator = Paginator(reactions, settings.POSTS_PER_PAGE)
+        last_position = article.last_reaction.position
 
     try:
         page_nbr = int(request.GET['page'])
     except KeyError:
         page_nbr = 1
 
+    # Handle pagination, with the last reaction of the previous page.
     try:
-        reactions = paginator.page(page_nbr)
-    except PageNotAnInteger:
-        reactions = paginator.page(1)
+        res, num_pages = seek_page(reactions, page_nbr, last_position)
     except EmptyPage:
         raise Http404
-
-    res = []
-    if page_nbr != 1:
-        # Show the last reaction of the previous page
-        last_page = paginator.page(page_nbr - 1).object_list
-        last_reaction = (last_page)[len(last_page) - 1]
-        res.append(last_reaction)
-
-    for reaction in reactions:
-        res.append(reaction)
+    res = prepare_messages(res, request.user)
 
     # Build form to send a reaction for the current article.
     form = ReactionForm(article, request.user)
@@ -204,7 +195,7 @@ def view_online(request, article_pk, article_slug):
         'prev': get_prev_article(article),
         'next': get_next_article(article),
         'reactions': res,
-        'pages': paginator_range(page_nbr, paginator.num_pages),
+        'pages': paginator_range(page_nbr, num_pages),
         'nb': page_nbr,
         'last_reaction_pk': last_reaction_pk,
         'form': form
@@ -401,20 +392,7 @@ def download(request):
     article = get_object_or_404(Article, pk=request.GET['article'])
 
     ph = os.path.join(settings.REPO_ARTICLE_PATH, article.slug)
-    repo = Repo(ph)
-    repo.archive(open(ph + ".tar", 'w'))
-
-    response = HttpResponse(
-        open(
-            ph +
-            ".tar",
-            'rb').read(),
-        mimetype='application/tar')
-    response[
-        'Content-Disposition'] = 'attachment; filename={0}.tar' \
-        .format(article.slug)
-
-    return response
+    return serve_archive(request, ph, '{0}.tar'.format(article.slug))
 
 # Validation
 
@@ -508,6 +486,7 @@ def modify(request):
             article.sha_validation = validation.version
             article.pubdate = None
             article.save()
+            invalidate_home_cache('articles')
 
             return redirect(
                 article.get_absolute_url() +
@@ -537,6 +516,7 @@ def modify(request):
                 article.sha_public = validation.version
                 article.sha_validation = None
                 article.save()
+                invalidate_home_cache('articles')
 
                 # send feedback
                 for author in article.authors.all():
@@ -801,10 +781,11 @@ def history(request, article_pk, article_slug):
 def MEP(article, sha):
     # convert markdown file to html file
     repo = Repo(article.get_path())
-    manifest = get_blob(repo.commit(sha).tree, 'manifest.json')
+    tree = repo.commit(sha).tree
+    manifest = get_blob(tree, 'manifest.json')
 
     article_version = json.loads(manifest)
-    md_file_contenu = get_blob(repo.commit(sha).tree, article_version['text'])
+    md_file_contenu = get_blob(tree, article_version['text'])
 
     html_file = open(
         os.path.join(
@@ -883,6 +864,7 @@ def answer(request):
 
                 article.last_reaction = reaction
                 article.save()
+                invalidate_home_cache('articles')
 
                 return redirect(reaction.get_absolute_url())
             else:
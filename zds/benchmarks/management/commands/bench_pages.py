@@ -0,0 +1,114 @@
+# coding: utf-8
+
+import json
+from optparse import make_option
+import os
+import shutil
+import tempfile
+import time
+
+from django.core.management.base import CommandError, NoArgsCommand
+from django.test.client import Client
+from django.test.utils import override_settings
+
+from zds.benchmarks.replay import find_regressions, get_pages, measure
+from zds.benchmarks.seed import seed
+from zds.benchmarks.utils import rolled_back
+
+
+DATASET_OPTIONS = (
+    ('users', 50, u'Number of members'),
+    ('forums', 5, u'Number of forums'),
+    ('topics', 20, u'Number of topics'),
+    ('posts', 20, u'Number of posts of each topic'),
+    ('big_topic_posts', 2000, u'Number of posts of the replayed topic'),
+    ('tutorials', 3, u'Number of published big tutorials'),
+    ('parts', 3, u'Number of parts of each tutorial'),
+    ('articles', 5, u'Number of published articles'),
+    ('private_topics', 20, u'Number of private topics of the member'),
+)
+
+
+class Command(NoArgsCommand):
+    help = u'Create a dataset with the factories, then measure the number ' \
+        u'of queries, the duration and the memory of the main pages. ' \
+        u'Nothing is kept.'
+
+    option_list = NoArgsCommand.option_list + tuple(
+        make_option('--' + name.replace('_', '-'), type='int', dest=name,
+                    default=default, help=text)
+        for (name, default, text) in DATASET_OPTIONS
+    ) + (
+        make_option('--repeat', type='int', dest='repeat', default=5,
+                    help=u'Number of times each page is asked'),
+        make_option('--output', dest='output', default=None,
+                    help=u'JSON file where the results are written'),
+        make_option('--compare', dest='compare', default=None,
+                    help=u'JSON file of reference results: fail if a page '
+                    u'runs more queries'),
+    )
+
+    def handle_noargs(self, **options):
+        dataset = dict((name, options[name])
+                       for (name, default, text) in DATASET_OPTIONS)
+        tmp = tempfile.mkdtemp()
+        try:
+            # the pages are served as in production (without the debug
+            # toolbar), and the passwords of the members are hashed quickly
+            with override_settings(
+                    DEBUG=False,
+                    ALLOWED_HOSTS=['testserver'],
+                    REPO_PATH=os.path.join(tmp, 'tutoriels-private'),
+                    REPO_PATH_PROD=os.path.join(tmp, 'tutoriels-public'),
+                    REPO_ARTICLE_PATH=os.path.join(tmp, 'articles-data'),
+                    MEDIA_ROOT=os.path.join(tmp, 'media'),
+                    PASSWORD_HASHERS=(
+                        'django.contrib.auth.hashers.MD5PasswordHasher',)):
+                results = self.bench(dataset, options['repeat'])
+        finally:
+            shutil.rmtree(tmp)
+
+        for name, page in sorted(results['pages'].items()):
+            self.stdout.write(u'{0} : {1} requêtes, {2:.2f} ms, +{3} Ko '
+                              u'(statut {4})'.format(name, page['queries'],
+                                                     page['time'],
+                                                     page['memory'],
+                                                     page['status']))
+        if options['output']:
+            with open(options['output'], 'w') as fh:
+                json.dump(results, fh, indent=4, sort_keys=True,
+                          separators=(',', ': '))
+
+        errors = [name for (name, page) in results['pages'].items()
+                  if page['status'] != 200]
+        if errors:
+            raise CommandError(u'Pages en erreur : {0}'.format(
+                u', '.join(sorted(errors))))
+        if options['compare']:
+            with open(options['compare'], 'r') as fh:
+                reference = json.load(fh)
+            if reference['dataset'] != results['dataset']:
+                raise CommandError(u'La référence a été mesurée sur un autre '
+                                   u'jeu de données')
+            regressions = find_regressions(results, reference)
+            if regressions:
+                raise CommandError(u'Plus de requêtes que la référence : '
+                                   u'{0}'.format(u', '.join(
+                                       u'{0} ({1} au lieu de {2})'.format(
+                                           name, queries, expected)
+                                       for (name, expected, queries)
+                                       in regressions)))
+
+    def bench(self, dataset, repeat):
+        results = {'dataset': dataset, 'pages': {}}
+        with rolled_back():
+            start = time.time()
+            objects = seed(**dataset)
+            results['seeding'] = round(time.time() - start, 2)
+            for name, url, member in get_pages(objects):
+                client = Client()
+                if member is not None:
+                    client.login(username=member.username,
+                                 password='hostel77')
+                results['pages'][name] = measure(client, url, repeat)
+        return results
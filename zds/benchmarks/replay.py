@@ -0,0 +1,67 @@
+# coding: utf-8
+
+from math import ceil
+import resource
+
+from django.conf import settings
+from django.core.urlresolvers import reverse
+
+from zds.benchmarks.utils import QueryTimer
+
+
+def get_pages(dataset):
+    """Name, URL and member browsing (None for a guest) of each replayed
+    page of the dataset."""
+    member = dataset['member']
+    topic = dataset['topic']
+    last_page = int(ceil(float(topic.last_message.position)
+                         / settings.POSTS_PER_PAGE))
+    pages = [
+        ('home_guest', reverse('zds.pages.views.home'), None),
+        ('home_member', reverse('zds.pages.views.home'), member),
+        ('forum', topic.forum.get_absolute_url(), member),
+        ('topic', topic.get_absolute_url(), member),
+        ('topic_last_page',
+         '{0}?page={1}'.format(topic.get_absolute_url(), last_page), member),
+        ('member', reverse('zds.member.views.details',
+                           kwargs={'user_name': member.username}), None),
+        ('mp', reverse('zds.mp.views.index'), member),
+    ]
+    if dataset['tutorial'] is not None:
+        pages.append(('tutorial',
+                      dataset['tutorial'].get_absolute_url_online(), None))
+    return pages
+
+
+def get_peak_memory():
+    """Peak memory used by the process, in kilobytes (ru_maxrss is in bytes
+    on Mac OS)."""
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def measure(client, url, repeat):
+    """Gets a page repeat times. Returns its status, the number of queries of
+    the last time (once the caches are filled), the median duration in
+    milliseconds and how much the peak memory of the process grew."""
+    durations = []
+    memory = get_peak_memory()
+    for i in range(repeat):
+        with QueryTimer() as timer:
+            response = client.get(url)
+        durations.append(timer.elapsed * 1000)
+    durations.sort()
+    return {'status': response.status_code,
+            'queries': len(timer),
+            'time': round(durations[len(durations) // 2], 2),
+            'memory': get_peak_memory() - memory}
+
+
+def find_regressions(results, reference):
+    """Pages which run more queries than in the reference results, with the
+    numbers of queries of both."""
+    regressions = []
+    for name, page in sorted(results['pages'].items()):
+        expected = reference['pages'].get(name)
+        if expected is not None and page['queries'] > expected['queries']:
+            regressions.append((name, expected['queries'], page['queries']))
+    return regressions
@@ -0,0 +1,84 @@
+# coding: utf-8
+
+from datetime import datetime
+
+from zds.article.factories import ArticleFactory
+from zds.forum.factories import CategoryFactory, ForumFactory, PostFactory, \
+    TopicFactory
+from zds.member.factories import ProfileFactory
+from zds.mp.factories import PrivatePostFactory, PrivateTopicFactory
+from zds.mp.models import add_members
+from zds.tutorial.factories import BigTutorialFactory, ChapterFactory, \
+    PartFactory
+from zds.tutorial.views import MEP
+
+
+def create_topic(forum, authors, posts):
+    """Topic of the given number of posts, written in turn by the authors."""
+    topic = TopicFactory(forum=forum, author=authors[0])
+    for position in range(1, posts + 1):
+        PostFactory(topic=topic, author=authors[position % len(authors)],
+                    position=position)
+    return topic
+
+
+def create_tutorial(author, parts):
+    """Published big tutorial of the given number of parts, of three chapters
+    each, in its own git repository."""
+    tutorial = BigTutorialFactory()
+    tutorial.authors.add(author)
+    position = 1
+    for i in range(1, parts + 1):
+        part = PartFactory(tutorial=tutorial, position_in_tutorial=i)
+        for j in range(1, 4):
+            ChapterFactory(part=part, position_in_part=j,
+                           position_in_tutorial=position)
+            position += 1
+    MEP(tutorial, tutorial.sha_draft)
+    tutorial.sha_public = tutorial.sha_draft
+    tutorial.pubdate = datetime.now()
+    tutorial.save()
+    return tutorial
+
+
+def create_article(author):
+    article = ArticleFactory()
+    article.authors.add(author)
+    article.sha_public = article.sha_draft
+    article.pubdate = datetime.now()
+    article.save()
+    return article
+
+
+def seed(users=50, forums=5, topics=20, posts=20, big_topic_posts=2000,
+         tutorials=3, parts=3, articles=5, private_topics=20):
+    """Creates a dataset with the factories, and returns the objects whose
+    pages are replayed: the member who browses, a topic of big_topic_posts
+    posts and a tutorial."""
+    members = [ProfileFactory().user for i in range(max(users, 2))]
+    member = members[0]
+
+    category = CategoryFactory(position=1)
+    all_forums = [ForumFactory(category=category, position_in_category=i)
+                  for i in range(1, max(forums, 1) + 1)]
+    for i in range(topics):
+        create_topic(all_forums[i % len(all_forums)], members, posts)
+    big_topic = create_topic(all_forums[0], members, max(big_topic_posts, 1))
+
+    for i in range(private_topics):
+        privatetopic = PrivateTopicFactory(author=member)
+        participant = members[1 + i % (len(members) - 1)]
+        privatetopic.participants.add(participant)
+        add_members(privatetopic, [participant])
+        for position in range(1, 4):
+            PrivatePostFactory(privatetopic=privatetopic,
+                               author=(member, participant)[position % 2],
+                               position_in_topic=position)
+
+    tutorial = None
+    for i in range(tutorials):
+        tutorial = create_tutorial(members[i % len(members)], parts)
+    for i in range(articles):
+        create_article(members[i % len(members)])
+
+    return {'member': member, 'topic': big_topic, 'tutorial': tutorial}
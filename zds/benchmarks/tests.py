@@ -0,0 +1,64 @@
+# coding: utf-8
+
+import json
+import os
+import shutil
+from StringIO import StringIO
+import tempfile
+
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.test import TestCase
+
+from zds.benchmarks.utils import QueryTimer, rolled_back
+from zds.forum.factories import CategoryFactory
+from zds.forum.models import Category, Post
+
+
+class UtilsTests(TestCase):
+
+    def test_rolled_back(self):
+        """Test: the queries of a block are counted, whatever DEBUG is,
+        and what it writes is rolled back."""
+        with rolled_back():
+            with QueryTimer() as timer:
+                CategoryFactory(position=1)
+                self.assertEqual(Category.objects.count(), 1)
+        self.assertEqual(len(timer), 2)
+        self.assertGreaterEqual(timer.elapsed, 0)
+        self.assertEqual(Category.objects.count(), 0)
+
+
+class BenchPagesTests(TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def bench(self, **options):
+        output = os.path.join(self.tmp, 'results.json')
+        call_command('bench_pages', users=3, forums=1, topics=1, posts=2,
+                     big_topic_posts=30, tutorials=1, parts=1, articles=1,
+                     private_topics=1, repeat=1, output=output,
+                     stdout=StringIO(), **options)
+        with open(output, 'r') as fh:
+            return json.load(fh)
+
+    def test_bench_pages(self):
+        """Test: the pages are measured on a dataset which isn't kept, and a
+        page running more queries than the reference fails."""
+        results = self.bench()
+        self.assertEqual(Post.objects.count(), 0)
+        self.assertEqual(results['dataset']['big_topic_posts'], 30)
+        for name in ('home_guest', 'home_member', 'forum', 'topic',
+                     'topic_last_page', 'member', 'mp', 'tutorial'):
+            self.assertEqual(results['pages'][name]['status'], 200)
+            self.assertGreater(results['pages'][name]['queries'], 0)
+
+        reference = os.path.join(self.tmp, 'reference.json')
+        results['pages']['topic']['queries'] -= 1
+        with open(reference, 'w') as fh:
+            json.dump(results, fh)
+        self.assertRaises(CommandError, self.bench, compare=reference)
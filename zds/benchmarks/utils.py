@@ -0,0 +1,41 @@
+# coding: utf-8
+
+from contextlib import contextmanager
+import time
+
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+
+
+class Rollback(Exception):
+    pass
+
+
+@contextmanager
+def rolled_back():
+    """Runs a block in a transaction which is always rolled back, so that
+    nothing a benchmark writes is kept."""
+    try:
+        with transaction.atomic():
+            yield
+            raise Rollback
+    except Rollback:
+        pass
+
+
+class QueryTimer(CaptureQueriesContext):
+    """Records the queries of a block (whatever DEBUG is) and its duration,
+    in seconds, in elapsed."""
+
+    def __init__(self, connection=connection):
+        super(QueryTimer, self).__init__(connection)
+        self.elapsed = None
+
+    def __enter__(self):
+        super(QueryTimer, self).__enter__()
+        self.start = time.time()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.elapsed = time.time() - self.start
+        super(QueryTimer, self).__exit__(exc_type, exc_value, traceback)
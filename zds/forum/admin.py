@@ -2,11 +2,13 @@
 
 from django.contrib import admin
 
-from .models import Category, Forum, Topic, Post, TopicRead, TopicFollowed
+from .models import Category, Forum, ForumStats, Topic, Post, TopicRead, \
+    TopicFollowed
 
 
 admin.site.register(Category)
 admin.site.register(Forum)
+admin.site.register(ForumStats)
 admin.site.register(Topic)
 admin.site.register(Post)
 admin.site.register(TopicRead)
@@ -1,5 +1,6 @@
 # coding: utf-8
 
+from django.db.models import F
 import factory
 from zds.forum.models import Category, Forum, Topic, Post
 
@@ -40,5 +41,8 @@ class PostFactory(factory.DjangoModelFactory):
         topic = kwargs.pop('topic', None)
         if topic:
             topic.last_message = post
-            topic.save()
+            topic.save_but_counters()
+            Topic.objects.filter(pk=topic.pk).update(
+                post_count=F('post_count') + 1,
+                last_position=post.position)
         return post
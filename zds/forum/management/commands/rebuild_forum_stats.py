@@ -0,0 +1,18 @@
+# coding: utf-8
+
+from django.core.management.base import NoArgsCommand
+from django.db import transaction
+
+from zds.forum.models import Forum, update_forum_stats
+
+
+class Command(NoArgsCommand):
+    help = u'Compute again the statistics (topics, posts, last message) of ' \
+        u'all forums.'
+
+    def handle_noargs(self, **options):
+        for forum in Forum.objects.all():
+            with transaction.atomic():
+                stats = update_forum_stats(forum)
+            self.stdout.write(u'{0} : {1} sujets, {2} messages'.format(
+                forum.title, stats.topic_count, stats.post_count))
@@ -1,7 +1,10 @@
 # coding: utf-8
 
 from django.conf import settings
+from django.core.cache import cache
 from django.db import models
+from django.db.models import Count, F, Q
+from django.db.models.signals import post_delete, post_save, m2m_changed
 from zds.utils import slugify
 from math import ceil
 import os
@@ -13,6 +16,8 @@ from django.utils import timezone
 from django.core.urlresolvers import reverse
 
 from zds.utils import get_current_user
+from zds.utils.misc import FORUM_MENU_CACHE_KEY, forget_reader_navbar, \
+    get_fields_but_counters, get_unread_pks, invalidate_navbar
 from zds.utils.models import Comment, Tag
 
 
@@ -55,6 +60,7 @@ class Category(models.Model):
     def get_forums(self):
         return Forum.objects.all()\
             .filter(category=self)\
+            .select_related('stats__last_message__topic')\
             .order_by('position_in_category')
 
 
@@ -90,43 +96,58 @@ class Forum(models.Model):
                        kwargs={'cat_slug': self.category.slug,
                                'forum_slug': self.slug})
 
+    def get_stats(self):
+        """Gets the statistics of the forum, building them if they have never
+        been computed."""
+        try:
+            return self.stats
+        except ForumStats.DoesNotExist:
+            return update_forum_stats(self)
+
     def get_topic_count(self):
         """Gets the number of threads in the forum."""
-        return Topic.objects.all().filter(forum__pk=self.pk).count()
+        return self.get_stats().topic_count
 
     def get_post_count(self):
         """Gets the number of posts for a forum."""
-        return Post.objects.filter(topic__forum=self).count()
+        return self.get_stats().post_count
 
     def get_last_message(self):
         """Gets the last message on the forum, if there are any."""
-        try:
-            return Post.objects.all().filter(
-                topic__forum__pk=self.pk).order_by('-pubdate')[0]
-        except IndexError:
-            return None
+        return self.get_stats().last_message
 
     def can_read(self, user):
         """Checks if the forum can be read by the user."""
-        # TODO These prints is used to debug this method. Remove them later.
-
-        if self.group.count() == 0:
-            return True
-        else:
-            if user.is_authenticated():
-                groups = Group.objects.filter(user=user).all()
-                return Forum.objects.filter(
-                    group__in=groups,
-                    pk=self.pk).count() > 0
-            else:
-                return False
+        return self.pk in get_readable_forums(user)
 
     def is_read(self):
         """Checks if there are topics never read in the forum."""
-        for current_topic in Topic.objects.filter(forum=self).all():
-            if never_read(current_topic):
-                return False
-        return True
+        return self.pk not in get_unread_forums([self])
+
+
+class ForumStats(models.Model):
+
+    """Denormalized counters of a forum.
+
+    They are updated by the views which add or move posts, so that the forum
+    lists don't have to count topics and posts of each forum.
+
+    """
+    class Meta:
+        verbose_name = 'Statistiques du forum'
+        verbose_name_plural = 'Statistiques des forums'
+
+    forum = models.OneToOneField(Forum, verbose_name='Forum',
+                                 related_name='stats')
+    topic_count = models.IntegerField('Nombre de sujets', default=0)
+    post_count = models.IntegerField('Nombre de messages', default=0)
+    last_message = models.ForeignKey('Post', null=True, blank=True,
+                                     related_name='+',
+                                     on_delete=models.SET_NULL,
+                                     verbose_name='Dernier message')
+
+    def __unicode__(self):
+        return u'<Statistiques de "{0}">'.format(self.forum_id)
 
 
 class Topic(models.Model):
@@ -157,10 +178,19 @@ class Topic(models.Model):
         null=True,
         blank=True)
 
+    post_count = models.IntegerField('Nombre de messages', default=0)
+    last_position = models.IntegerField('Position du dernier message',
+                                        default=0)
+
     def __unicode__(self):
         """Textual form of a thread."""
         return self.title
 
+    def save_but_counters(self):
+        """Saves the topic but its counters, which the new posts may have
+        changed since it was read."""
+        self.save(update_fields=get_fields_but_counters(self))
+
     def get_absolute_url(self):
         return reverse(
             'zds.forum.views.topic',
@@ -169,7 +199,7 @@ class Topic(models.Model):
 
     def get_post_count(self):
         """Return the number of posts in the topic."""
-        return Post.objects.filter(topic__pk=self.pk).count()
+        return self.post_count
 
     def get_last_post(self):
         """Gets the last post in the thread."""
@@ -349,6 +379,155 @@ class TopicFollowed(models.Model):
                                                      self.user.username)
 
 
+def find_last_message(forum_pk):
+    return Post.objects\
+        .filter(topic__forum__pk=forum_pk)\
+        .select_related('topic')\
+        .order_by('-pubdate')\
+        .first()
+
+
+def update_forum_stats(forum):
+    """Compute again from scratch the statistics of a forum."""
+    stats, created = ForumStats.objects.get_or_create(forum=forum)
+    stats.topic_count = Topic.objects.filter(forum=forum).count()
+    stats.post_count = Post.objects.filter(topic__forum=forum).count()
+    stats.last_message = find_last_message(forum.pk)
+    stats.save()
+    forum.stats = stats
+    return stats
+
+
+def add_post_to_forum_stats(forum, post, new_topic=False):
+    """Count a new post (and its topic if it's the first one) in the
+    statistics of the forum.
+
+    Counters are incremented in database to stay right when several members
+    are posting at the same time. Stats which have never been computed are
+    left as they are, they will be built on their first display.
+
+    """
+    ForumStats.objects.filter(forum=forum).update(
+        topic_count=F('topic_count') + (1 if new_topic else 0),
+        post_count=F('post_count') + 1,
+        last_message=post)
+
+
+def forum_stats_on_topic_delete(sender, instance, **kwargs):
+    """Compute again the statistics of the forum of a topic deleted (from the
+    admin), once all its posts are deleted as well."""
+    stats = ForumStats.objects\
+        .filter(forum__pk=instance.forum_id)\
+        .select_related('forum')\
+        .first()
+    if stats is not None:
+        update_forum_stats(stats.forum)
+
+
+post_delete.connect(forum_stats_on_topic_delete, sender=Topic)
+
+
+def counters_on_post_delete(sender, instance, **kwargs):
+    """Uncount a post deleted (from the admin) in its topic and its forum.
+    The positions are kept, so the next posts don't take the ones of existing
+    posts.
+
+    When the whole topic is deleted, its posts are deleted first and the
+    statistics of the forum are computed again after the topic.
+
+    """
+    topic = Topic.objects.filter(pk=instance.topic_id)
+    topic.update(post_count=F('post_count') - 1)
+    ForumStats.objects.filter(forum__in=topic.values('forum'))\
+        .update(post_count=F('post_count') - 1)
+
+    # The last message of the forum has been set to null if it was this post
+    for forum_pk in ForumStats.objects\
+            .filter(forum__in=topic.values('forum'), last_message=None)\
+            .values_list('forum', flat=True):
+        ForumStats.objects.filter(forum__pk=forum_pk)\
+            .update(last_message=find_last_message(forum_pk))
+
+
+post_delete.connect(counters_on_post_delete, sender=Post)
+
+
+READABLE_FORUMS_CACHE_KEY = 'forum-readable-forums'
+
+
+def get_readable_forums(user=None):
+    """Returns the set of the pks of the forums the user can read.
+
+    Readable forums only depend on the user's groups: they are cached for each
+    combination of groups, and memoized on the user object so they are
+    computed once per request.
+
+    """
+    if user is None:
+        user = get_current_user()
+
+    readable = getattr(user, '_readable_forums', None)
+    if readable is not None:
+        return readable
+
+    if user is not None and user.is_authenticated():
+        groups = sorted(user.groups.values_list('pk', flat=True))
+    else:
+        groups = []
+    groups_key = u'-'.join(str(pk) for pk in groups)
+
+    by_groups = cache.get(READABLE_FORUMS_CACHE_KEY) or {}
+    readable = by_groups.get(groups_key)
+    if readable is None:
+        readable = set(Forum.objects
+                       .filter(Q(group__isnull=True) | Q(group__in=groups))
+                       .values_list('pk', flat=True))
+        by_groups[groups_key] = readable
+        cache.set(READABLE_FORUMS_CACHE_KEY, by_groups)
+
+    if user is not None:
+        user._readable_forums = readable
+    return readable
+
+
+def invalidate_readable_forums(sender, **kwargs):
+    """Forget the readable forums when forums or their groups change."""
+    cache.delete(READABLE_FORUMS_CACHE_KEY)
+
+
+post_save.connect(invalidate_readable_forums, sender=Forum)
+post_delete.connect(invalidate_readable_forums, sender=Forum)
+post_delete.connect(invalidate_readable_forums, sender=Group)
+m2m_changed.connect(invalidate_readable_forums, sender=Forum.group.through)
+
+
+def topic_followers(topic_pk):
+    return TopicFollowed.objects\
+        .filter(topic__pk=topic_pk)\
+        .values_list('user', flat=True)
+
+
+def forget_followers_navbar(sender, instance, created, raw=False, **kwargs):
+    """Forget the notifications of the followers of a topic with a new
+    post. The views saving it in a transaction forget them again once it is
+    committed, as a follower could cache the former ones in between."""
+    if created and not raw:
+        invalidate_navbar(topic_followers(instance.topic_id))
+
+
+def forget_forum_menu(sender, **kwargs):
+    cache.delete(FORUM_MENU_CACHE_KEY)
+
+
+for model in (TopicRead, TopicFollowed):
+    post_save.connect(forget_reader_navbar, sender=model)
+    post_delete.connect(forget_reader_navbar, sender=model)
+post_save.connect(forget_followers_navbar, sender=Post)
+for model in (Forum, Category):
+    post_save.connect(forget_forum_menu, sender=model)
+    post_delete.connect(forget_forum_menu, sender=model)
+
+
 def never_read(topic, user=None):
     """Check if a topic has been read by an user since it last post was
     added."""
@@ -360,6 +539,42 @@ def never_read(topic, user=None):
         .count() == 0
 
 
+def get_unread_topics(topics, user=None):
+    """Returns the pks of the topics which have been never read by the user
+    since their last post was added."""
+    if user is None:
+        user = get_current_user()
+
+    return get_unread_pks(TopicRead, topics, user,
+                          'topic', 'post', 'last_message')
+
+
+def get_unread_forums(forums, user=None):
+    """Returns the pks of the forums containing at least one topic never read
+    by the user since its last post was added.
+
+    A forum is read when the user is up to date on as many topics as it
+    contains, so a single query counts them for all the forums.
+
+    """
+    if user is None:
+        user = get_current_user()
+
+    forums = list(forums)
+    if len(forums) == 0 or user is None or not user.is_authenticated():
+        return set()
+
+    reads = dict(TopicRead.objects
+                 .filter(user=user,
+                         topic__forum__in=forums,
+                         post=F('topic__last_message'))
+                 .values_list('topic__forum')
+                 .annotate(nb=Count('topic', distinct=True)))
+
+    return set(forum.pk for forum in forums
+               if reads.get(forum.pk, 0) < forum.get_topic_count())
+
+
 def mark_read(topic):
     """Mark a topic as read for the user."""
     u = get_current_user()
@@ -428,14 +643,7 @@ def follow_by_email(topic, user=None):
 
 def get_last_topics(user):
     """Returns the 5 very last topics."""
-    topics = Topic.objects.all().order_by('-last_message__pubdate')
-
-    tops = []
-    cpt = 1
-    for topic in topics:
-        if topic.forum.can_read(user):
-            tops.append(topic)
-            cpt += 1
-        if cpt > 5:
-            break
-    return tops
+    return Topic.objects\
+        .filter(forum__in=get_readable_forums(user))\
+        .select_related('forum', 'author', 'last_message')\
+        .order_by('-last_message__pubdate')[:5]
@@ -1,5 +1,6 @@
 # coding: utf-8
 
+from django.utils.html import strip_tags
 from haystack import indexes
 
 from zds.forum.models import Topic, Post
@@ -15,12 +16,26 @@ class TopicIndex(indexes.SearchIndex, indexes.Indexable):
     def get_model(self):
         return Topic
 
+    def get_updated_field(self):
+        return 'pubdate'
+
 
 class PostIndex(indexes.SearchIndex, indexes.Indexable):
     text = indexes.CharField(document=True, use_template=True)
-    txt = indexes.CharField(model_attr='text')
+    txt = indexes.CharField()
     author = indexes.CharField(model_attr='author')
     pubdate = indexes.DateTimeField(model_attr='pubdate')
 
     def get_model(self):
         return Post
+
+    def get_updated_field(self):
+        return 'pubdate'
+
+    def prepare_txt(self, obj):
+        """Text of the post, without HTML."""
+        return strip_tags(obj.text_html)
+
+    def index_queryset(self, using=None):
+        """Only posts not hidden by the staff."""
+        return self.get_model().objects.filter(is_visible=True)
@@ -1,18 +1,55 @@
 # coding: utf-8
 
+from datetime import datetime, timedelta
+import threading
+import time
+import unittest
+
 from django.conf import settings
-from django.test import TestCase
+from django.contrib.auth.models import AnonymousUser, Group, User
+from django.core.cache import get_cache
+from django.core.mail import EmailMessage, get_connection
+from django.core.mail.backends import locmem
+from django.core.management import call_command
+from django.db import OperationalError, connection, transaction
+from django.test import TestCase, TransactionTestCase
+from django.test.utils import CaptureQueriesContext, override_settings
 
 from django.core.urlresolvers import reverse
+from haystack import connections
 from zds.utils import slugify
 
 from zds.forum.factories import CategoryFactory, ForumFactory, \
     TopicFactory, PostFactory
 from zds.member.factories import ProfileFactory, StaffProfileFactory
-from zds.utils.models import CommentLike, CommentDislike, Alert
+from zds.utils import misc, navbar
+from zds.utils.mailqueue import send_queued_mails
+from zds.utils.misc import allocate_position
+from zds.utils.models import CommentLike, CommentDislike, Alert, QueuedMail, \
+    SearchIndexUpdate
+from zds.utils.paginator import seek_page
+from zds.utils.search import update_search_index
 from django.core import mail
 
-from .models import Post, Topic, TopicFollowed, TopicRead
+from .models import Forum, ForumStats, Post, Topic, TopicFollowed, TopicRead, \
+    get_unread_topics, get_unread_forums, get_readable_forums, \
+    update_forum_stats
+
+
+class CountingEmailBackend(locmem.EmailBackend):
+
+    """Test backend counting its connections, which fails to send the messages
+    whose subject is "Erreur"."""
+    opened = 0
+
+    def open(self):
+        CountingEmailBackend.opened += 1
+        return True
+
+    def send_messages(self, messages):
+        if any(message.subject == u'Erreur' for message in messages):
+            raise IOError(u'Erreur')
+        return super(CountingEmailBackend, self).send_messages(messages)
 
 
 class ForumMemberTests(TestCase):
@@ -113,6 +150,72 @@ class ForumMemberTests(TestCase):
         self.assertContains(response, topic.title)
         self.assertContains(response, topic.subtitle)
 
+    @override_settings(
+        MAIL_QUEUE_BACKEND='django.core.mail.backends.locmem.EmailBackend')
+    def test_answer_mail_queue(self):
+        """To test that notifications of answers are queued."""
+        user1 = ProfileFactory().user
+        topic1 = TopicFactory(forum=self.forum11, author=self.user)
+        PostFactory(topic=topic1, author=self.user, position=1)
+        post2 = PostFactory(topic=topic1, author=user1, position=2)
+        TopicRead(topic=topic1, user=user1, post=post2).save()
+        TopicFollowed(topic=topic1, user=user1, email=True).save()
+
+        result = self.client.post(
+            reverse('zds.forum.views.answer') + '?sujet={0}'.format(topic1.pk),
+            {
+                'last_post': topic1.last_message.pk,
+                'text': u'Une réponse'
+            },
+            follow=False)
+        self.assertEqual(result.status_code, 302)
+
+        # nothing is sent during the request
+        self.assertEquals(len(mail.outbox), 0)
+        self.assertEqual(QueuedMail.objects.count(), 1)
+
+        self.assertEqual(send_queued_mails(), (1, 0))
+        self.assertEquals(len(mail.outbox), 1)
+        self.assertEqual(mail.outbox[0].to, [user1.email])
+        self.assertEqual(QueuedMail.objects.count(), 0)
+
+        # the copies would be sent as visible recipients
+        queue = get_connection('zds.utils.mailqueue.QueuedEmailBackend')
+        message = EmailMessage(u'Sujet', u'Texte', 'zds@localhost',
+                               [user1.email], bcc=['cache@localhost'])
+        self.assertRaises(ValueError, queue.send_messages, [message])
+        self.assertEqual(QueuedMail.objects.count(), 0)
+
+        # or left out with fail_silently, and the other messages are queued
+        queue = get_connection('zds.utils.mailqueue.QueuedEmailBackend',
+                               fail_silently=True)
+        other = EmailMessage(u'Autre', u'Texte', 'zds@localhost',
+                             [user1.email])
+        self.assertEqual(queue.send_messages([message, other]), 1)
+        self.assertEqual(
+            list(QueuedMail.objects.values_list('subject', flat=True)),
+            [u'Autre'])
+
+    @override_settings(
+        MAIL_QUEUE_BACKEND='zds.forum.tests.CountingEmailBackend')
+    def test_send_queued_mails(self):
+        """The queue opens a connection only when there are mails, and opens
+        it again after a failure."""
+        CountingEmailBackend.opened = 0
+        self.assertEqual(send_queued_mails(), (0, 0))
+        self.assertEqual(CountingEmailBackend.opened, 0)
+
+        now = datetime.now()
+        for (i, subject) in enumerate((u'Un', u'Erreur', u'Deux', u'Trois')):
+            QueuedMail(subject=subject, from_email='zds@localhost',
+                       to=self.user.email, body=u'Texte',
+                       next_try=now - timedelta(seconds=10 - i)).save()
+        self.assertEqual(send_queued_mails(), (3, 1))
+        self.assertEqual(CountingEmailBackend.opened, 2)
+        self.assertEqual([message.subject for message in mail.outbox],
+                         [u'Un', u'Deux', u'Trois'])
+        self.assertEqual(QueuedMail.objects.get().attempts, 1)
+
     def test_answer(self):
         """To test all aspects of answer."""
         user1 = ProfileFactory().user
@@ -137,7 +240,7 @@ class ForumMemberTests(TestCase):
             follow=False)
 
         self.assertEqual(result.status_code, 302)
-        self.assertEquals(len(mail.outbox), 2)
+        self.assertEquals(QueuedMail.objects.count(), 2)
 
         # check topic's number
         self.assertEqual(Topic.objects.all().count(), 1)
@@ -579,6 +682,456 @@ class ForumMemberTests(TestCase):
             follow=True)
         self.assertEqual(result.status_code, 200)
 
+    def test_forum_stats(self):
+        """Test that forum statistics follow new topics, answers and moves."""
+        # stats are built on first read
+        self.assertEqual(self.forum11.get_topic_count(), 0)
+        self.assertEqual(self.forum11.get_post_count(), 0)
+        self.assertEqual(self.forum11.get_last_message(), None)
+
+        result = self.client.post(
+            reverse('zds.forum.views.new') + '?forum={0}'
+            .format(self.forum11.pk),
+            {'title': u'Un autre sujet',
+             'subtitle': u'Encore ces lombards en plein ete',
+             'text': u'C\'est tout simplement l\'histoire de la ville de Paris que je voudrais vous conter '
+             },
+            follow=False)
+        self.assertEqual(result.status_code, 302)
+        topic = Topic.objects.get(forum=self.forum11)
+
+        # answer with another member to avoid antispam
+        self.assertEqual(
+            self.client.login(
+                username=self.user2.username,
+                password='hostel77'),
+            True)
+        result = self.client.post(
+            reverse('zds.forum.views.answer') + '?sujet={0}'.format(topic.pk),
+            {
+                'last_post': topic.last_message.pk,
+                'text': u'C\'est tout simplement l\'histoire de la ville de Paris que je voudrais vous conter '
+            },
+            follow=False)
+        self.assertEqual(result.status_code, 302)
+
+        forum = Forum.objects.get(pk=self.forum11.pk)
+        self.assertEqual(forum.get_topic_count(), 1)
+        self.assertEqual(forum.get_post_count(), 2)
+        self.assertEqual(
+            forum.get_last_message(),
+            Topic.objects.get(pk=topic.pk).last_message)
+
+        # moving the topic updates both forums
+        staff1 = StaffProfileFactory().user
+        self.assertEqual(
+            self.client.login(
+                username=staff1.username,
+                password='hostel77'),
+            True)
+        result = self.client.post(
+            reverse('zds.forum.views.move_topic') +
+            '?sujet={0}'.format(
+                topic.pk),
+            {
+                'forum': self.forum12.pk},
+            follow=False)
+        self.assertEqual(result.status_code, 302)
+
+        forum11 = Forum.objects.get(pk=self.forum11.pk)
+        forum12 = Forum.objects.get(pk=self.forum12.pk)
+        self.assertEqual(forum11.get_topic_count(), 0)
+        self.assertEqual(forum11.get_post_count(), 0)
+        self.assertEqual(forum12.get_topic_count(), 1)
+        self.assertEqual(forum12.get_post_count(), 2)
+
+        # deletion from the admin
+        Topic.objects.get(pk=topic.pk).delete()
+        forum12 = Forum.objects.get(pk=self.forum12.pk)
+        self.assertEqual(forum12.get_topic_count(), 0)
+        self.assertEqual(forum12.get_last_message(), None)
+
+        # the posts of a deleted topic don't compute the stats again each
+        topic1 = TopicFactory(forum=self.forum12, author=self.user)
+        topic2 = TopicFactory(forum=self.forum12, author=self.user)
+        for position in range(1, 11):
+            PostFactory(topic=topic1, author=self.user, position=position)
+        for position in range(1, 41):
+            PostFactory(topic=topic2, author=self.user, position=position)
+        with CaptureQueriesContext(connection) as queries1:
+            Topic.objects.get(pk=topic1.pk).delete()
+        with CaptureQueriesContext(connection) as queries2:
+            Topic.objects.get(pk=topic2.pk).delete()
+        for queries in (queries1, queries2):
+            self.assertEqual(len([q for q in queries if
+                                  'COUNT(*) FROM "forum_topic"' in q['sql']]),
+                             1)
+        forum12 = Forum.objects.get(pk=self.forum12.pk)
+        self.assertEqual(forum12.get_topic_count(), 0)
+        self.assertEqual(forum12.get_post_count(), 0)
+
+        # a post alone is uncounted from its topic and its forum
+        topic1 = TopicFactory(forum=self.forum12, author=self.user)
+        for position in range(1, 4):
+            post = PostFactory(topic=topic1, author=self.user,
+                               position=position)
+            if position == 1:
+                first = post
+            elif position == 2:
+                deleted = post
+        update_forum_stats(Forum.objects.get(pk=self.forum12.pk))
+        Post.objects.get(pk=deleted.pk).delete()
+        forum12 = Forum.objects.get(pk=self.forum12.pk)
+        self.assertEqual(forum12.get_topic_count(), 1)
+        self.assertEqual(forum12.get_post_count(), 2)
+        self.assertEqual(forum12.get_last_message(), post)
+        self.assertEqual(Topic.objects.get(pk=topic1.pk).post_count, 2)
+
+        # the newest post of the forum leaves it to the previous one
+        Post.objects.get(pk=post.pk).delete()
+        forum12 = Forum.objects.get(pk=self.forum12.pk)
+        self.assertEqual(forum12.get_post_count(), 1)
+        self.assertEqual(forum12.get_last_message(), first)
+
+        # rebuild from scratch
+        ForumStats.objects.all().delete()
+        topic1 = TopicFactory(forum=self.forum21, author=self.user)
+        PostFactory(topic=topic1, author=self.user, position=1)
+        post = PostFactory(topic=topic1, author=self.user2, position=2)
+        call_command('rebuild_forum_stats')
+        stats = ForumStats.objects.get(forum=self.forum21)
+        self.assertEqual(stats.topic_count, 1)
+        self.assertEqual(stats.post_count, 2)
+        self.assertEqual(stats.last_message, post)
+
+    def test_unread_topics(self):
+        """Test the unread state of several topics and forums at once."""
+        topic1 = TopicFactory(forum=self.forum11, author=self.user2)
+        post1 = PostFactory(topic=topic1, author=self.user2, position=1)
+        topic2 = TopicFactory(forum=self.forum11, author=self.user2)
+        PostFactory(topic=topic2, author=self.user2, position=1)
+        topic3 = TopicFactory(forum=self.forum12, author=self.user2)
+        post3 = PostFactory(topic=topic3, author=self.user2, position=1)
+        topic1 = Topic.objects.get(pk=topic1.pk)
+        topic2 = Topic.objects.get(pk=topic2.pk)
+        topic3 = Topic.objects.get(pk=topic3.pk)
+
+        TopicRead(topic=topic1, user=self.user, post=post1).save()
+        TopicRead(topic=topic3, user=self.user, post=post3).save()
+
+        self.assertEqual(
+            get_unread_topics([topic1, topic2, topic3], self.user),
+            set([topic2.pk]))
+        self.assertEqual(
+            get_unread_forums([self.forum11, self.forum12, self.forum13],
+                              self.user),
+            set([self.forum11.pk]))
+
+        # a new answer makes the topic unread again
+        PostFactory(topic=topic3, author=self.user2, position=2)
+        topic3 = Topic.objects.get(pk=topic3.pk)
+        self.assertEqual(
+            get_unread_topics([topic1, topic2, topic3], self.user),
+            set([topic2.pk, topic3.pk]))
+
+        # and guests have nothing to read
+        self.assertEqual(
+            get_unread_topics([topic1, topic2, topic3], AnonymousUser()),
+            set())
+
+    def test_readable_forums(self):
+        """Test the forums readable by members, guests and groups."""
+        all_forums = set([self.forum11.pk, self.forum12.pk, self.forum13.pk,
+                          self.forum21.pk, self.forum22.pk])
+        self.assertEqual(get_readable_forums(self.user), all_forums)
+
+        # restricting a forum to a group hides it from everybody else
+        group = Group.objects.create(name='staff-forums')
+        self.forum13.group.add(group)
+        user = User.objects.get(pk=self.user.pk)
+        self.assertEqual(get_readable_forums(user),
+                         all_forums - set([self.forum13.pk]))
+        self.assertEqual(get_readable_forums(AnonymousUser()),
+                         all_forums - set([self.forum13.pk]))
+        self.assertFalse(self.forum13.can_read(user))
+
+        # members of the group can read it
+        user.groups.add(group)
+        user = User.objects.get(pk=self.user.pk)
+        self.assertEqual(get_readable_forums(user), all_forums)
+        self.assertTrue(self.forum13.can_read(user))
+
+        # and the result is memoized on the user for the request
+        with self.assertNumQueries(0):
+            self.assertTrue(self.forum13.can_read(user))
+
+    def test_navbar(self):
+        """Test the notifications of the followed topics in the navbar."""
+        topic1 = TopicFactory(forum=self.forum11, author=self.user2)
+        post1 = PostFactory(topic=topic1, author=self.user2, position=1)
+        topic2 = TopicFactory(forum=self.forum11, author=self.user2)
+        post2 = PostFactory(topic=topic2, author=self.user2, position=1)
+        topic3 = TopicFactory(forum=self.forum12, author=self.user2)
+        post3 = PostFactory(topic=topic3, author=self.user2, position=1)
+        for topic in (topic1, topic2, topic3):
+            TopicFollowed(topic=topic, user=self.user).save()
+        TopicRead(topic=topic1, user=self.user, post=post1).save()
+        TopicRead(topic=topic3, user=self.user, post=post3).save()
+        # a deleted post leaves a gap in the positions
+        deleted = PostFactory(topic=topic1, author=self.user2, position=2)
+        answer = PostFactory(topic=topic1, author=self.user2, position=3)
+        Post.objects.get(pk=deleted.pk).delete()
+
+        # the number of queries doesn't depend on the number of topics
+        with self.assertNumQueries(5):
+            posts = navbar.get_unread_posts(self.user)
+        self.assertEqual([post['title'] for post in posts],
+                         [topic1.title, topic2.title])
+        self.assertEqual(posts[0]['url'], post1.get_absolute_url())
+        self.assertEqual(posts[0]['pubdate'], answer.pubdate)
+        self.assertEqual(posts[1]['url'], post2.get_absolute_url())
+        self.assertEqual(posts[1]['author'], self.user2.username)
+
+        # the notifications are cached until a followed topic gets a post
+        default_cache = navbar.cache
+        navbar.cache = misc.cache = get_cache(
+            'django.core.cache.backends.locmem.LocMemCache')
+        try:
+            user = User.objects.get(pk=self.user.pk)
+            self.assertEqual(len(navbar.get_member_navbar(user)['posts']), 2)
+            user = User.objects.get(pk=self.user.pk)
+            with self.assertNumQueries(0):
+                self.assertEqual(
+                    len(navbar.get_member_navbar(user)['posts']), 2)
+            PostFactory(topic=topic3, author=self.user2, position=2)
+            user = User.objects.get(pk=self.user.pk)
+            self.assertEqual(len(navbar.get_member_navbar(user)['posts']), 3)
+        finally:
+            navbar.cache = misc.cache = default_cache
+
+    def test_topic_save(self):
+        """A topic saves its counters, but with save_but_counters, which keeps
+        the ones changed meanwhile by new posts."""
+        topic = TopicFactory(forum=self.forum11, author=self.user)
+        PostFactory(topic=topic, author=self.user, position=1)
+        stale = Topic.objects.get(pk=topic.pk)
+        PostFactory(topic=Topic.objects.get(pk=topic.pk), author=self.user2,
+                    position=2)
+        stale.title = u'Un autre titre'
+        stale.save_but_counters()
+        topic = Topic.objects.get(pk=topic.pk)
+        self.assertEqual((topic.title, topic.post_count, topic.last_position),
+                         (u'Un autre titre', 2, 2))
+
+        topic.post_count = 1
+        topic.save()
+        self.assertEqual(Topic.objects.get(pk=topic.pk).post_count, 1)
+
+    @override_settings(POSTS_PER_PAGE=3)
+    def test_topic_pages(self):
+        """Pages of a topic are found from the positions of the posts."""
+        topic = TopicFactory(forum=self.forum11, author=self.user)
+        for position in range(1, 9):
+            PostFactory(topic=topic, author=self.user, position=position)
+        topic = Topic.objects.get(pk=topic.pk)
+        url = reverse('zds.forum.views.topic',
+                      args=[topic.pk, slugify(topic.title)])
+
+        result = self.client.get(url)
+        self.assertEqual(result.status_code, 200)
+        self.assertEqual([post.position for post in result.context['posts']],
+                         [1, 2, 3])
+        self.assertEqual(result.context['pages'], [1, 2, 3])
+
+        # the last post of the previous page comes first
+        result = self.client.get(url + '?page=3')
+        self.assertEqual(result.status_code, 200)
+        self.assertEqual([post.position for post in result.context['posts']],
+                         [6, 7, 8])
+
+        with self.assertNumQueries(1):
+            posts, num_pages = seek_page(Post.objects.filter(topic=topic), 2,
+                                         topic.last_position)
+        self.assertEqual([post.position for post in posts], [3, 4, 5, 6])
+        self.assertEqual(num_pages, 3)
+
+        self.assertEqual(self.client.get(url + '?page=4').status_code, 404)
+        self.assertEqual(self.client.get(url + '?page=0').status_code, 404)
+
+    def test_topic_queries(self):
+        """The number of queries of a page doesn't depend on its messages."""
+        topic = TopicFactory(forum=self.forum11, author=self.user)
+        url = reverse('zds.forum.views.topic',
+                      args=[topic.pk, slugify(topic.title)])
+
+        def count_queries():
+            # the first visit marks the topic as read
+            self.client.get(url)
+            with CaptureQueriesContext(connection) as queries:
+                result = self.client.get(url)
+            self.assertEqual(result.status_code, 200)
+            return len(queries)
+
+        post = PostFactory(topic=topic, author=self.user, position=1)
+        CommentLike.objects.create(comments=post, user=self.user2)
+        Alert.objects.create(author=self.user2, comment=post,
+                             scope=Alert.FORUM, text=u'Hors sujet',
+                             pubdate=datetime.now())
+        queries = count_queries()
+
+        staff = StaffProfileFactory().user
+        # like has_perm, an inactive member has no permission
+        inactive = StaffProfileFactory().user
+        inactive.is_active = False
+        inactive.save()
+        for position, author in enumerate((self.user2, staff, self.user2,
+                                           inactive), 2):
+            post = PostFactory(topic=topic, author=author, position=position)
+            CommentLike.objects.create(comments=post, user=self.user)
+            CommentDislike.objects.create(comments=post, user=self.user2)
+            Alert.objects.create(author=self.user, comment=post,
+                                 scope=Alert.FORUM, text=u'Flood',
+                                 pubdate=datetime.now())
+        self.assertEqual(count_queries(), queries)
+
+        result = self.client.get(url)
+        self.assertEqual(
+            [(message.position, message.user_liked,
+              message.author.has_staff_perm)
+             for message in result.context['posts']],
+            [(1, False, False), (2, True, False), (3, True, True),
+             (4, True, False), (5, True, False)])
+
+    def test_search_index_queue(self):
+        """Saved posts are queued, then sent in bulk to the search engine."""
+        SearchIndexUpdate.objects.all().delete()
+        topic = TopicFactory(forum=self.forum11, author=self.user)
+        post = PostFactory(topic=topic, author=self.user, position=1)
+        hidden = PostFactory(topic=topic, author=self.user, position=2)
+        hidden.is_visible = False
+        hidden.save()
+        # once per save, the same object is sent once per batch
+        self.assertEqual(
+            set(SearchIndexUpdate.objects.values_list('content_type__model',
+                                                      'object_id')),
+            set([(u'topic', topic.pk), (u'post', post.pk),
+                 (u'post', hidden.pk)]))
+
+        class Backend(object):
+            updated = []
+            removed = []
+
+            def update(self, index, objects):
+                self.updated.extend(objects)
+
+            def remove(self, identifier):
+                self.removed.append(identifier)
+
+        backend = Backend()
+        connection = connections['default']
+        connection.get_backend = lambda: backend
+        try:
+            self.assertEqual(update_search_index(), (2, 1))
+        finally:
+            del connection.get_backend
+        self.assertEqual(set(backend.updated), set([topic, post]))
+        self.assertEqual(backend.removed,
+                         [u'forum.post.{0}'.format(hidden.pk)])
+        self.assertEqual(SearchIndexUpdate.objects.count(), 0)
+
+
+# Each thread of the test has its own connection, which doesn't see an in
+# memory SQLite database.
+IN_MEMORY_DATABASE = connection.vendor == 'sqlite' and \
+    connection.settings_dict['TEST_NAME'] in (None, '', ':memory:')
+
+
+def save_answer(g_topic, user):
+    """Saves an answer as the answer view does."""
+    with transaction.atomic():
+        post = Post(topic=g_topic, author=user, text=u'Réponse',
+                    text_html=u'<p>Réponse</p>', ip_address='127.0.0.1',
+                    pubdate=datetime.now())
+        post.position = allocate_position(g_topic)
+        post.save()
+        g_topic.last_message = post
+        g_topic.save_but_counters()
+    return post
+
+
+class ForumConcurrencyTests(TransactionTestCase):
+
+    def setUp(self):
+        self.user = ProfileFactory().user
+        forum = ForumFactory(category=CategoryFactory(position=1),
+                             position_in_category=1)
+        self.topic = TopicFactory(forum=forum, author=self.user)
+        PostFactory(topic=self.topic, author=self.user, position=1)
+
+    def assertPositions(self, count):
+        self.assertEqual(
+            sorted(Post.objects.filter(topic=self.topic)
+                   .values_list('position', flat=True)),
+            range(1, count + 1))
+        topic = Topic.objects.get(pk=self.topic.pk)
+        self.assertEqual(topic.post_count, count)
+        self.assertEqual(topic.last_position, count)
+
+    def test_interleaved_answers(self):
+        """Answers of requests which loaded the topic at the same time get
+        different positions, without gaps."""
+        first, second, third = [Topic.objects.get(pk=self.topic.pk)
+                                for i in range(3)]
+
+        # the second request allocates its position before the first one
+        # saves its post and the topic
+        with transaction.atomic():
+            post1 = Post(topic=first, author=self.user, text=u'Réponse',
+                         text_html=u'<p>Réponse</p>',
+                         ip_address='127.0.0.1', pubdate=datetime.now())
+            post1.position = allocate_position(first)
+            post2 = save_answer(second, self.user)
+            post1.save()
+            first.last_message = post1
+            first.save_but_counters()
+        post3 = save_answer(third, self.user)
+
+        self.assertEqual([post1.position, post2.position, post3.position],
+                         [2, 3, 4])
+        self.assertPositions(4)
+
+    @unittest.skipIf(IN_MEMORY_DATABASE, 'needs a database shared by threads')
+    def test_parallel_answers(self):
+        """Answers posted at the same time get different positions."""
+        errors = []
+
+        def answer():
+            try:
+                for attempt in range(10):
+                    try:
+                        save_answer(Topic.objects.get(pk=self.topic.pk),
+                                    self.user)
+                        break
+                    except OperationalError as e:
+                        # SQLite refuses a write while another transaction
+                        # writes, instead of waiting for its lock
+                        if 'locked' not in unicode(e) or attempt == 9:
+                            raise
+                        time.sleep(0.05 * (attempt + 1))
+            except Exception as e:
+                errors.append(e)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=answer) for i in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(errors, [])
+        self.assertPositions(9)
+
 
 class ForumGuestTests(TestCase):
 
@@ -9,7 +9,7 @@ from django.contrib import messages
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth.models import User
 from django.core.exceptions import PermissionDenied
-from django.core.mail import EmailMultiAlternatives
+from django.core.mail import EmailMultiAlternatives, get_connection
 from django.core.paginator import Paginator, PageNotAnInteger, EmptyPage
 from django.core.urlresolvers import reverse
 from django.db import transaction
@@ -23,14 +23,18 @@ from haystack.query import SearchQuerySet
 
 from forms import TopicForm, PostForm, MoveTopicForm
 from models import Category, Forum, Topic, Post, follow, follow_by_email, never_read, \
-    mark_read, TopicFollowed, sub_tag
+    mark_read, TopicFollowed, sub_tag, add_post_to_forum_stats, update_forum_stats, \
+    get_unread_topics, get_unread_forums, get_readable_forums, topic_followers
 from zds.forum.models import TopicRead
 from zds.member.decorator import can_write_and_read_now
 from zds.member.views import get_client_ip
 from zds.utils import render_template, slugify
+from zds.utils.messages import prepare_messages
+from zds.utils.misc import allocate_position, invalidate_home_cache, \
+    invalidate_navbar
 from zds.utils.models import Alert, CommentLike, CommentDislike, Tag
 from zds.utils.mps import send_mp
-from zds.utils.paginator import paginator_range
+from zds.utils.paginator import paginator_range, seek_page
 from zds.utils.templatetags.emarkdown import emarkdown
 
 
@@ -38,7 +42,11 @@ def index(request):
     """Display the category list with all their forums."""
 
     categories = Category.objects.order_by("position").all()
+    unread_forums = get_unread_forums(
+        Forum.objects.filter(category__in=categories)
+        .select_related("stats"), request.user)
     return render_template("forum/index.html", {"categories": categories,
+                                                "unread_forums": unread_forums,
                                                 "user": request.user})
 
 
@@ -88,10 +96,14 @@ def details(request, cat_slug, forum_slug):
         shown_topics = paginator.page(paginator.num_pages)
         page = paginator.num_pages
 
+    unread_topics = get_unread_topics(
+        list(sticky_topics) + list(shown_topics.object_list), request.user)
+
     return render_template("forum/category/forum.html", {
         "forum": forum,
         "sticky_topics": sticky_topics,
         "topics": shown_topics,
+        "unread_topics": unread_topics,
         "pages": paginator_range(page, paginator.num_pages),
         "nb": page,
         "filter": filter,
@@ -105,8 +117,10 @@ def cat_details(request, cat_slug):
     category = get_object_or_404(Category, slug=cat_slug)
     forums = \
         Forum.objects.filter(category__pk=category.pk).prefetch_related().all()
+    unread_forums = get_unread_forums(category.get_forums(), request.user)
     return render_template("forum/category/index.html", {"category": category,
-                                                         "forums": forums})
+                                                         "forums": forums,
+                                                         "unread_forums": unread_forums})
 
 
 
@@ -131,18 +145,13 @@ def topic(request, topic_pk, topic_slug):
         if never_read(topic):
             mark_read(topic)
 
-    # Retrieves all posts of the topic and use paginator with them.
+    # Retrieves the posts of the page, with the last post of the previous
+    # page, from their positions.
 
     posts = \
         Post.objects.filter(topic__pk=topic.pk) \
-        .select_related() \
-        .order_by("position"
-                  ).all()
-    last_post_pk = topic.last_message.pk
-
-    # Handle pagination
-
-    paginator = Paginator(posts, settings.POSTS_PER_PAGE)
+        .select_related("author__profile", "editor")
+    last_post_pk = topic.last_message_id
 
     # The category list is needed to move threads
 
@@ -152,21 +161,10 @@ def topic(request, topic_pk, topic_slug):
     except KeyError:
         page_nbr = 1
     try:
-        posts = paginator.page(page_nbr)
-    except PageNotAnInteger:
-        posts = paginator.page(1)
+        res, num_pages = seek_page(posts, page_nbr, topic.last_position)
     except EmptyPage:
         raise Http404
-    res = []
-    if page_nbr != 1:
-
-        # Show the last post of the previous page
-
-        last_page = paginator.page(page_nbr - 1).object_list
-        last_post = last_page[len(last_page) - 1]
-        res.append(last_post)
-    for post in posts:
-        res.append(post)
+    res = prepare_messages(res, request.user)
 
     # Build form to send a post for the current topic.
 
@@ -179,9 +177,10 @@ def topic(request, topic_pk, topic_slug):
         "topic": topic,
         "posts": res,
         "categories": categories,
-        "pages": paginator_range(page_nbr, paginator.num_pages),
+        "pages": paginator_range(page_nbr, num_pages),
         "nb": page_nbr,
         "last_post_pk": last_post_pk,
+        "antispam": topic.antispam(request.user),
         "form": form,
         "form_move": form_move,
     })
@@ -196,7 +195,6 @@ def get_tag_by_title(title):
 
 @can_write_and_read_now
 @login_required
-@transaction.atomic
 def new(request):
     """Creates a new topic in a forum."""
 
@@ -229,41 +227,44 @@ def new(request):
 
             # Creating the thread
 
-            n_topic = Topic()
-            n_topic.forum = forum
-            n_topic.title = title
-            n_topic.subtitle = data["subtitle"]
-            n_topic.pubdate = datetime.now()
-            n_topic.author = request.user
-            n_topic.save()
-
-            # add tags
-
-            for tag in tags:
-                tg = Tag.objects.filter(slug=slugify(tag[2])).first()
-                if tg is None:
-                    tg = Tag(title=tag[2])
-                    tg.save()
-                n_topic.tags.add(tg)
-            n_topic.save()
-
-            # Adding the first message
-
-            post = Post()
-            post.topic = n_topic
-            post.author = request.user
-            post.text = data["text"]
-            post.text_html = emarkdown(request.POST["text"])
-            post.pubdate = datetime.now()
-            post.position = 1
-            post.ip_address = get_client_ip(request)
-            post.save()
-            n_topic.last_message = post
-            n_topic.save()
+            with transaction.atomic():
+                n_topic = Topic()
+                n_topic.forum = forum
+                n_topic.title = title
+                n_topic.subtitle = data["subtitle"]
+                n_topic.pubdate = datetime.now()
+                n_topic.author = request.user
+                n_topic.save()
+
+                # add tags
+
+                for tag in tags:
+                    tg = Tag.objects.filter(slug=slugify(tag[2])).first()
+                    if tg is None:
+                        tg = Tag(title=tag[2])
+                        tg.save()
+                    n_topic.tags.add(tg)
+                n_topic.save_but_counters()
+
+                # Adding the first message
+
+                post = Post()
+                post.topic = n_topic
+                post.author = request.user
+                post.text = data["text"]
+                post.text_html = emarkdown(request.POST["text"])
+                post.pubdate = datetime.now()
+                post.position = allocate_position(n_topic)
+                post.ip_address = get_client_ip(request)
+                post.save()
+                n_topic.last_message = post
+                n_topic.save_but_counters()
+                add_post_to_forum_stats(forum, post, new_topic=True)
 
-            # Follow the topic
+                # Follow the topic
 
-            follow(n_topic)
+                follow(n_topic)
+            invalidate_home_cache('topics')
             return redirect(n_topic.get_absolute_url())
     else:
         form = TopicForm()
@@ -327,8 +328,11 @@ def move_topic(request):
     if not forum.can_read(request.user):
         raise PermissionDenied
     topic = get_object_or_404(Topic, pk=topic_pk)
+    old_forum = topic.forum
     topic.forum = forum
-    topic.save()
+    topic.save_but_counters()
+    update_forum_stats(old_forum)
+    update_forum_stats(forum)
 
     # unfollow user auth
 
@@ -359,6 +363,7 @@ def edit(request):
     data = request.GET
     resp = {}
     g_topic = get_object_or_404(Topic, pk=topic_pk)
+    old_forum_pk = g_topic.forum_id
     if "follow" in data:
         resp["follow"] = follow(g_topic)
     if "email" in data:
@@ -389,7 +394,10 @@ def edit(request):
                 raise Http404
             forum = get_object_or_404(Forum, pk=forum_pk)
             g_topic.forum = forum
-    g_topic.save()
+    g_topic.save_but_counters()
+    if g_topic.forum_id != old_forum_pk:
+        update_forum_stats(Forum.objects.get(pk=old_forum_pk))
+        update_forum_stats(g_topic.forum)
     if request.is_ajax():
         return HttpResponse(json.dumps(resp))
     else:
@@ -402,7 +410,6 @@ def edit(request):
 
 @can_write_and_read_now
 @login_required
-@transaction.atomic
 def answer(request):
     """Adds an answer from a user to a topic."""
 
@@ -430,11 +437,11 @@ def answer(request):
 
     # Retrieve 10 last posts of the current topic.
 
-    posts = \
-        Post.objects.filter(topic=g_topic) \
-        .prefetch_related() \
-        .order_by("-pubdate"
-                  )[:10]
+    posts = prepare_messages(
+        Post.objects.filter(topic=g_topic)
+        .select_related("author__profile", "editor")
+        .order_by("-pubdate")[:10],
+        request.user)
 
     # User would like preview his post or post a new post on the topic.
 
@@ -464,57 +471,64 @@ def answer(request):
             form = PostForm(g_topic, request.user, request.POST)
             if form.is_valid():
                 data = form.data
-                post = Post()
-                post.topic = g_topic
-                post.author = request.user
-                post.text = data["text"]
-                post.text_html = emarkdown(data["text"])
-                post.pubdate = datetime.now()
-                post.position = g_topic.get_post_count() + 1
-                post.ip_address = get_client_ip(request)
-                post.save()
-                g_topic.last_message = post
-                g_topic.save()
-                #Send mail
-                subject = "ZDS - Notification: " + g_topic.title
-                from_email = "ZesteDeSavoir <{0}>".format(settings.MAIL_NOREPLY)
-                followers = g_topic.get_followers_by_email()
-                for follower in followers:
-                    receiver = follower.user
-                    if receiver == request.user:
-                        continue
-                    pos = post.position - 1
-                    last_read = TopicRead.objects.filter(
-                        topic=g_topic,
-                        post__position=pos,
-                        user=receiver).count()
-                    if last_read > 0:
-                        message_html = get_template('email/notification/new.html') \
-                            .render(
+                with transaction.atomic():
+                    post = Post()
+                    post.topic = g_topic
+                    post.author = request.user
+                    post.text = data["text"]
+                    post.text_html = emarkdown(data["text"])
+                    post.pubdate = datetime.now()
+                    post.position = allocate_position(g_topic)
+                    post.ip_address = get_client_ip(request)
+                    post.save()
+                    g_topic.last_message = post
+                    g_topic.save_but_counters()
+                    add_post_to_forum_stats(g_topic.forum, post)
+                    #Send mail
+                    subject = "ZDS - Notification: " + g_topic.title
+                    from_email = "ZesteDeSavoir <{0}>".format(settings.MAIL_NOREPLY)
+                    followers = g_topic.get_followers_by_email()
+                    mails = []
+                    for follower in followers:
+                        receiver = follower.user
+                        if receiver == request.user:
+                            continue
+                        pos = post.position - 1
+                        last_read = TopicRead.objects.filter(
+                            topic=g_topic,
+                            post__position=pos,
+                            user=receiver).count()
+                        if last_read > 0:
+                            message_html = get_template('email/notification/new.html') \
+                                .render(
+                                    Context({
+                                        'username': receiver.username,
+                                        'title':g_topic.title,
+                                        'url': settings.SITE_URL + post.get_absolute_url(),
+                                        'author': request.user.username
+                                    })
+                            )
+                            message_txt = get_template('email/notification/new.txt').render(
                                 Context({
                                     'username': receiver.username,
                                     'title':g_topic.title,
                                     'url': settings.SITE_URL + post.get_absolute_url(),
                                     'author': request.user.username
                                 })
-                        )
-                        message_txt = get_template('email/notification/new.txt').render(
-                            Context({
-                                'username': receiver.username,
-                                'title':g_topic.title,
-                                'url': settings.SITE_URL + post.get_absolute_url(),
-                                'author': request.user.username
-                            })
-                        )
-                        msg = EmailMultiAlternatives(
-                            subject, message_txt, from_email, [
-                                receiver.email])
-                        msg.attach_alternative(message_html, "text/html")
-                        msg.send()
-
-                # Follow topic on answering
-                if not g_topic.is_followed(user=request.user):
-                    follow(g_topic)
+                            )
+                            msg = EmailMultiAlternatives(
+                                subject, message_txt, from_email, [
+                                    receiver.email])
+                            msg.attach_alternative(message_html, "text/html")
+                            mails.append(msg)
+                    get_connection('zds.utils.mailqueue.QueuedEmailBackend')\
+                        .send_messages(mails)
+
+                    # Follow topic on answering
+                    if not g_topic.is_followed(user=request.user):
+                        follow(g_topic)
+                invalidate_home_cache('topics')
+                invalidate_navbar(topic_followers(g_topic.pk))
                 return redirect(post.get_absolute_url())
             else:
                 return render_template("forum/post/new.html", {
@@ -650,7 +664,7 @@ def edit_post(request):
                 (tags, title) = get_tag_by_title(request.POST["title"])
                 g_topic.title = title
                 g_topic.subtitle = request.POST["subtitle"]
-                g_topic.save()
+                g_topic.save_but_counters()
                 g_topic.tags.clear()
 
                 # add tags
@@ -661,7 +675,7 @@ def edit_post(request):
                         tg = Tag(title=tag[2])
                         tg.save()
                     g_topic.tags.add(tg)
-                g_topic.save()
+                g_topic.save_but_counters()
         post.save()
         return redirect(post.get_absolute_url())
     else:
@@ -868,16 +882,11 @@ def find_topic_by_tag(request, tag_slug):
         filter = None
         topics = Topic.objects.filter(tags__in=[tag], is_sticky=False) .order_by(
             "-last_message__pubdate").prefetch_related("author", "last_message", "tags").all()
-    tops = []
-    for top in topics:
-        if not top.forum.can_read(request.user):
-            continue
-        else:
-            tops.append(top)
+    topics = topics.filter(forum__in=get_readable_forums(request.user))
 
     # Paginator
 
-    paginator = Paginator(tops, settings.TOPICS_PER_PAGE)
+    paginator = Paginator(topics, settings.TOPICS_PER_PAGE)
     page = request.GET.get("page")
     try:
         shown_topics = paginator.page(page)
@@ -890,6 +899,8 @@ def find_topic_by_tag(request, tag_slug):
         page = paginator.num_pages
     return render_template("forum/find/topic_by_tag.html", {
         "topics": shown_topics,
+        "unread_topics": get_unread_topics(shown_topics.object_list,
+                                           request.user),
         "tag": tag,
         "pages": paginator_range(page, paginator.num_pages),
         "nb": page,
@@ -902,19 +913,13 @@ def find_topic(request, user_pk):
     """Finds all topics of a user."""
 
     u = get_object_or_404(User, pk=user_pk)
-    topics = \
-        Topic.objects.filter(author=u).prefetch_related().order_by("-pubdate"
-                                                                   ).all()
-    tops = []
-    for top in topics:
-        if not top.forum.can_read(request.user):
-            continue
-        else:
-            tops.append(top)
+    topics = Topic.objects\
+        .filter(author=u, forum__in=get_readable_forums(request.user))\
+        .prefetch_related().order_by("-pubdate").all()
 
     # Paginator
 
-    paginator = Paginator(tops, settings.TOPICS_PER_PAGE)
+    paginator = Paginator(topics, settings.TOPICS_PER_PAGE)
     page = request.GET.get("page")
     try:
         shown_topics = paginator.page(page)
@@ -928,6 +933,8 @@ def find_topic(request, user_pk):
 
     return render_template("forum/find/topic.html", {
         "topics": shown_topics,
+        "unread_topics": get_unread_topics(shown_topics.object_list,
+                                           request.user),
         "usr": u,
         "pages": paginator_range(page, paginator.num_pages),
         "nb": page,
@@ -939,20 +946,13 @@ def find_post(request, user_pk):
     """Finds all posts of a user."""
 
     u = get_object_or_404(User, pk=user_pk)
-    posts = \
-        Post.objects.filter(author=u).prefetch_related().order_by("-pubdate"
-                                                                  ).all()
-    pts = []
-
-    for post in posts:
-        if not post.topic.forum.can_read(request.user):
-            continue
-        else:
-            pts.append(post)
+    posts = Post.objects\
+        .filter(author=u, topic__forum__in=get_readable_forums(request.user))\
+        .select_related("topic").order_by("-pubdate").all()
 
     # Paginator
 
-    paginator = Paginator(pts, settings.POSTS_PER_PAGE)
+    paginator = Paginator(posts, settings.POSTS_PER_PAGE)
     page = request.GET.get("page")
     try:
         shown_posts = paginator.page(page)
@@ -966,6 +966,8 @@ def find_post(request, user_pk):
 
     return render_template("forum/find/post.html", {
         "posts": shown_posts,
+        "unread_topics": get_unread_topics(
+            [post.topic for post in shown_posts.object_list], request.user),
         "usr": u,
         "pages": paginator_range(page, paginator.num_pages),
         "nb": page,
@@ -992,6 +994,8 @@ def followed_topics(request):
         page = paginator.num_pages
     return render_template("forum/topic/followed.html",
                            {"followed_topics": shown_topics,
+                            "unread_topics": get_unread_topics(
+                                shown_topics.object_list, request.user),
                             "pages": paginator_range(page,
                                                      paginator.num_pages),
                             "nb": page})
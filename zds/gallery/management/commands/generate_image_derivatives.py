@@ -0,0 +1,85 @@
+# coding: utf-8
+
+from itertools import imap
+from multiprocessing import Pool
+from optparse import make_option
+import os
+
+from django.conf import settings
+from django.core.management.base import NoArgsCommand
+from django.db.models import Q
+
+from zds.gallery.models import Image, make_derivative
+
+
+# Reduced versions kept in the fields of the images
+STORED_SIZES = ('thumb', 'medium')
+
+
+def make_derivatives(job):
+    """Makes the reduced versions of an image, in a process of the pool."""
+    pk, physical_name, source, derivatives = job
+    try:
+        for size, name in derivatives:
+            make_derivative(source, os.path.join(settings.MEDIA_ROOT, name),
+                            settings.GALLERY_IMAGE_SIZES[size])
+    except IOError:
+        return pk, physical_name, derivatives, False
+    return pk, physical_name, derivatives, True
+
+
+class Command(NoArgsCommand):
+    help = u'Make the reduced versions of the images of the galleries ' \
+        u'which have none yet, with several processes.'
+
+    option_list = NoArgsCommand.option_list + (
+        make_option('--all', action='store_true', dest='all', default=False,
+                    help=u'Make every size of every image again'),
+        make_option('--processes', type='int', dest='processes',
+                    default=None, help=u'Number of processes'),
+    )
+
+    def handle_noargs(self, **options):
+        processes = options['processes'] or \
+            settings.GALLERY_DERIVATIVES_PROCESSES
+        images = Image.objects.only('pk', 'gallery', 'physical', 'thumb',
+                                    'medium')
+        if not options['all']:
+            images = images.filter(Q(thumb__isnull=True) | Q(thumb='')
+                                   | Q(medium__isnull=True) | Q(medium=''))
+
+        jobs = []
+        for image in images.iterator():
+            if options['all']:
+                sizes = settings.GALLERY_IMAGE_SIZES.keys()
+            else:
+                sizes = [size for size in STORED_SIZES
+                         if not getattr(image, size)]
+            jobs.append((image.pk, image.physical.name, image.physical.path,
+                         [(size, image.get_derivative_name(size))
+                          for size in sizes]))
+
+        pool = None
+        if processes > 1 and len(jobs) > 1:
+            pool = Pool(processes)
+            results = pool.imap_unordered(make_derivatives, jobs)
+        else:
+            results = imap(make_derivatives, jobs)
+        done = failed = 0
+        try:
+            for pk, physical_name, derivatives, success in results:
+                if not success:
+                    failed += 1
+                    continue
+                done += 1
+                stored = dict((size, name) for size, name in derivatives
+                              if size in STORED_SIZES)
+                # The file may have been replaced meanwhile
+                if stored:
+                    Image.objects.filter(pk=pk, physical=physical_name)\
+                        .update(**stored)
+        finally:
+            if pool is not None:
+                pool.terminate()
+        self.stdout.write(u'{0} images réduites, {1} en échec'.format(
+            done, failed))
@@ -1,8 +1,6 @@
 # coding: utf-8
 
-from cStringIO import StringIO
 from django.conf import settings
-from django.core.files.uploadedfile import SimpleUploadedFile
 from django.db import models
 from django.dispatch import receiver
 import os
@@ -15,12 +13,6 @@ from django.core.urlresolvers import reverse
 from PIL import Image as PILImage
 
 
-IMAGE_THUMB_MAX_WIDTH = 128
-IMAGE_THUMB_MAX_HEIGHT = 128
-IMAGE_MEDIUM_MAX_WIDTH = 400
-IMAGE_MEDIUM_MAX_HEIGHT = 300
-
-
 def image_path(instance, filename):
     """Return path to an image."""
     ext = filename.split('.')[-1]
@@ -106,6 +98,10 @@ class Image(models.Model):
     update = models.DateTimeField(
         'Date de modification', null=True, blank=True)
 
+    def __init__(self, *args, **kwargs):
+        super(Image, self).__init__(*args, **kwargs)
+        self._physical_name = self.physical.name
+
     def __unicode__(self):
         """Textual form of an Image."""
         return self.slug
@@ -116,66 +112,89 @@ class Image(models.Model):
     def get_extension(self):
         return os.path.splitext(self.physical.name)[1][1:]
 
-    def save(
-        self,
-        force_update=False,
-        force_insert=False,
-        thumb_size=(
-            IMAGE_THUMB_MAX_WIDTH,
-            IMAGE_THUMB_MAX_HEIGHT),
-        medium_size=(
-            IMAGE_MEDIUM_MAX_WIDTH,
-            IMAGE_MEDIUM_MAX_HEIGHT), *args, **kwargs):
-        if has_changed(self, 'physical') and self.physical:
-            # TODO : delete old image
-
-            image = PILImage.open(self.physical)
-
-            if image.mode not in ('L', 'RGB', 'P', 'RGBA'):
-                image = image.convert('RGB')
-
-            # Medium
-            image.thumbnail(medium_size, PILImage.ANTIALIAS)
-
-            # save the thumbnail to memory
-            temp_handle = StringIO()
-            image.save(temp_handle, 'png')
-            temp_handle.seek(0)  # rewind the file
-
-            # save to the thumbnail field
-            suf = SimpleUploadedFile(os.path.split(self.physical.name)[-1],
-                                     temp_handle.read(),
-                                     content_type='image/png')
-            self.medium.save(suf.name + '.png', suf, save=False)
-
-            # Thumbnail
-            image.thumbnail(thumb_size, PILImage.ANTIALIAS)
-
-            # save the thumbnail to memory
-            temp_handle = StringIO()
-            image.save(temp_handle, 'png')
-            temp_handle.seek(0)  # rewind the file
-
-            # save to the thumbnail field
-            suf = SimpleUploadedFile(os.path.split(self.physical.name)[-1],
-                                     temp_handle.read(),
-                                     content_type='image/png')
-            self.thumb.save(suf.name + '.png', suf, save=False)
-
-            # save the image object
-            super(Image, self).save(force_update, force_insert)
-        else:
-            super(Image, self).save()
-
-
-def has_changed(instance, field, manager='objects'):
-    """Returns true if a field has changed in a model May be used in a
-    model.save() method."""
-    if not instance.pk:
-        return True
-    manager = getattr(instance.__class__, manager)
-    old = getattr(manager.get(pk=instance.pk), field)
-    return not getattr(instance, field) == old
+    def get_derivative_name(self, size):
+        """Path of a reduced version of the image, from MEDIA_ROOT."""
+        return get_derivative_name(self.gallery_id, size, self.physical.name)
+
+    def get_derivative_url(self, size):
+        """URL of a reduced version of the image, which is made by the view
+        behind it if it doesn't exist yet."""
+        if size in ('thumb', 'medium') and getattr(self, size):
+            return getattr(self, size).url
+        return reverse('zds.gallery.views.image_derivative',
+                       args=[self.pk, size])
+
+    def get_thumb_url(self):
+        return self.get_derivative_url('thumb')
+
+    def get_medium_url(self):
+        return self.get_derivative_url('medium')
+
+    def make_derivative(self, size):
+        """Makes a reduced version of the image if it doesn't exist yet and
+        returns its path from MEDIA_ROOT."""
+        name = self.get_derivative_name(size)
+        path = os.path.join(settings.MEDIA_ROOT, name)
+        if not os.path.isfile(path):
+            make_derivative(self.physical.path, path,
+                            settings.GALLERY_IMAGE_SIZES[size])
+        if size in ('thumb', 'medium') and getattr(self, size).name != name:
+            getattr(self, size).name = name
+            Image.objects.filter(pk=self.pk).update(**{size: name})
+        return name
+
+    def save(self, *args, **kwargs):
+        # The reduced versions of a new file are made later, by the
+        # generate_image_derivatives command or when they are first asked
+        if self.physical.name != self._physical_name:
+            if self._physical_name:
+                delete_derivatives(self.gallery_id, self._physical_name)
+            for derivative in (self.thumb, self.medium):
+                if derivative and os.path.isfile(derivative.path):
+                    os.remove(derivative.path)
+            self.thumb = None
+            self.medium = None
+        super(Image, self).save(*args, **kwargs)
+        self._physical_name = self.physical.name
+
+
+def get_derivative_name(gallery_pk, size, physical_name):
+    return os.path.join('galleries', size, str(gallery_pk),
+                        os.path.basename(physical_name) + '.png')
+
+
+def make_derivative(source, destination, size):
+    """Writes a PNG version of an image reduced to fit in size. Doesn't use
+    the database, to run in the processes of a pool."""
+    image = PILImage.open(source)
+    # JPEG images are decoded at the smallest scale above the size
+    image.draft('RGB', size)
+    if image.mode not in ('L', 'RGB', 'P', 'RGBA'):
+        image = image.convert('RGB')
+    image.thumbnail(size, PILImage.ANTIALIAS)
+
+    directory = os.path.dirname(destination)
+    if not os.path.isdir(directory):
+        try:
+            os.makedirs(directory)
+        except OSError:
+            # made by another process meanwhile
+            pass
+    # the file is complete once it is visible
+    temp = '{0}.{1}.tmp'.format(destination, os.getpid())
+    image.save(temp, 'png')
+    os.rename(temp, destination)
+    return destination
+
+
+def delete_derivatives(gallery_pk, physical_name):
+    for size in settings.GALLERY_IMAGE_SIZES:
+        path = os.path.join(settings.MEDIA_ROOT,
+                            get_derivative_name(gallery_pk, size,
+                                                physical_name))
+        if os.path.isfile(path):
+            os.remove(path)
+
 
 # These two auto-delete files from filesystem when they are unneeded:
 
@@ -186,6 +205,7 @@ def auto_delete_file_on_delete(sender, instance, **kwargs):
     if instance.physical:
         if os.path.isfile(instance.physical.path):
             os.remove(instance.physical.path)
+        delete_derivatives(instance.gallery_id, instance.physical.name)
     if instance.medium:
         if os.path.isfile(instance.medium.path):
             os.remove(instance.medium.path)
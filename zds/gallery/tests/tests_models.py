@@ -1,11 +1,15 @@
 # coding: utf-8
 
 import os
+from StringIO import StringIO
 
+from django.core.management import call_command
 from django.test import TestCase
+from PIL import Image as PILImage
 from django.core.urlresolvers import reverse
 
 from zds.gallery.factories import GalleryFactory, UserGalleryFactory, ImageFactory
+from zds.gallery.models import Image
 from zds.member.factories import ProfileFactory
 from zds import settings
 
@@ -79,14 +83,45 @@ class ImageTest(TestCase):
     def test_save_image(self):
         test_image = ImageFactory(gallery=self.gallery)
         self.assertTrue(os.path.isfile(test_image.physical.path))
+        # the reduced versions are made later
+        self.assertFalse(test_image.medium)
+        self.assertFalse(test_image.thumb)
+
+        test_image.make_derivative('medium')
+        test_image.make_derivative('thumb')
+        test_image = Image.objects.get(pk=test_image.pk)
         self.assertTrue(os.path.isfile(test_image.medium.path))
         self.assertTrue(os.path.isfile(test_image.thumb.path))
+        self.assertEqual(test_image.get_thumb_url(), test_image.thumb.url)
 
         test_image.delete()
         self.assertFalse(os.path.isfile(test_image.physical.path))
         self.assertFalse(os.path.isfile(test_image.medium.path))
         self.assertFalse(os.path.isfile(test_image.thumb.path))
 
+    def test_generate_derivatives(self):
+        test_image = ImageFactory(gallery=self.gallery)
+        call_command('generate_image_derivatives', processes=2,
+                     stdout=StringIO())
+
+        test_image = Image.objects.get(pk=test_image.pk)
+        self.assertTrue(os.path.isfile(test_image.medium.path))
+        self.assertTrue(os.path.isfile(test_image.thumb.path))
+        thumb = PILImage.open(test_image.thumb.path)
+        self.assertTrue(max(thumb.size) <= 128)
+
+        # a new file has new reduced versions
+        old_physical = test_image.physical.path
+        old_thumb = test_image.thumb.path
+        test_image.physical = ImageFactory.build(gallery=self.gallery).physical
+        test_image.save()
+        self.assertFalse(os.path.isfile(old_thumb))
+        self.assertFalse(test_image.thumb)
+
+        os.remove(old_physical)
+
+        test_image.delete()
+
 
 class GalleryTest(TestCase):
 
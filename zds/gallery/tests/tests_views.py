@@ -617,3 +617,34 @@ class NewImageViewTest(TestCase):
             )
 
         self.assertEqual(404, response.status_code)
+
+
+class ImageDerivativeViewTest(TestCase):
+
+    def setUp(self):
+        self.gallery = GalleryFactory()
+        self.image = ImageFactory(gallery=self.gallery)
+
+    def tearDown(self):
+        self.image.delete()
+
+    def test_fail_size_not_allowed(self):
+        response = self.client.get(reverse(
+            'zds.gallery.views.image_derivative',
+            args=[self.image.pk, 'huge']
+        ))
+
+        self.assertEqual(404, response.status_code)
+
+    def test_success_make_derivative(self):
+        url = self.image.get_medium_url()
+        self.assertEqual(url, reverse('zds.gallery.views.image_derivative',
+                                      args=[self.image.pk, 'medium']))
+
+        response = self.client.get(url)
+
+        image_test = Image.objects.get(pk=self.image.pk)
+        self.assertTrue(os.path.isfile(image_test.medium.path))
+        self.assertRedirects(response, image_test.medium.url,
+                             target_status_code=404)
+        self.assertEqual(image_test.medium.url, image_test.get_medium_url())
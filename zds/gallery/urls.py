@@ -21,4 +21,6 @@ urlpatterns = patterns('',
                            'zds.gallery.views.modify_image'),
                        url(r'^image/editer/(?P<gal_pk>\d+)/(?P<img_pk>\d+)/$',
                            'zds.gallery.views.edit_image'),
+                       url(r'^image/(?P<img_pk>\d+)/(?P<size>\w+)/$',
+                           'zds.gallery.views.image_derivative'),
                        )
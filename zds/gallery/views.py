@@ -273,3 +273,17 @@ def new_image(request, gal_pk):
         form = ImageForm()  # A empty, unbound form
         return render_template("gallery/image/new.html", {"form": form,
                                                           "gallery": gal})
+
+
+def image_derivative(request, img_pk, size):
+    """Redirects to a reduced version of an image, made the first time it is
+    asked. Only the sizes of GALLERY_IMAGE_SIZES are made."""
+
+    if size not in settings.GALLERY_IMAGE_SIZES:
+        raise Http404
+    img = get_object_or_404(Image, pk=img_pk)
+    try:
+        name = img.make_derivative(size)
+    except IOError:
+        raise Http404
+    return redirect(img.physical.storage.url(name))
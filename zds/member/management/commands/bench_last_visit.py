@@ -0,0 +1,52 @@
+# coding: utf-8
+
+from optparse import make_option
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import CommandError, NoArgsCommand
+from django.http import HttpResponse
+from django.test.client import RequestFactory
+from django.utils.importlib import import_module
+
+from zds.benchmarks.utils import QueryTimer, rolled_back
+from zds.middlewares.SetLastVisitMiddleware import SetLastVisitMiddleware
+
+
+class Command(NoArgsCommand):
+    help = u'Measure the duration and the number of queries added to the ' \
+        u'requests of a member by SetLastVisitMiddleware. Nothing is kept.'
+
+    option_list = NoArgsCommand.option_list + (
+        make_option('--user', dest='user', default=None,
+                    help=u'Username of the member (the first user by '
+                    u'default)'),
+        make_option('--requests', dest='requests', type='int', default=1000,
+                    help=u'Number of requests'),
+    )
+
+    def handle_noargs(self, **options):
+        if options['user']:
+            user = User.objects.filter(username=options['user']).first()
+        else:
+            user = User.objects.order_by('pk').first()
+        if user is None:
+            raise CommandError(u'Aucun utilisateur pour les requêtes')
+        count = options['requests']
+
+        # every request of the member comes from the same session
+        request = RequestFactory().get('/')
+        request.user = user
+        request.session = import_module(settings.SESSION_ENGINE)\
+            .SessionStore()
+        response = HttpResponse()
+        middleware = SetLastVisitMiddleware()
+
+        with rolled_back():
+            with QueryTimer() as timer:
+                for i in range(count):
+                    middleware.process_response(request, response)
+        self.stdout.write(u'{0} requêtes : {1:.1f} µs par requête, {2} '
+                          u'requêtes SQL'.format(count,
+                                                 timer.elapsed * 1e6 / count,
+                                                 len(timer)))
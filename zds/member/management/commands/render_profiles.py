@@ -0,0 +1,20 @@
+# coding: utf-8
+
+from django.core.management.base import NoArgsCommand
+
+from zds.member.models import Profile, render_profile_markdown
+
+
+class Command(NoArgsCommand):
+    help = u'Store the HTML of the signatures and biographies of all ' \
+        u'profiles.'
+
+    def handle_noargs(self, **options):
+        count = 0
+        for profile in Profile.objects.all():
+            render_profile_markdown(profile)
+            Profile.objects.filter(pk=profile.pk).update(
+                sign_html=profile.sign_html,
+                biography_html=profile.biography_html)
+            count += 1
+        self.stdout.write(u'{0} profils mis à jour'.format(count))
@@ -1,13 +1,19 @@
 # coding: utf-8
 
+from collections import OrderedDict
 from datetime import datetime
 from django.conf import settings
-from django.db import models
+from django.db import connection, models, transaction, IntegrityError
+from django.db.models import Count, F
+from django.db.models.signals import post_save, pre_save
+from django.utils import timezone
 from hashlib import md5
-from django.http import HttpRequest
 from django.contrib.sessions.models import Session
-from django.contrib.auth import logout
+from django.contrib.auth.signals import user_logged_in, user_logged_out
+from django.utils.importlib import import_module
 import os
+import sys
+import unicodedata
 
 from django.contrib.auth.models import User
 from django.core.urlresolvers import reverse
@@ -17,6 +23,7 @@ from zds.article.models import Article
 from zds.forum.models import Post, Topic
 from zds.tutorial.models import Tutorial
 from zds.utils.models import Alert
+from zds.utils.templatetags.emarkdown import emarkdown, emarkdown_inline
 
 
 class Profile(models.Model):
@@ -50,10 +57,12 @@ class Profile(models.Model):
     )
 
     biography = models.TextField('Biographie', blank=True)
+    biography_html = models.TextField('Biographie en HTML', blank=True)
 
     karma = models.IntegerField('Karma', default=0)
 
     sign = models.TextField('Signature', max_length=250, blank=True)
+    sign_html = models.TextField('Signature en HTML', blank=True)
 
     show_sign = models.BooleanField('Voir les signatures',
                                     default=True)
@@ -86,6 +95,10 @@ class Profile(models.Model):
         null=True,
         blank=True)
 
+    # Username searched by its first letters by the autocompletion
+    username_key = models.CharField('Pseudo normalisé', max_length=60,
+                                    blank=True, default='', db_index=True)
+
     def __unicode__(self):
         """Textual forum of a profile."""
         return self.user.username
@@ -277,18 +290,226 @@ class Ban(models.Model):
         null=True)
 
 
-def logout_user(username):
-    now = datetime.now()
-    request = HttpRequest()
+class PostActivity(models.Model):
+
+    """Number of forum posts written by a member at an hour of a day of the
+    week (0 is Sunday).
+
+    Counters are incremented when a post is saved, so that the activity chart
+    doesn't go through all the posts of the member.
+
+    """
+    class Meta:
+        verbose_name = 'Activité'
+        verbose_name_plural = 'Activités'
+        unique_together = (('user', 'week_day', 'hour'),)
+
+    user = models.ForeignKey(User, verbose_name='Membre',
+                             related_name='post_activity')
+    week_day = models.PositiveSmallIntegerField('Jour de la semaine')
+    hour = models.PositiveSmallIntegerField('Heure')
+    count = models.IntegerField('Nombre de messages', default=0)
+
+    def __unicode__(self):
+        return u'<Activité de {0}, {1} à {2} h>'.format(self.user_id,
+                                                         self.week_day,
+                                                         self.hour)
 
-    sessions = Session.objects.filter(expire_date__gt=now)
 
-    for session in sessions:
-        user_id = session.get_decoded().get('_auth_user_id')
-        if username == user_id:
-            request.session = init_session(session.session_key)
-            logout(request)
-            break
+class UserSession(models.Model):
+
+    """Session opened by a member when logging in.
+
+    It is deleted with the session, and lets close all the sessions of a
+    member without decoding all the sessions of the site.
+
+    """
+    class Meta:
+        verbose_name = 'Session de membre'
+        verbose_name_plural = 'Sessions de membres'
+
+    session = models.OneToOneField(Session, verbose_name='Session',
+                                   primary_key=True)
+    user = models.ForeignKey(User, verbose_name='Membre',
+                             related_name='user_sessions')
+
+    def __unicode__(self):
+        return u'<Session de {0}>'.format(self.user_id)
+
+
+def get_username_key(username):
+    """Username lowercased and without accents, so that members are found
+    whatever the case and the accents typed."""
+    username = unicodedata.normalize('NFKD', unicode(username))
+    return u''.join(char for char in username
+                    if not unicodedata.combining(char)).lower()[:60]
+
+
+def get_next_key(key):
+    """Smallest key greater than all the keys starting with the given one
+    (None if there is none), by incrementing its last character."""
+    while key:
+        code = ord(key[-1])
+        if code < sys.maxunicode:
+            return key[:-1] + unichr(code + 1)
+        key = key[:-1]
+    return None
+
+
+def search_members(query, count=20):
+    """Primary keys and usernames of the members whose username starts with
+    the query, the most recently seen first."""
+    key = get_username_key(query.strip())
+    if not key:
+        return []
+    # A range of the index of the keys, rather than LIKE which can't always
+    # use it. The members who never came back are the last ones, whatever
+    # the database sorts NULL with.
+    profiles = Profile.objects.filter(username_key__gte=key)
+    next_key = get_next_key(key)
+    if next_key is not None:
+        profiles = profiles.filter(username_key__lt=next_key)
+    return profiles\
+        .extra(select={'last_visit_null':
+                       'member_profile.last_visit IS NULL'},
+               order_by=['last_visit_null', '-last_visit'])\
+        .values_list('user__pk', 'user__username')[:count]
+
+
+def compute_post_activity(user):
+    """Counts again from scratch the posts of a member by day of the week and
+    hour, with a single grouped query, and stores the counters."""
+    column = '{0}.{1}'.format(
+        connection.ops.quote_name(Post._meta.get_field('pubdate').model
+                                  ._meta.db_table),
+        connection.ops.quote_name('pubdate'))
+    tzname = timezone.get_current_timezone_name() if settings.USE_TZ else None
+    week_day_sql, week_day_params = connection.ops.datetime_extract_sql(
+        'week_day', column, tzname)
+    hour_sql, hour_params = connection.ops.datetime_extract_sql(
+        'hour', column, tzname)
+    counts = Post.objects\
+        .filter(author=user)\
+        .extra(select=OrderedDict([('week_day', week_day_sql),
+                                   ('hour', hour_sql)]),
+               select_params=list(week_day_params) + list(hour_params))\
+        .values('week_day', 'hour')\
+        .annotate(count=Count('pk'))\
+        .order_by()
+    # The databases number the days of the week from 1 (Sunday)
+    activity = [PostActivity(user=user,
+                             week_day=int(row['week_day']) - 1,
+                             hour=int(row['hour']),
+                             count=row['count']) for row in counts]
+    try:
+        with transaction.atomic():
+            PostActivity.objects.filter(user=user).delete()
+            PostActivity.objects.bulk_create(activity)
+    except IntegrityError:
+        # computed meanwhile by another request
+        activity = list(PostActivity.objects.filter(user=user))
+    return activity
+
+
+def get_post_activity(user):
+    """Number of posts of a member, by hour and day of the week."""
+    activity = list(PostActivity.objects.filter(user=user))
+    if not activity:
+        activity = compute_post_activity(user)
+    counts = [7 * [0] for i in range(24)]
+    for counter in activity:
+        counts[counter.hour][counter.week_day] = counter.count
+    return counts
+
+
+def count_post_activity(sender, instance, created, raw=False, **kwargs):
+    """Counts a new post in the activity of its author."""
+    if not created or raw:
+        return
+    t = instance.pubdate.timetuple()
+    counters = PostActivity.objects.filter(user__pk=instance.author_id,
+                                           week_day=(t.tm_wday + 1) % 7,
+                                           hour=t.tm_hour)
+    if counters.update(count=F('count') + 1):
+        return
+    if not PostActivity.objects.filter(user__pk=instance.author_id).exists():
+        # never computed, or no post yet: the counters will be computed with
+        # the new post on their first display
+        return
+    try:
+        with transaction.atomic():
+            PostActivity.objects.create(user_id=instance.author_id,
+                                        week_day=(t.tm_wday + 1) % 7,
+                                        hour=t.tm_hour,
+                                        count=1)
+    except IntegrityError:
+        # created meanwhile by another post
+        counters.update(count=F('count') + 1)
+
+
+post_save.connect(count_post_activity, sender=Post)
+
+
+def set_username_key(sender, instance, **kwargs):
+    instance.username_key = get_username_key(instance.user.username)
+
+
+def update_username_key(sender, instance, created, raw=False, **kwargs):
+    """Updates the key of the profile of a member who changed his
+    username."""
+    if created or raw:
+        return
+    key = get_username_key(instance.username)
+    Profile.objects.filter(user=instance)\
+        .exclude(username_key=key)\
+        .update(username_key=key)
+
+
+pre_save.connect(set_username_key, sender=Profile)
+post_save.connect(update_username_key, sender=User)
+
+
+def remember_session(sender, request, user, **kwargs):
+    """Links the new session of a member to him."""
+    session_key = request.session.session_key
+    if session_key is None:
+        return
+    if not UserSession.objects.filter(session=session_key).update(user=user):
+        UserSession.objects.create(session_id=session_key, user=user)
+
+
+def forget_session(sender, request, user, **kwargs):
+    UserSession.objects.filter(session=request.session.session_key).delete()
+
+
+user_logged_in.connect(remember_session)
+user_logged_out.connect(forget_session)
+
+
+def render_profile_markdown(profile):
+    """Stores the HTML of the signature and the biography of the profile."""
+    profile.sign_html = emarkdown_inline(profile.sign)
+    profile.biography_html = emarkdown(profile.biography)
+
+
+def render_profile_on_save(sender, instance, update_fields=None, **kwargs):
+    """Renders the signature and the biography of a profile saved from
+    anywhere (the settings, the admin...)."""
+    if update_fields is None:
+        render_profile_markdown(instance)
+
+
+pre_save.connect(render_profile_on_save, sender=Profile)
+
+
+def logout_user(user):
+    """Closes all the sessions of a member, in the database and the cache."""
+    engine = import_module(settings.SESSION_ENGINE)
+    for session_key in UserSession.objects\
+            .filter(user=user)\
+            .values_list('session', flat=True):
+        engine.SessionStore(session_key).delete()
+    UserSession.objects.filter(user=user).delete()
 
 def listing():
 
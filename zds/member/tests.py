@@ -1,14 +1,24 @@
 # coding: utf-8
 
+from datetime import datetime, timedelta
+import json
+import sys
+
 from django.conf import settings
 from django.contrib.auth.models import User
+from django.contrib.sessions.models import Session
 from django.core import mail
 from django.core.urlresolvers import reverse
 from django.test import TestCase
+from django.test.client import Client
 
+from zds.forum.factories import CategoryFactory, ForumFactory, \
+    TopicFactory, PostFactory
 from zds.member.factories import ProfileFactory, StaffProfileFactory
 from zds.member.forms import RegisterForm
-from zds.member.models import Profile
+from zds.member.models import Profile, PostActivity, UserSession, \
+    get_next_key, get_post_activity
+from zds.utils.models import QueuedMail
 
 from .models import TokenRegister, Ban
 
@@ -43,6 +53,181 @@ class MemberTests(TestCase):
         # good password then redirection
         self.assertEqual(result.status_code, 302)
 
+    def test_sessions(self):
+        """The sessions of a member are closed when he is banned."""
+        user = ProfileFactory().user
+        clients = [Client(), Client()]
+        for client in clients:
+            self.assertTrue(client.login(username=user.username,
+                                         password='hostel77'))
+        session_keys = set(client.session.session_key for client in clients)
+        self.assertEqual(
+            set(UserSession.objects
+                .filter(user=user)
+                .values_list('session', flat=True)),
+            session_keys)
+
+        # logging out closes a single session
+        clients[0].post(reverse('zds.member.views.logout_view'))
+        self.assertEqual(UserSession.objects.filter(user=user).count(), 1)
+
+        staff = StaffProfileFactory()
+        self.assertTrue(self.client.login(username=staff.user.username,
+                                          password='hostel77'))
+        result = self.client.post(
+            reverse('zds.member.views.modify_profile',
+                    kwargs={'user_pk': user.pk}),
+            {'ban': '', 'ban-text': 'Texte de test pour BAN'},
+            follow=False)
+        self.assertEqual(result.status_code, 302)
+        self.assertEqual(UserSession.objects.filter(user=user).count(), 0)
+        self.assertEqual(
+            Session.objects.filter(pk__in=session_keys).count(), 0)
+        self.assertNotIn('_auth_user_id', clients[1].session)
+        # the staff member is still logged in
+        self.assertEqual(UserSession.objects.filter(user=staff.user).count(),
+                         1)
+
+    def test_last_visit(self):
+        """The last visit is written once in a while, alone."""
+        profile = ProfileFactory()
+        self.assertTrue(self.client.login(username=profile.user.username,
+                                          password='hostel77'))
+        self.client.get(reverse('zds.pages.views.home'))
+        last_visit = Profile.objects.get(pk=profile.pk).last_visit
+        self.assertIsNotNone(last_visit)
+
+        self.client.get(reverse('zds.pages.views.home'))
+        self.assertEqual(Profile.objects.get(pk=profile.pk).last_visit,
+                         last_visit)
+
+        # a profile being edited isn't written back
+        Profile.objects.filter(pk=profile.pk).update(biography=u'Edité')
+        with self.settings(LAST_VISIT_DELAY=-1):
+            self.client.get(reverse('zds.pages.views.home'),
+                            REMOTE_ADDR='10.0.0.1')
+        profile = Profile.objects.get(pk=profile.pk)
+        self.assertGreater(profile.last_visit, last_visit)
+        self.assertEqual(profile.last_ip_address, '10.0.0.1')
+        self.assertEqual(profile.biography, u'Edité')
+
+    def test_search_members(self):
+        """The autocompletion finds the members by the first letters of their
+        username, whatever the case and the accents, last seen first."""
+        now = datetime.now()
+        elodie = ProfileFactory(user__username=u'Élodie',
+                                last_visit=now - timedelta(days=2))
+        elise = ProfileFactory(user__username=u'elise', last_visit=now)
+        ProfileFactory(user__username=u'Gisele', last_visit=now)
+        ProfileFactory(user__username=u'Eliane', last_visit=None)
+        self.assertEqual(Profile.objects.get(pk=elodie.pk).username_key,
+                         u'elodie')
+
+        def search(q):
+            result = self.client.get(reverse('zds.member.views.index'),
+                                     {'q': q},
+                                     HTTP_X_REQUESTED_WITH='XMLHttpRequest')
+            self.assertEqual(result.status_code, 200)
+            return [member['label'] for member in json.loads(result.content)]
+
+        self.assertEqual(search(u'EL'), [u'elise', u'Élodie', u'Eliane'])
+        self.assertEqual(search(u'élo'), [u'Élodie'])
+        self.assertEqual(search(u'ise'), [])
+        self.assertEqual(search(u'elo'), [u'Élodie'])
+        self.assertEqual(search(u'elodie'), [u'Élodie'])
+        self.assertEqual(search(u'elodif'), [])
+        self.assertEqual(search(u''), [])
+
+        # a member who changes his username is found by the new one
+        user = elise.user
+        user.username = u'Lise'
+        user.save()
+        self.assertEqual(search(u'el'), [u'Élodie', u'Eliane'])
+        self.assertEqual(search(u'li'), [u'Lise'])
+
+    def test_next_key(self):
+        """The bound of the keys starting with a prefix."""
+        self.assertEqual(get_next_key(u'el'), u'em')
+        self.assertEqual(get_next_key(u'e' + unichr(sys.maxunicode)), u'f')
+        self.assertEqual(get_next_key(unichr(sys.maxunicode)), None)
+
+    def test_profile_markdown(self):
+        """To test the stored HTML of the signature and the biography."""
+        user = ProfileFactory()
+        log = self.client.login(
+            username=user.user.username,
+            password='hostel77')
+        self.assertEqual(log, True)
+
+        result = self.client.post(
+            reverse('zds.member.views.settings_profile'),
+            {'biography': u'Une **biographie**',
+             'site': '',
+             'avatar_url': '',
+             'sign': u'Une *signature*',
+             'options': ['show_sign']},
+            follow=False)
+        self.assertEqual(result.status_code, 302)
+
+        profile = Profile.objects.get(pk=user.pk)
+        self.assertIn('<em>signature</em>', profile.sign_html)
+        self.assertIn('<strong>biographie</strong>', profile.biography_html)
+
+        # a profile saved elsewhere (the admin) is rendered as well
+        profile.sign = u''
+        profile.save()
+        self.assertEqual(Profile.objects.get(pk=user.pk).sign_html, u'')
+
+    def test_post_activity(self):
+        """To test the counters and the chart of the posts of a member."""
+        user = ProfileFactory()
+        category = CategoryFactory(position=1)
+        forum = ForumFactory(category=category, position_in_category=1)
+        topic = TopicFactory(forum=forum, author=user.user)
+        post = PostFactory(topic=topic, author=user.user, position=1)
+        PostFactory(topic=topic, author=self.mas.user, position=2)
+        t = post.pubdate.timetuple()
+        hour, week_day = t.tm_hour, (t.tm_wday + 1) % 7
+
+        # counters are computed from the posts when they are missing
+        PostActivity.objects.all().delete()
+        self.assertEqual(get_post_activity(user.user)[hour][week_day], 1)
+        self.assertEqual(sum(map(sum, get_post_activity(user.user))), 1)
+
+        # and incremented by the new posts
+        PostFactory(topic=topic, author=user.user, position=3)
+        self.assertEqual(get_post_activity(user.user)[hour][week_day], 2)
+        self.assertEqual(PostActivity.objects.filter(user=user.user).count(),
+                         1)
+
+        # the first post of a member doesn't compute them
+        PostActivity.objects.all().delete()
+        PostFactory(topic=topic, author=user.user, position=4)
+        self.assertFalse(PostActivity.objects.exists())
+        self.assertEqual(get_post_activity(user.user)[hour][week_day], 3)
+
+        # only moderators see the chart
+        self.assertTrue(self.client.login(username=user.user.username,
+                                          password='hostel77'))
+        result = self.client.get(
+            reverse('zds.member.views.activity_chart',
+                    args=[user.user.username]))
+        self.assertEqual(result.status_code, 403)
+
+        staff = StaffProfileFactory()
+        self.assertTrue(self.client.login(username=staff.user.username,
+                                          password='hostel77'))
+        result = self.client.get(
+            reverse('zds.member.views.activity_chart',
+                    args=[user.user.username]))
+        self.assertEqual(result.status_code, 200)
+        self.assertEqual(result['Content-Type'], 'image/svg+xml')
+        result = self.client.get(
+            reverse('zds.member.views.activity_chart',
+                    args=[user.user.username]),
+            HTTP_IF_NONE_MATCH=result['ETag'])
+        self.assertEqual(result.status_code, 304)
+
     def test_register(self):
         """To test user registration."""
 
@@ -70,7 +255,8 @@ class MemberTests(TestCase):
             follow=False)
 
         self.assertEqual(result.status_code, 200)
-        self.assertEquals(len(mail.outbox), 2)
+        self.assertEquals(len(mail.outbox), 1)
+        self.assertEquals(QueuedMail.objects.count(), 1)
 
         self.assertEquals(User.objects.get(username='firm1').is_active, True)
 
@@ -173,7 +359,7 @@ class MemberTests(TestCase):
         ban = Ban.objects.filter(user__id=user.user.id).order_by('-pubdate')[0]
         self.assertEqual(ban.type, 'Lecture Seule')
         self.assertEqual(ban.text, 'Texte de test pour LS')
-        self.assertEquals(len(mail.outbox), 1)
+        self.assertEquals(QueuedMail.objects.count(), 1)
 
         # Test: Un-LS
         result = self.client.post(
@@ -191,7 +377,7 @@ class MemberTests(TestCase):
         ban = Ban.objects.filter(user__id=user.user.id).order_by('-id')[0]
         self.assertEqual(ban.type, u'Autorisation d\'écrire')
         self.assertEqual(ban.text, 'Texte de test pour un-LS')
-        self.assertEquals(len(mail.outbox), 2)
+        self.assertEquals(QueuedMail.objects.count(), 2)
 
         # Test: LS temp
         user_ls_temp = ProfileFactory()
@@ -212,7 +398,7 @@ class MemberTests(TestCase):
         ban = Ban.objects.filter(user__id=user.user.id).order_by('-id')[0]
         self.assertEqual(ban.type, 'Lecture Seule Temporaire')
         self.assertEqual(ban.text, 'Texte de test pour LS TEMP')
-        self.assertEquals(len(mail.outbox), 3)
+        self.assertEquals(QueuedMail.objects.count(), 3)
 
         # Test: BAN
         user_ban = ProfileFactory()
@@ -230,7 +416,7 @@ class MemberTests(TestCase):
         ban = Ban.objects.filter(user__id=user.user.id).order_by('-id')[0]
         self.assertEqual(ban.type, u'Ban définitif')
         self.assertEqual(ban.text, 'Texte de test pour BAN')
-        self.assertEquals(len(mail.outbox), 4)
+        self.assertEquals(QueuedMail.objects.count(), 4)
 
         # Test: un-BAN
         result = self.client.post(
@@ -249,7 +435,7 @@ class MemberTests(TestCase):
         ban = Ban.objects.filter(user__id=user.user.id).order_by('-id')[0]
         self.assertEqual(ban.type, 'Autorisation de se connecter')
         self.assertEqual(ban.text, 'Texte de test pour BAN')
-        self.assertEquals(len(mail.outbox), 5)
+        self.assertEquals(QueuedMail.objects.count(), 5)
 
         # Test: BAN temp
         user_ban_temp = ProfileFactory()
@@ -269,4 +455,4 @@ class MemberTests(TestCase):
         ban = Ban.objects.filter(user__id=user.user.id).order_by('-id')[0]
         self.assertEqual(ban.type, 'Ban Temporaire')
         self.assertEqual(ban.text, 'Texte de test pour BAN TEMP')
-        self.assertEquals(len(mail.outbox), 6)
+        self.assertEquals(QueuedMail.objects.count(), 6)
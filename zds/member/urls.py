@@ -9,6 +9,8 @@ urlpatterns = patterns('',
                        url(r'^$', 'zds.member.views.index'),
                        url(r'^voir/(?P<user_name>.+)/$',
                            'zds.member.views.details'),
+                       url(r'^activite/(?P<user_name>.+)/$',
+                           'zds.member.views.activity_chart'),
                        url(r'^profil/modifier/(?P<user_pk>\d+)/$',
                            'zds.member.views.modify_profile'),
                        url(r'^profil/lier/$',
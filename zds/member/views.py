@@ -1,7 +1,6 @@
 #!/usr/bin/python
 # -*- coding: utf-8 -*-
 from datetime import datetime, timedelta
-import os
 import uuid
 
 from django.conf import settings
@@ -9,17 +8,19 @@ from django.contrib import messages
 from django.contrib.auth import authenticate, login, logout
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth.models import User, SiteProfileNotAvailable
+from django.core.cache import cache
 from django.core.context_processors import csrf
 from django.core.exceptions import PermissionDenied
 from django.core.mail import EmailMultiAlternatives
 from django.core.paginator import Paginator, PageNotAnInteger, EmptyPage
 from django.core.urlresolvers import reverse
 from django.db import transaction
-from django.http import Http404, HttpResponse
+from django.http import Http404, HttpResponse, HttpResponseNotModified
 from django.shortcuts import redirect, get_object_or_404, render_to_response
 from django.template import Context, RequestContext
 from django.template.loader import get_template
 from django.views.decorators.http import require_POST
+from hashlib import sha1
 import json
 import pygal
 
@@ -27,10 +28,10 @@ from forms import LoginForm, MiniProfileForm, ProfileForm, RegisterForm, \
     ChangePasswordForm, ChangeUserForm, ForgotPasswordForm, NewPasswordForm, \
     OldTutoForm
 from models import Profile, TokenForgotPassword, Ban, TokenRegister, \
-    get_info_old_tuto, logout_user
+    get_info_old_tuto, logout_user, get_post_activity, search_members
 from zds.gallery.forms import ImageAsAvatarForm
 from zds.article.models import Article
-from zds.forum.models import Topic
+from zds.forum.models import Topic, get_readable_forums
 from zds.member.decorator import can_write_and_read_now
 from zds.tutorial.models import Tutorial
 from zds.utils import render_template
@@ -44,15 +45,9 @@ def index(request):
     """Displays the list of registered users."""
 
     if request.is_ajax():
-        q = request.GET.get('q', '')
-        members = User.objects.filter(username__icontains=q)[:20]
         results = []
-        for member in members:
-            member_json = {}
-            member_json['id'] = member.pk
-            member_json['label'] = member.username
-            member_json['value'] = member.username
-            results.append(member_json)
+        for (pk, username) in search_members(request.GET.get('q', '')):
+            results.append({'id': pk, 'label': username, 'value': username})
         data = json.dumps(results)
 
         mimetype = "application/json"
@@ -93,28 +88,6 @@ def details(request, user_name):
     except SiteProfileNotAvailable:
         raise Http404
 
-    # refresh moderation chart
-
-    dot_chart = pygal.Dot(x_label_rotation=30)
-    dot_chart.title = u"Messages postés par période"
-    dot_chart.x_labels = [
-        u"Dimanche",
-        u"Lundi",
-        u"Mardi",
-        u"Mercredi",
-        u"Jeudi",
-        u"Vendredi",
-        u"Samedi",
-    ]
-    dot_chart.show_legend = False
-    dates = date_to_chart(profile.get_posts())
-    for i in range(0, 24):
-        dot_chart.add(str(i) + " h", dates[(i + 1) % 24])
-    img_path = os.path.join(settings.MEDIA_ROOT, "pygal")
-    if not os.path.isdir(img_path):
-        os.makedirs(img_path, mode=0o777)
-    fchart = os.path.join(img_path, "mod-{}.svg".format(str(usr.pk)))
-    dot_chart.render_to_file(fchart)
     my_articles = Article.objects.filter(sha_public__isnull=False).order_by(
         "-pubdate").filter(authors__in=[usr]).all()
     my_tutorials = \
@@ -122,16 +95,10 @@ def details(request, user_name):
         .filter(authors__in=[usr]) \
         .order_by("-pubdate"
                   ).all()
-    my_topics = Topic.objects.filter(author__pk=usr.pk).order_by("-pubdate"
-                                                                 ).all()
-    tops = []
-    for top in my_topics:
-        if not top.forum.can_read(request.user):
-            continue
-        else:
-            tops.append(top)
-            if len(tops) >= 5:
-                break
+    tops = Topic.objects\
+        .filter(author__pk=usr.pk,
+                forum__in=get_readable_forums(request.user))\
+        .order_by("-pubdate")[:5]
     form = OldTutoForm(profile)
     oldtutos = []
     if profile.sdz_tutorial:
@@ -152,6 +119,47 @@ def details(request, user_name):
     })
 
 
+@login_required
+def activity_chart(request, user_name):
+    """Chart of the posts of a member by period, for the moderators.
+
+    The SVG is only rendered again when the counters changed, and the browser
+    is told when its copy is still the right one.
+
+    """
+    if not request.user.has_perm("member.change_profile"):
+        raise PermissionDenied
+    usr = get_object_or_404(User, username=user_name)
+    dates = get_post_activity(usr)
+    etag = '"{0}"'.format(sha1(repr(dates)).hexdigest())
+    if request.META.get("HTTP_IF_NONE_MATCH") == etag:
+        response = HttpResponseNotModified()
+    else:
+        key = "member-activity-chart-{0}-{1}".format(usr.pk, etag.strip('"'))
+        svg = cache.get(key)
+        if svg is None:
+            dot_chart = pygal.Dot(x_label_rotation=30)
+            dot_chart.title = u"Messages postés par période"
+            dot_chart.x_labels = [
+                u"Dimanche",
+                u"Lundi",
+                u"Mardi",
+                u"Mercredi",
+                u"Jeudi",
+                u"Vendredi",
+                u"Samedi",
+            ]
+            dot_chart.show_legend = False
+            for i in range(0, 24):
+                dot_chart.add(str(i) + " h", dates[(i + 1) % 24])
+            svg = dot_chart.render()
+            cache.set(key, svg)
+        response = HttpResponse(svg, content_type="image/svg+xml")
+    response["ETag"] = etag
+    response["Cache-Control"] = "private"
+    return response
+
+
 @can_write_and_read_now
 @login_required
 @transaction.atomic
@@ -189,14 +197,14 @@ def modify_profile(request, user_pk):
                             minutes=0, seconds=0)
             detail = (u'Vous ne pouvez plus vous connecter sur ZesteDeSavoir '
                 u'pendant {0} jours.'.format(request.POST["ban-jrs"]))
-            logout_user(profile.user.username)
+            logout_user(profile.user)
 
         if "ban" in request.POST:
             ban.type = u"Ban définitif"
             ban.text = request.POST["ban-text"]
             profile.can_read = False
             detail = u"vous ne pouvez plus vous connecter sur ZesteDeSavoir."
-            logout_user(profile.user.username)
+            logout_user(profile.user)
         if "un-ls" in request.POST:
             ban.type = u"Autorisation d'écrire"
             ban.text = request.POST["unls-text"]
@@ -818,18 +826,6 @@ def get_client_ip(request):
         return "0.0.0.0"
 
 
-def date_to_chart(posts):
-    lst = 24 * [0]
-    for i in range(len(lst)):
-        lst[i] = 7 * [0]
-    for post in posts:
-        t = post.pubdate.timetuple()
-        lst[t.tm_hour][(t.tm_wday + 1) % 7] = lst[t.tm_hour][(t.tm_wday + 1)
-                                                             % 7] + 1
-    return lst
-
-
-
 @login_required
 @require_POST
 def add_oldtuto(request):
@@ -1,6 +1,17 @@
 import datetime
+import time
+
+from django.conf import settings
+
+from zds.member.models import Profile
 from zds.member.views import get_client_ip
 
+
+# Time of the last visit written for the session, so that the profile is
+# neither loaded nor written by the other requests.
+LAST_VISIT_SESSION_KEY = 'last_visit'
+
+
 class SetLastVisitMiddleware(object):
 
     def process_response(self, request, response):
@@ -14,15 +25,13 @@ class SetLastVisitMiddleware(object):
             user = None
 
         if user is not None:
-            profile = request.user.profile
-            if profile.last_visit is None:
-                profile.last_visit = datetime.datetime.now()
-                profile.last_ip_address = get_client_ip(request)
-                profile.save()
-            else:
-                duration = datetime.datetime.now() - profile.last_visit
-                if duration.seconds > 600:
-                    profile.last_visit = datetime.datetime.now()
-                    profile.last_ip_address = get_client_ip(request)
-                    profile.save()
+            now = time.time()
+            last_visit = request.session.get(LAST_VISIT_SESSION_KEY)
+            if last_visit is None \
+                    or now - last_visit > settings.LAST_VISIT_DELAY:
+                # Only these columns, not to overwrite a profile being edited
+                Profile.objects.filter(user=user).update(
+                    last_visit=datetime.datetime.fromtimestamp(now),
+                    last_ip_address=get_client_ip(request))
+                request.session[LAST_VISIT_SESSION_KEY] = now
         return response
@@ -0,0 +1,36 @@
+import logging
+import time
+
+from django.conf import settings
+
+
+logger = logging.getLogger('zds.timing')
+
+
+class TimingMiddleware(object):
+
+    """Measures the duration of each request, and which part of it renders
+    the templates (with zds.utils.render_template), the rest being spent in
+    the view and the other middlewares.
+
+    The durations are logged at the debug level by the zds.timing logger,
+    and sent in the X-Timing header in debug mode.
+
+    """
+
+    def process_request(self, request):
+        request.start_time = time.time()
+
+    def process_response(self, request, response):
+        start = getattr(request, 'start_time', None)
+        # A middleware before this one may have answered
+        if start is None:
+            return response
+        total = time.time() - start
+        template = getattr(request, 'template_time', 0)
+        timing = 'total={0:.1f}ms view={1:.1f}ms template={2:.1f}ms'.format(
+            total * 1000, (total - template) * 1000, template * 1000)
+        logger.debug('%s %s %s', request.method, request.path, timing)
+        if settings.DEBUG:
+            response['X-Timing'] = timing
+        return response
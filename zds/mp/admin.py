@@ -2,9 +2,12 @@
 
 from django.contrib import admin
 
-from .models import PrivatePost, PrivateTopic, PrivateTopicRead
+from .models import PrivateInbox, PrivatePost, PrivateTopic, \
+    PrivateTopicMember, PrivateTopicRead
 
 
 admin.site.register(PrivatePost)
 admin.site.register(PrivateTopic)
 admin.site.register(PrivateTopicRead)
+admin.site.register(PrivateTopicMember)
+admin.site.register(PrivateInbox)
@@ -1,8 +1,10 @@
 # coding: utf-8
 
+from django.db.models import F
 import factory
 
-from zds.mp.models import PrivateTopic, PrivatePost
+from zds.mp.models import PrivateTopic, PrivatePost, add_activity, \
+    add_members
 
 
 class PrivateTopicFactory(factory.DjangoModelFactory):
@@ -12,6 +14,13 @@ class PrivateTopicFactory(factory.DjangoModelFactory):
     subtitle = factory.Sequence(
         lambda n: 'Sous Titre du sujet No{0}'.format(n))
 
+    @classmethod
+    def _prepare(cls, create, **kwargs):
+        ptopic = super(PrivateTopicFactory, cls)._prepare(create, **kwargs)
+        if create:
+            add_members(ptopic, [ptopic.author], unread=False)
+        return ptopic
+
 
 class PrivatePostFactory(factory.DjangoModelFactory):
     FACTORY_FOR = PrivatePost
@@ -24,5 +33,9 @@ class PrivatePostFactory(factory.DjangoModelFactory):
         ptopic = kwargs.pop('privatetopic', None)
         if ptopic:
             ptopic.last_message = ppost
-            ptopic.save()
+            ptopic.save_but_counters()
+            PrivateTopic.objects.filter(pk=ptopic.pk).update(
+                post_count=F('post_count') + 1,
+                last_position=ppost.position_in_topic)
+            add_activity(ptopic, ppost)
         return ppost
@@ -1,13 +1,18 @@
 # coding: utf-8
 
 from django.conf import settings
-from django.db import models
+from django.db import IntegrityError, models, transaction
+from django.db.models import F
+from django.db.models.signals import m2m_changed, post_delete, post_save, \
+    pre_delete
 from zds.utils import slugify
 from math import ceil
 
 from django.contrib.auth.models import User
 
 from zds.utils import get_current_user
+from zds.utils.misc import forget_reader_navbar, get_fields_but_counters, \
+    invalidate_navbar
 from django.core.urlresolvers import reverse
 
 
@@ -30,10 +35,19 @@ class PrivateTopic(models.Model):
                                      verbose_name='Dernier message')
     pubdate = models.DateTimeField('Date de création', auto_now_add=True)
 
+    post_count = models.IntegerField('Nombre de messages', default=0)
+    last_position = models.IntegerField('Position du dernier message',
+                                        default=0)
+
     def __unicode__(self):
         """Textual form of a thread."""
         return self.title
 
+    def save_but_counters(self):
+        """Saves the private topic but its counters, which the new posts may
+        have changed since it was read."""
+        self.save(update_fields=get_fields_but_counters(self))
+
     def get_absolute_url(self):
         return reverse('zds.mp.views.topic',
                        kwargs={'topic_pk': self.pk,
@@ -41,7 +55,7 @@ class PrivateTopic(models.Model):
 
     def get_post_count(self):
         """Return the number of private posts in the private topic."""
-        return PrivatePost.objects.filter(privatetopic__pk=self.pk).count()
+        return self.post_count
 
     def get_last_answer(self):
         """Gets the last answer in the thread, if any."""
@@ -103,6 +117,9 @@ class PrivateTopic(models.Model):
 class PrivatePost(models.Model):
 
     """A private post written by an user."""
+    class Meta:
+        index_together = (('privatetopic', 'position_in_topic'),)
+
     privatetopic = models.ForeignKey(
         PrivateTopic,
         verbose_name='Message privé')
@@ -155,6 +172,154 @@ class PrivateTopicRead(models.Model):
                                                         self.privatepost.pk)
 
 
+class PrivateTopicMember(models.Model):
+
+    """Private topic in the inbox of one of its members, with the date of its
+    last message and whether the member has read it since."""
+    class Meta:
+        verbose_name = 'Conversation d\'un membre'
+        verbose_name_plural = 'Conversations des membres'
+        unique_together = (('privatetopic', 'user'),)
+        index_together = (('user', 'last_activity'),
+                          ('user', 'is_unread', 'last_activity'))
+
+    privatetopic = models.ForeignKey(PrivateTopic,
+                                     verbose_name='Message privé',
+                                     related_name='members')
+    user = models.ForeignKey(User, verbose_name='Membre',
+                             related_name='privatetopic_members')
+    last_activity = models.DateTimeField('Date du dernier message')
+    is_unread = models.BooleanField('Non lu', default=False)
+
+    def __unicode__(self):
+        return u'<Sujet "{0}" de {1}>'.format(self.privatetopic, self.user)
+
+
+class PrivateInbox(models.Model):
+
+    """Number of private topics a member hasn't read since their last
+    message."""
+    class Meta:
+        verbose_name = 'Messagerie privée'
+        verbose_name_plural = 'Messageries privées'
+
+    user = models.OneToOneField(User, primary_key=True,
+                                verbose_name='Membre',
+                                related_name='private_inbox')
+    unread_count = models.IntegerField('Messages privés non lus', default=0)
+
+    def __unicode__(self):
+        return u'<Messagerie de {0}>'.format(self.user)
+
+
+def count_unread(user_pk, delta):
+    """Changes the number of unread private topics of a member."""
+    if PrivateInbox.objects.filter(user=user_pk)\
+            .update(unread_count=F('unread_count') + delta) or delta < 0:
+        return
+    try:
+        with transaction.atomic():
+            PrivateInbox.objects.create(user_id=user_pk, unread_count=delta)
+    except IntegrityError:
+        # created meanwhile by another private topic
+        PrivateInbox.objects.filter(user=user_pk)\
+            .update(unread_count=F('unread_count') + delta)
+
+
+def get_unread_count(user):
+    """Number of unread private topics of a member, in a single row."""
+    return PrivateInbox.objects.filter(user=user)\
+        .values_list('unread_count', flat=True).first() or 0
+
+
+def add_members(privatetopic, users, unread=True):
+    """Puts a private topic in the inbox of the members joining it."""
+    if privatetopic.last_message_id:
+        last_activity = privatetopic.last_message.pubdate
+    else:
+        last_activity = privatetopic.pubdate
+    for user in users:
+        try:
+            with transaction.atomic():
+                PrivateTopicMember.objects.create(privatetopic=privatetopic,
+                                                  user=user,
+                                                  last_activity=last_activity,
+                                                  is_unread=unread)
+        except IntegrityError:
+            # already a member
+            continue
+        if unread:
+            count_unread(user.pk, 1)
+
+
+def remove_member(privatetopic, user):
+    """Takes a private topic out of the inbox of a member leaving it."""
+    PrivateTopicMember.objects\
+        .filter(privatetopic=privatetopic, user=user)\
+        .delete()
+
+
+def add_activity(privatetopic, post):
+    """Moves a private topic with a new message to the top of the inboxes of
+    its members, unread by all of them but its author."""
+    members = PrivateTopicMember.objects.filter(privatetopic=privatetopic)
+    members.update(last_activity=post.pubdate)
+    for user_pk in members.filter(is_unread=False)\
+            .exclude(user=post.author_id)\
+            .values_list('user', flat=True):
+        # only counted once if another message is added at the same time
+        if members.filter(user=user_pk, is_unread=False)\
+                .update(is_unread=True):
+            count_unread(user_pk, 1)
+
+
+def forget_unread_member(sender, instance, **kwargs):
+    """Uncounts the unread private topic a member leaves, or which is
+    deleted."""
+    if instance.is_unread:
+        count_unread(instance.user_id, -1)
+
+
+post_delete.connect(forget_unread_member, sender=PrivateTopicMember)
+
+
+def privatetopic_members(privatetopic):
+    return [privatetopic.author_id] + \
+        list(privatetopic.participants.values_list('pk', flat=True))
+
+
+def forget_participants_navbar(sender, instance, **kwargs):
+    """Forget the private messages of the participants of a private topic
+    which has a new post, or is deleted. The views saving a post in a
+    transaction forget them again once it is committed."""
+    if isinstance(instance, PrivatePost):
+        if not kwargs.get('created') or kwargs.get('raw'):
+            return
+        instance = instance.privatetopic
+    invalidate_navbar(privatetopic_members(instance))
+
+
+def forget_new_participants_navbar(sender, instance, action, reverse, pk_set,
+                                   **kwargs):
+    """Forget the private messages of the participants added to or removed
+    from a private topic."""
+    if reverse:
+        invalidate_navbar([instance.pk])
+    elif action in ('post_add', 'post_remove'):
+        invalidate_navbar(privatetopic_members(instance) + list(pk_set))
+    elif action == 'pre_clear':
+        invalidate_navbar(privatetopic_members(instance))
+
+
+for model in (PrivateTopicRead, PrivateTopicMember):
+    post_save.connect(forget_reader_navbar, sender=model)
+    post_delete.connect(forget_reader_navbar, sender=model)
+post_save.connect(forget_participants_navbar, sender=PrivatePost)
+pre_delete.connect(forget_participants_navbar, sender=PrivateTopic)
+m2m_changed.connect(forget_new_participants_navbar,
+                    sender=PrivateTopic.participants.through)
+
+
 def never_privateread(privatetopic, user=None):
     """Check if a private topic has been read by an user since it last post was
     added."""
@@ -177,6 +342,11 @@ def mark_read(privatetopic):
         privatetopic=privatetopic,
         user=get_current_user())
     t.save()
+    if PrivateTopicMember.objects\
+            .filter(privatetopic=privatetopic, user=get_current_user(),
+                    is_unread=True)\
+            .update(is_unread=False):
+        count_unread(get_current_user().pk, -1)
 
 
 def get_last_privatetopics():
@@ -7,8 +7,10 @@ from django.test import TestCase
 from zds import settings
 from zds.member.factories import ProfileFactory, StaffProfileFactory
 from zds.mp.factories import PrivateTopicFactory, PrivatePostFactory
-from zds.mp.models import PrivateTopic, PrivatePost
+from zds.mp.models import PrivateTopic, PrivatePost, PrivateTopicMember, \
+    PrivateTopicRead, add_members, get_unread_count
 from zds.utils import slugify
+from zds.utils.models import QueuedMail
 
 
 class MPTests(TestCase):
@@ -101,7 +103,7 @@ class MPTests(TestCase):
         self.assertEqual(ptopic.last_message, ppost)
 
         # check email has been sent
-        self.assertEquals(len(mail.outbox), 2)
+        self.assertEquals(QueuedMail.objects.count(), 2)
 
         # check view authorisations
         user4 = ProfileFactory().user
@@ -147,6 +149,79 @@ class MPTests(TestCase):
             follow=True)
         self.assertNotEqual(result.status_code, 200)
 
+    def test_answer_mail_queue(self):
+        """The notifications of the answers to a private topic are queued."""
+        user2 = ProfileFactory().user
+        profile = user2.profile
+        profile.email_for_answer = True
+        profile.save()
+        ptopic = PrivateTopicFactory(author=self.user1)
+        ptopic.participants.add(user2)
+        add_members(ptopic, [user2])
+        ppost = PrivatePostFactory(privatetopic=ptopic, author=self.user1,
+                                   position_in_topic=1)
+        PrivateTopicRead(privatetopic=ptopic, privatepost=ppost,
+                         user=user2).save()
+
+        result = self.client.post(
+            reverse('zds.mp.views.answer') + '?sujet={0}'.format(ptopic.pk),
+            {'text': u'Une réponse', 'last_post': ppost.pk})
+        self.assertEqual(result.status_code, 302)
+
+        # nothing is sent during the request
+        self.assertEquals(len(mail.outbox), 0)
+        self.assertEqual(list(QueuedMail.objects.values_list('to', flat=True)),
+                         [user2.email])
+
+    def test_inbox(self):
+        """The inboxes of the members follow the private topics."""
+        user2 = ProfileFactory().user
+        user3 = ProfileFactory().user
+        self.client.post(reverse('zds.mp.views.new'), {
+            'participants': user2.username,
+            'title': u'Boîte de réception',
+            'subtitle': u'',
+            'text': u'Premier message'})
+        ptopic = PrivateTopic.objects.get()
+        self.assertEqual(
+            set(PrivateTopicMember.objects.values_list('user', 'is_unread')),
+            set([(self.user1.pk, False), (user2.pk, True)]))
+        self.assertEqual(get_unread_count(self.user1), 0)
+        self.assertEqual(get_unread_count(user2), 1)
+
+        result = self.client.get(reverse('zds.mp.views.index'))
+        self.assertEqual(result.context['privatetopics'], [ptopic])
+        self.assertEqual(result.context['unread_privatetopics'], set())
+
+        # reading and answering
+        self.client.login(username=user2.username, password='hostel77')
+        self.client.get(ptopic.get_absolute_url())
+        self.assertEqual(get_unread_count(user2), 0)
+        self.client.post(
+            reverse('zds.mp.views.answer') + '?sujet={0}'.format(ptopic.pk),
+            {'text': u'Une réponse', 'last_post': ptopic.last_message_id})
+        self.assertEqual(get_unread_count(self.user1), 1)
+        self.assertEqual(get_unread_count(user2), 0)
+        member = PrivateTopicMember.objects.get(user=self.user1)
+        self.assertEqual(member.last_activity,
+                         PrivateTopic.objects.get().last_message.pubdate)
+
+        # joining and leaving
+        self.client.post(reverse('zds.mp.views.add_participant'), {
+            'topic_pk': ptopic.pk,
+            'user_pk': user3.username})
+        self.assertEqual(get_unread_count(user3), 1)
+        self.client.login(username=user3.username, password='hostel77')
+        self.client.post(reverse('zds.mp.views.leave'), {
+            'leave': 1,
+            'topic_pk': ptopic.pk})
+        self.assertEqual(get_unread_count(user3), 0)
+        self.assertFalse(PrivateTopicMember.objects.filter(user=user3)
+                         .exists())
+
+        result = self.client.get(reverse('zds.mp.views.index'))
+        self.assertEqual(result.context['privatetopics'], [])
+
     def test_edit_mp_post(self):
         """To test all aspects of the edition of simple mp post by member."""
 
@@ -192,7 +267,7 @@ class MPTests(TestCase):
             u"C\'est tout simplement l\'histoire de la ville de Paris que je voudrais vous conter ")
 
         # check no email has been sent
-        self.assertEquals(len(mail.outbox), 0)
+        self.assertEquals(QueuedMail.objects.count(), 0)
 
         # i can edit a mp if it's not last
         result = self.client.post(
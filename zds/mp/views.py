@@ -7,11 +7,10 @@ from django.contrib import messages
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth.models import User
 from django.core.exceptions import PermissionDenied
-from django.core.mail import EmailMultiAlternatives
+from django.core.mail import EmailMultiAlternatives, get_connection
 from django.core.paginator import Paginator, PageNotAnInteger, EmptyPage
 from django.core.urlresolvers import reverse
 from django.db import transaction
-from django.db.models import Q
 from django.http import Http404
 from django.shortcuts import redirect, get_object_or_404
 from django.template import Context
@@ -19,13 +18,16 @@ from django.template.loader import get_template
 from django.views.decorators.http import require_POST
 
 from zds.utils import render_template, slugify
+from zds.utils.messages import prepare_messages
+from zds.utils.misc import allocate_position, invalidate_navbar
 from zds.utils.mps import send_mp
-from zds.utils.paginator import paginator_range
+from zds.utils.paginator import paginator_range, seek_page
 from zds.utils.templatetags.emarkdown import emarkdown
 
 from .forms import PrivateTopicForm, PrivatePostForm
-from .models import PrivateTopic, PrivatePost, \
-    never_privateread, mark_read, PrivateTopicRead
+from .models import PrivateTopic, PrivatePost, PrivateTopicMember, \
+    never_privateread, mark_read, PrivateTopicRead, add_activity, \
+    add_members, remove_member, privatetopic_members
 
 
 
@@ -44,17 +46,23 @@ def index(request):
                 elif request.user == topic.author:
                     topic.author = topic.participants.all()[0]
                     topic.participants.remove(topic.participants.all()[0])
-                    topic.save()
+                    topic.save_but_counters()
+                    remove_member(topic, request.user)
                 else:
                     topic.participants.remove(request.user)
-                    topic.save()
+                    topic.save_but_counters()
+                    remove_member(topic, request.user)
 
-    privatetopics = PrivateTopic.objects\
-        .filter(Q(participants__in=[request.user]) | Q(author=request.user))\
-        .distinct().order_by('-last_message__pubdate').all()
+    # The inbox of the member, in the order of the last messages
+    members = PrivateTopicMember.objects\
+        .filter(user=request.user)\
+        .order_by('-last_activity')\
+        .select_related('privatetopic__author__profile',
+                        'privatetopic__last_message__author__profile')\
+        .prefetch_related('privatetopic__participants__profile')
 
     # Paginator
-    paginator = Paginator(privatetopics, settings.TOPICS_PER_PAGE)
+    paginator = Paginator(members, settings.TOPICS_PER_PAGE)
     page = request.GET.get('page')
 
     try:
@@ -67,8 +75,18 @@ def index(request):
         shown_privatetopics = paginator.page(paginator.num_pages)
         page = paginator.num_pages
 
+    privatetopics = []
+    for member in shown_privatetopics:
+        if member.privatetopic.last_message is not None:
+            member.privatetopic.last_message.privatetopic = \
+                member.privatetopic
+        privatetopics.append(member.privatetopic)
+
     return render_template('mp/index.html', {
-        'privatetopics': shown_privatetopics,
+        'privatetopics': privatetopics,
+        'unread_privatetopics': set(member.privatetopic_id
+                                    for member in shown_privatetopics
+                                    if member.is_unread),
         'pages': paginator_range(page, paginator.num_pages), 'nb': page
     })
 
@@ -94,35 +112,22 @@ def topic(request, topic_pk, topic_slug):
             mark_read(g_topic)
 
     posts = PrivatePost.objects.filter(privatetopic__pk=g_topic.pk)\
-        .order_by('position_in_topic')\
-        .all()
-
-    last_post_pk = g_topic.last_message.pk
+        .select_related('author__profile')
 
-    # Handle pagination
-    paginator = Paginator(posts, settings.POSTS_PER_PAGE)
+    last_post_pk = g_topic.last_message_id
 
     try:
         page_nbr = int(request.GET['page'])
     except KeyError:
         page_nbr = 1
 
+    # Retrieve the posts of the page, with the last post of the previous page
     try:
-        posts = paginator.page(page_nbr)
-    except PageNotAnInteger:
-        posts = paginator.page(1)
+        res, num_pages = seek_page(posts, page_nbr, g_topic.last_position,
+                                   field='position_in_topic')
     except EmptyPage:
         raise Http404
-
-    res = []
-    if page_nbr != 1:
-        # Show the last post of the previous page
-        last_page = paginator.page(page_nbr - 1).object_list
-        last_post = (last_page)[len(last_page) - 1]
-        res.append(last_post)
-
-    for post in posts:
-        res.append(post)
+    res = prepare_messages(res, request.user)
 
     # Build form to add an answer for the current topid.
     form = PrivatePostForm(g_topic, request.user)
@@ -130,7 +135,7 @@ def topic(request, topic_pk, topic_slug):
     return render_template('mp/topic/index.html', {
         'topic': g_topic,
         'posts': res,
-        'pages': paginator_range(page_nbr, paginator.num_pages),
+        'pages': paginator_range(page_nbr, num_pages),
         'nb': page_nbr,
         'last_post_pk': last_post_pk,
         'form': form
@@ -229,7 +234,8 @@ def edit(request):
         u = get_object_or_404(User, username=request.POST['username'])
         if not authenticated_user == u:
             g_topic.participants.add(u)
-            g_topic.save()
+            g_topic.save_but_counters()
+            add_members(g_topic, [u])
 
     return redirect(u'{}?page={}'.format(g_topic.get_absolute_url(), page))
 
@@ -281,11 +287,17 @@ def answer(request):
                 post.text = data['text']
                 post.text_html = emarkdown(data['text'])
                 post.pubdate = datetime.now()
-                post.position_in_topic = g_topic.get_post_count() + 1
-                post.save()
 
-                g_topic.last_message = post
-                g_topic.save()
+                # the counters of the topic stay locked until the commit, so
+                # the notifications are queued after it
+                with transaction.atomic():
+                    post.position_in_topic = allocate_position(g_topic)
+                    post.save()
+
+                    g_topic.last_message = post
+                    g_topic.save_but_counters()
+                    add_activity(g_topic, post)
+                invalidate_navbar(privatetopic_members(g_topic))
 
                 # send email
                 subject = "ZDS - MP: " + g_topic.title
@@ -293,6 +305,7 @@ def answer(request):
                 parts = list(g_topic.participants.all())
                 parts.append(g_topic.author)
                 parts.remove(request.user)
+                mails = []
                 for part in parts:
                     profile = part.profile
                     if profile.email_for_answer:
@@ -324,7 +337,9 @@ def answer(request):
                                 subject, message_txt, from_email, [
                                     part.email])
                             msg.attach_alternative(message_html, "text/html")
-                            msg.send()
+                            mails.append(msg)
+                get_connection('zds.utils.mailqueue.QueuedEmailBackend')\
+                    .send_messages(mails)
 
                 return redirect(post.get_absolute_url())
             else:
@@ -448,10 +463,12 @@ def leave(request):
             move = ptopic.participants.first()
             ptopic.author = move
             ptopic.participants.remove(move)
-            ptopic.save()
+            ptopic.save_but_counters()
+            remove_member(ptopic, request.user)
         else:
             ptopic.participants.remove(request.user)
-            ptopic.save()
+            ptopic.save_but_counters()
+            remove_member(ptopic, request.user)
 
         messages.success(
             request, 'Vous avez quitté la conversation avec succès.')
@@ -474,7 +491,8 @@ def add_participant(request):
                 u'à la conversation y est déjà')
         else:
             ptopic.participants.add(part)
-            ptopic.save()
+            ptopic.save_but_counters()
+            add_members(ptopic, [part])
 
             messages.success(
                 request,
@@ -1,11 +1,23 @@
 # coding: utf-8
 
+import gzip
+import os
+import shutil
+import tempfile
+
 from django.conf import settings
 from django.core import mail
+from django.core.cache import get_cache
 from django.core.urlresolvers import reverse
 from django.test import TestCase
 
+from zds.forum.factories import CategoryFactory, ForumFactory, \
+    PostFactory, TopicFactory
 from zds.member.factories import ProfileFactory, StaffProfileFactory
+from zds import utils
+from zds.pages import views as pages_views
+from zds.utils import misc, sitemaps
+from zds.utils.sitemaps import SITEMAP_LOCK_KEY, generate_sitemaps
 
 
 class PagesMemberTests(TestCase):
@@ -30,6 +42,64 @@ class PagesMemberTests(TestCase):
         # Check username in new MP page
         self.assertEqual(result.status_code, 200)
 
+    def test_sitemap(self):
+        """Test: the sitemap is split in files and only the changed ones are
+        written again."""
+        user = ProfileFactory().user
+        category = CategoryFactory(position=1)
+        forum = ForumFactory(category=category, position_in_category=1)
+        topics = []
+        for i in range(3):
+            topic = TopicFactory(forum=forum, author=user)
+            PostFactory(topic=topic, author=user, position=1)
+            topics.append(topic)
+        locked = TopicFactory(forum=forum, author=user, is_locked=True)
+        PostFactory(topic=locked, author=user, position=1)
+
+        root = tempfile.mkdtemp()
+        default_cache = sitemaps.cache
+        sitemaps.cache = get_cache(
+            'django.core.cache.backends.locmem.LocMemCache')
+        try:
+            with self.settings(SITEMAP_ROOT=root, SITEMAP_MAX_URLS=2):
+                # not generated while another request does it
+                sitemaps.cache.add(SITEMAP_LOCK_KEY, True)
+                self.assertEqual(self.client.get('/sitemap.xml').status_code,
+                                 404)
+                sitemaps.cache.delete(SITEMAP_LOCK_KEY)
+
+                result = self.client.get('/sitemap.xml')
+                self.assertEqual(result.status_code, 200)
+                index = ''.join(result.streaming_content)
+                filenames = set('sitemap-topics-{0}.xml.gz'
+                                .format((topic.pk - 1) // 2)
+                                for topic in topics)
+                for filename in filenames:
+                    self.assertIn(filename, index)
+
+                content = ''
+                for filename in filenames:
+                    result = self.client.get('/' + filename)
+                    self.assertEqual(result.status_code, 200)
+                    content += gzip.open(os.path.join(root, filename)).read()
+                for topic in topics:
+                    self.assertIn(settings.SITE_URL + topic.get_absolute_url(),
+                                  content)
+                self.assertNotIn(locked.get_absolute_url(), content)
+                self.assertIn(forum.get_absolute_url(), gzip.open(
+                    os.path.join(root, 'sitemap-forums-0.xml.gz')).read())
+
+                self.assertEqual(generate_sitemaps()[0], 0)
+                PostFactory(topic=topics[-1], author=user, position=2)
+                self.assertEqual(generate_sitemaps()[0], 1)
+
+                self.assertEqual(
+                    self.client.get('/sitemap-topics-99.xml.gz').status_code,
+                    404)
+        finally:
+            sitemaps.cache = default_cache
+            shutil.rmtree(root)
+
     def test_url_eula(self):
         """Test: check that eula page is alive."""
 
@@ -206,6 +276,72 @@ class PagesGuestTests(TestCase):
         # Check username in new MP page
         self.assertEqual(result.status_code, 200)
 
+    def test_home_cache(self):
+        """Test: the home page is cached for guests until a publication."""
+        default_cache = pages_views.cache
+        cache = get_cache('django.core.cache.backends.locmem.LocMemCache')
+        pages_views.cache = misc.cache = cache
+        try:
+            result = self.client.get(reverse('zds.pages.views.home'))
+            self.assertEqual(result.status_code, 200)
+
+            with self.assertNumQueries(0):
+                cached = self.client.get(reverse('zds.pages.views.home'))
+            self.assertEqual(cached.status_code, 200)
+            self.assertEqual(cached.content, result.content)
+
+            # the quote is chosen again for each visitor
+            self.assertNotIn(pages_views.QUOTE_MARKER, result.content)
+            quotes = pages_views.QUOTES
+            pages_views.QUOTES = ['Une citation & une autre']
+            try:
+                self.assertEqual(
+                    pages_views.fill_quote('<p><!-- quote --></p>'),
+                    '<p>Une citation &amp; une autre</p>')
+            finally:
+                pages_views.QUOTES = quotes
+
+            misc.invalidate_home_cache('tutorials')
+            self.assertIsNone(cache.get(misc.HOME_CACHE_KEY))
+            self.assertIsNone(
+                cache.get(misc.get_home_fragment_key('tutorials')))
+            self.assertIsNotNone(
+                cache.get(misc.get_home_fragment_key('articles')))
+        finally:
+            pages_views.cache = misc.cache = default_cache
+
+    def test_git_version(self):
+        """Test: the version of the site is read once per process."""
+        reads = []
+
+        def read_git_version():
+            reads.append(None)
+            return {'name': 'master/0123456', 'url': ''}
+
+        default_read = utils.read_git_version
+        utils.read_git_version = read_git_version
+        utils._git_version = None
+        try:
+            for i in range(2):
+                result = self.client.get(reverse('zds.pages.views.eula'))
+                self.assertEqual(result.status_code, 200)
+                self.assertIn('master/0123456', result.content)
+            self.assertEqual(len(reads), 1)
+        finally:
+            utils.read_git_version = default_read
+            utils._git_version = None
+
+    def test_timing(self):
+        """Test: the durations of the request are given in debug mode."""
+        with self.settings(DEBUG=True):
+            result = self.client.get(reverse('zds.pages.views.eula'))
+        self.assertRegexpMatches(
+            result['X-Timing'],
+            r'^total=[0-9.]+ms view=[0-9.-]+ms template=[0-9.]+ms$')
+        self.assertFalse(
+            self.client.get(reverse('zds.pages.views.eula'))
+            .has_header('X-Timing'))
+
     def test_url_eula(self):
         """Test: check that eula page is alive."""
 
@@ -5,28 +5,63 @@ import random
 from django.contrib import messages
 
 from django.contrib.auth.decorators import login_required
-from django.contrib.auth.models import Group, User
+from django.contrib.auth.models import AnonymousUser, Group, User
+from django.core.cache import cache
 from django.core.exceptions import PermissionDenied
 from django.core.mail import EmailMultiAlternatives
 from django.core.urlresolvers import reverse
+from django.http import Http404, HttpResponse, StreamingHttpResponse
 from django.template import Context
 from django.template.loader import get_template
+from django.utils.html import conditional_escape
+from django.utils.safestring import mark_safe
 from zds import settings
 
 from zds.article.models import get_last_articles
-from zds.forum.models import get_last_topics
+from zds.forum.models import get_last_topics, get_readable_forums
 from zds.member.decorator import can_write_and_read_now
 from zds.pages.forms import AssocSubscribeForm
 from zds.settings import SITE_ROOT
 from zds.tutorial.models import get_last_tutorials
 from zds.utils import render_template, slugify
+from zds.utils.downloads import read_chunks
+from zds.utils.misc import HOME_CACHE_KEY, get_home_fragment_key
 from zds.utils.models import Alert
+from zds.utils.sitemaps import SITEMAP_INDEX, get_sitemap_path
 
 
 
-def home(request):
-    """Display the home page with last topics added."""
+def load_quotes():
+    """Reads the quotes shown on the home page."""
+    try:
+        with open(os.path.join(SITE_ROOT, 'quotes.txt'), 'r') as fh:
+            return [quote for quote in fh.readlines() if quote.strip()]
+    except IOError:
+        return []
+
+
+QUOTES = load_quotes()
+
+# Put in the cached home page instead of the quote, chosen again for each
+# visitor.
+QUOTE_MARKER = u'<!-- quote -->'
+
+
+def choose_quote():
+    if QUOTES:
+        return random.choice(QUOTES)
+    return u'Zeste de Savoir, la connaissance pour tous et sans pépins !'
+
+
+def fill_quote(content):
+    """Puts a new quote in a home page rendered with the marker."""
+    return content.replace(QUOTE_MARKER.encode('utf-8'),
+                           conditional_escape(choose_quote()).encode('utf-8'))
+
 
+def get_home_tutorials():
+    """The data of the last published tutorials, as shown on the home
+    page."""
     tutos = []
     for tuto in get_last_tutorials():
         data = tuto.load_json_for_public()
@@ -44,19 +79,59 @@ def home(request):
                     data['title'])])
 
         tutos.append(data)
+    return tutos
 
-    try:
-        with open(os.path.join(SITE_ROOT, 'quotes.txt'), 'r') as fh:
-            quote = random.choice(fh.readlines())
-    except:
-        quote = u'Zeste de Savoir, la connaissance pour tous et sans pépins !'
-
-    return render_template('home.html', {
-        'last_topics': get_last_topics(request.user),
-        'last_tutorials': tutos,
-        'last_articles': get_last_articles(),
-        'quote': quote,
+
+def get_home_articles():
+    """The last published articles, with their reactions counted."""
+    articles = list(get_last_articles())
+    for article in articles:
+        article.reaction_count = article.get_reaction_count()
+    return articles
+
+
+def get_home_fragment(fragment, compute):
+    key = get_home_fragment_key(fragment)
+    value = cache.get(key)
+    if value is None:
+        value = compute()
+        cache.set(key, value, settings.HOME_CACHE_TIMEOUT)
+    return value
+
+
+def home(request):
+    """Display the home page with last topics added.
+
+    The page is cached as a whole for anonymous visitors, but its quote, and
+    its parts for members.
+
+    """
+    anonymous = not request.user.is_authenticated() \
+        and not messages.get_messages(request)
+    if anonymous:
+        content = cache.get(HOME_CACHE_KEY)
+        if content is not None:
+            return HttpResponse(fill_quote(content))
+
+    # the last topics of the public forums are shared by most visitors
+    guest = AnonymousUser()
+    if get_readable_forums(request.user) == get_readable_forums(guest):
+        last_topics = get_home_fragment(
+            'topics', lambda: list(get_last_topics(guest)))
+    else:
+        last_topics = get_last_topics(request.user)
+
+    response = render_template('home.html', {
+        'last_topics': last_topics,
+        'last_tutorials': get_home_fragment('tutorials', get_home_tutorials),
+        'last_articles': get_home_fragment('articles', get_home_articles),
+        'quote': mark_safe(QUOTE_MARKER) if anonymous else choose_quote(),
     })
+    if anonymous:
+        cache.set(HOME_CACHE_KEY, response.content,
+                  settings.HOME_CACHE_TIMEOUT)
+        response.content = fill_quote(response.content)
+    return response
 
 
 
@@ -155,3 +230,15 @@ def alerts(request):
     return render_template('pages/alerts.html', {
         'alerts': alerts,
     })
+
+
+def sitemap(request, filename=SITEMAP_INDEX):
+    """Index or file of the sitemap, written by the generate_sitemaps
+    command (or here when they are too old) and read by chunks."""
+    content_type = 'application/xml' if filename == SITEMAP_INDEX \
+        else 'application/x-gzip'
+    try:
+        fh = open(get_sitemap_path(filename), 'rb')
+    except IOError:
+        raise Http404
+    return StreamingHttpResponse(read_chunks(fh), content_type=content_type)
@@ -113,6 +113,7 @@ FILE_UPLOAD_HANDLERS = (
 )
 
 MIDDLEWARE_CLASSES = (
+    'zds.middlewares.TimingMiddleware.TimingMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -177,6 +178,7 @@ INSTALLED_APPS = (
     'zds.forum',
     'zds.tutorial',
     'zds.member',
+    'zds.benchmarks',
     # Uncomment the next line to enable the admin:
     'django.contrib.admin',
     # Uncomment the next line to enable admin documentation:
@@ -205,6 +207,10 @@ LOGGING = {
             'level': 'ERROR',
             'filters': ['require_debug_false'],
             'class': 'django.utils.log.AdminEmailHandler'
+        },
+        'console': {
+            'level': 'DEBUG',
+            'class': 'logging.StreamHandler'
         }
     },
     'loggers': {
@@ -213,6 +219,11 @@ LOGGING = {
             'level': 'ERROR',
             'propagate': True,
         },
+        # Set the level to DEBUG to log the duration of each request
+        'zds.timing': {
+            'handlers': ['console'],
+            'level': 'WARNING',
+        },
     }
 }
 
@@ -243,6 +254,8 @@ IMAGE_MAX_SIZE = 1024 * 1024 * 2
 REPO_PATH = os.path.join(SITE_ROOT, 'tutoriels-private')
 REPO_PATH_PROD = os.path.join(SITE_ROOT, 'tutoriels-public')
 REPO_ARTICLE_PATH = os.path.join(SITE_ROOT, 'articles-data')
+# Number of git trees whose blobs are kept in memory by each process
+GIT_BLOB_INDEX_SIZE = 32
 
 # Constants for pagination
 POSTS_PER_PAGE = 21
@@ -261,6 +274,25 @@ PANDOC_LOC = ''
 PANDOC_LOG = './pandoc.log'
 PANDOC_LOG_STATE = False
 
+# Validated tutorials are published by the publish_tutorials command (run it
+# from cron), converting their files with TUTORIAL_PUBLICATION_PROCESSES
+# processes. Set TUTORIAL_PUBLICATION_ASYNC to False to publish them during
+# the validation request. A publication still running after
+# TUTORIAL_PUBLICATION_TIMEOUT seconds is considered as failed.
+TUTORIAL_PUBLICATION_ASYNC = True
+TUTORIAL_PUBLICATION_PROCESSES = 4
+TUTORIAL_PUBLICATION_TIMEOUT = 60 * 60
+
+# Reduced versions of the images of the galleries, by name: (max width, max
+# height). They are made by the generate_image_derivatives command (run it
+# from cron) with GALLERY_DERIVATIVES_PROCESSES processes, or when they are
+# first asked.
+GALLERY_IMAGE_SIZES = {
+    'thumb': (128, 128),
+    'medium': (400, 300),
+}
+GALLERY_DERIVATIVES_PROCESSES = 4
+
 HAYSTACK_CONNECTIONS = {
     'default': {
         'ENGINE': 'haystack.backends.solr_backend.SolrEngine',
@@ -270,6 +302,20 @@ HAYSTACK_CONNECTIONS = {
     },
 }
 
+# The objects saved or deleted are queued, then sent to the search engine by
+# batches of SEARCH_INDEX_BATCH_SIZE objects by the update_search_index
+# command (run it with --every, or from cron).
+HAYSTACK_SIGNAL_PROCESSOR = 'zds.utils.search_signals.QueuedSignalProcessor'
+SEARCH_INDEX_BATCH_SIZE = 500
+
+# The sitemap is written in SITEMAP_ROOT by the generate_sitemaps command (run
+# it from cron), in gzipped files of at most SITEMAP_MAX_URLS URLs of which
+# only the changed ones are written again. It is also written when it is
+# asked and older than SITEMAP_TIMEOUT seconds.
+SITEMAP_ROOT = os.path.join(SITE_ROOT, 'sitemaps')
+SITEMAP_MAX_URLS = 50000
+SITEMAP_TIMEOUT = 60 * 60 * 24
+
 GEOIP_PATH = os.path.join(SITE_ROOT, 'geodata')
 
 from django.contrib.messages import constants as message_constants
@@ -283,10 +329,45 @@ MESSAGE_TAGS = {
 
 
 MAX_POST_LENGTH = 1000000
+
+# Markdown rendering: number of parsers kept for each mode, and texts longer
+# than MARKDOWN_CACHE_MAX_LENGTH characters are rendered without the cache.
+MARKDOWN_POOL_SIZE = 8
+MARKDOWN_CACHE_MAX_LENGTH = 10000
+MARKDOWN_CACHE_TIMEOUT = 60 * 60 * 24
+
+# Duration of the cached home page and of its parts, which are also forgotten
+# when contents are published and messages posted.
+HOME_CACHE_TIMEOUT = 60 * 15
+
+# Duration of the cached menus, private messages, notifications and alerts of
+# the navigation bar, which are also forgotten when they change.
+NAVBAR_CACHE_TIMEOUT = 60 * 60
+
+# The last visit and IP address of a member are written at most once in this
+# number of seconds for each of his sessions.
+LAST_VISIT_DELAY = 60 * 10
+
+# Downloads are sent by chunks of DOWNLOAD_CHUNK_SIZE bytes. Set
+# DOWNLOAD_SENDFILE to 'X-Sendfile' (Apache, lighttpd) to let the web server
+# send the files, or to 'X-Accel-Redirect' (nginx) with
+# DOWNLOAD_ACCEL_REDIRECT mapping their directories to internal locations.
+DOWNLOAD_CHUNK_SIZE = 64 * 1024
+DOWNLOAD_SENDFILE = None
+DOWNLOAD_ACCEL_REDIRECT = {}
 SDZ_TUTO_DIR = ''
 
 MAIL_CA_ASSO = 'ca-zeste-de-savoir@googlegroups.com'
 
+# The notifications of answers and private messages are stored in the
+# database and sent by the send_queued_mails command (run it from cron), with
+# MAIL_QUEUE_BACKEND. A mail which can't be sent is tried again after
+# MAIL_QUEUE_RETRY_DELAY seconds, twice as long after each failure.
+MAIL_QUEUE_BACKEND = 'django.core.mail.backends.smtp.EmailBackend'
+MAIL_QUEUE_BATCH_SIZE = 100
+MAIL_QUEUE_RETRY_DELAY = 60
+MAIL_QUEUE_MAX_ATTEMPTS = 8
+
 # CAREFUL! THIS EMAIL ADRESS SHOULD NOT BE CHANGED
 # WITHOUT THE APPROVAL OF THE ASSOCIATION COMMITEE
 MAIL_NOREPLY = 'noreply@zestedesavoir.com'
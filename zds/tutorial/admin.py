@@ -2,7 +2,8 @@
 
 from django.contrib import admin
 
-from .models import Tutorial, Part, Chapter, Extract, Validation, Note
+from .models import Tutorial, Part, Chapter, Extract, Validation, Note, \
+    Publication
 
 
 admin.site.register(Tutorial)
@@ -11,3 +12,4 @@ admin.site.register(Chapter)
 admin.site.register(Extract)
 admin.site.register(Validation)
 admin.site.register(Note)
+admin.site.register(Publication)
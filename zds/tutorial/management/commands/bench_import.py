@@ -0,0 +1,60 @@
+# coding: utf-8
+
+from optparse import make_option
+import os
+import shutil
+import tempfile
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import CommandError, NoArgsCommand
+from django.test.client import RequestFactory
+from django.test.utils import override_settings
+
+from zds.benchmarks.utils import QueryTimer, rolled_back
+from zds.tutorial.views import import_content
+
+
+FIXTURES = ('temps-reel-avec-irrlicht',
+            'securisez-vos-mots-de-passe-avec-lastpass')
+
+
+class Command(NoArgsCommand):
+    help = u'Measure the duration and the number of queries of the import ' \
+        u'of the tutorials in fixtures/tuto. Nothing is kept.'
+
+    option_list = NoArgsCommand.option_list + (
+        make_option('--user', dest='user', default=None,
+                    help=u'Username of the author of the imported tutorials '
+                    u'(the first user by default)'),
+    )
+
+    def handle_noargs(self, **options):
+        if options['user']:
+            user = User.objects.filter(username=options['user']).first()
+        else:
+            user = User.objects.order_by('pk').first()
+        if user is None:
+            raise CommandError(u'Aucun utilisateur pour importer les '
+                               u'tutoriels')
+        request = RequestFactory().post('/')
+        request.user = user
+
+        tmp = tempfile.mkdtemp()
+        try:
+            with override_settings(REPO_PATH=os.path.join(tmp, 'tutoriels'),
+                                   MEDIA_ROOT=os.path.join(tmp, 'media')):
+                for name in FIXTURES:
+                    self.bench(request, name)
+        finally:
+            shutil.rmtree(tmp)
+
+    def bench(self, request, name):
+        fixture = os.path.join(settings.SITE_ROOT, 'fixtures', 'tuto', name)
+        tuto = os.path.join(fixture, name + '.tuto')
+        images = os.path.join(fixture, 'images.zip')
+        with rolled_back():
+            with QueryTimer() as timer:
+                import_content(request, tuto, images, None)
+        self.stdout.write(u'{0} : {1:.2f} s, {2} requêtes'.format(
+            name, timer.elapsed, len(timer)))
@@ -0,0 +1,36 @@
+# coding: utf-8
+
+from datetime import datetime
+
+from django.core.management.base import NoArgsCommand
+
+from zds.tutorial.models import Publication, fail_stale_publications
+from zds.tutorial.views import publish
+
+
+class Command(NoArgsCommand):
+    help = u'Publish the validated tutorials waiting for their publication.'
+
+    def handle_noargs(self, **options):
+        stale = fail_stale_publications()
+        if stale:
+            self.stdout.write(u'{0} publication(s) interrompue(s)'
+                              .format(stale))
+
+        for publication in Publication.objects.filter(status='PENDING')\
+                .order_by('pk'):
+
+            # Claim the publication, in case another worker runs at the same
+            # time
+            claimed = Publication.objects\
+                .filter(pk=publication.pk, status='PENDING')\
+                .update(status='RUNNING', date_start=datetime.now())
+            if not claimed:
+                continue
+
+            tutorial = publication.validation.tutorial
+            if publish(publication):
+                self.stdout.write(u'{0} : publié'.format(tutorial.title))
+            else:
+                self.stdout.write(u'{0} : échec de la publication'.format(
+                    tutorial.title))
@@ -1,19 +1,25 @@
 # coding: utf-8
 
+from datetime import datetime, timedelta
 from math import ceil
 import json
 import os
 
 from django.conf import settings
 from django.contrib.auth.models import User
+from django.core.cache import cache
 from django.core.urlresolvers import reverse
 from django.db import models
+from django.db.models import Q
+from django.db.models.signals import m2m_changed, post_delete, post_save
 from django.utils import timezone
 from git.repo import Repo
 
 from zds.gallery.models import Image, Gallery
 from zds.utils import slugify, get_current_user
-from zds.utils.models import SubCategory, Licence, Comment
+from zds.utils.misc import TUTORIAL_MENU_CACHE_KEY, get_unread_pks
+from zds.utils.models import Category, CategorySubCategory, SubCategory, \
+    Licence, Comment
 from zds.utils.tutorials import get_blob, export_tutorial
 
 
@@ -29,6 +35,13 @@ STATUS_CHOICES = (
     ('REJECT', 'Rejeté'),
 )
 
+PUBLICATION_STATUS_CHOICES = (
+    ('PENDING', 'En attente'),
+    ('RUNNING', 'En cours'),
+    ('DONE', 'Terminée'),
+    ('FAILED', 'Échouée'),
+)
+
 
 class Tutorial(models.Model):
 
@@ -163,11 +176,38 @@ class Tutorial(models.Model):
                     self.pk) + '_' + self.slug)
 
     def get_prod_path(self):
-        data = self.load_json_for_public()
+        data = self.get_public_manifest()[1]
         return os.path.join(
             settings.REPO_PATH_PROD,
             str(self.pk) + '_' + slugify(data['title']))
 
+    def get_public_manifest(self):
+        """Returns the manifest of the public version, as text and parsed.
+
+        A commit never changes, so the manifest is kept in the cache for each
+        public sha, and on the instance for the current request. The parsed
+        manifest is shared and must not be modified.
+
+        """
+        memo = getattr(self, '_public_manifest', None)
+        if memo is not None and memo[0] == self.sha_public:
+            return memo[1:]
+
+        manifest = None
+        if self.sha_public is not None:
+            key = get_public_manifest_key(self.pk, self.sha_public)
+            manifest = cache.get(key)
+        if manifest is None:
+            repo = Repo(self.get_path())
+            manifest = get_blob(repo.commit(self.sha_public).tree,
+                                'manifest.json')
+            if self.sha_public is not None:
+                cache.set(key, manifest, None)
+
+        self._public_manifest = (self.sha_public, manifest,
+                                 json.loads(manifest))
+        return self._public_manifest[1:]
+
     def load_dic(self, mandata):
         mandata['get_absolute_url_online'] = self.get_absolute_url_online()
         mandata['get_absolute_url'] = self.get_absolute_url()
@@ -185,9 +225,7 @@ class Tutorial(models.Model):
         return mandata
 
     def load_json_for_public(self):
-        repo = Repo(self.get_path())
-        mantuto = get_blob(repo.commit(self.sha_public).tree, 'manifest.json')
-        data = json.loads(mantuto)
+        data = json.loads(self.get_public_manifest()[0])
 
         return data
 
@@ -320,6 +358,10 @@ class Tutorial(models.Model):
         return False
 
 
+def get_public_manifest_key(tutorial_pk, sha):
+    return 'tutorial-manifest-{0}-{1}'.format(tutorial_pk, sha)
+
+
 def get_last_tutorials():
     tutorials = Tutorial.objects.all()\
         .exclude(sha_public__isnull=True)\
@@ -384,6 +426,16 @@ def never_read(tutorial, user=None):
         .count() == 0
 
 
+def get_unread_tutorials(tutorials, user=None):
+    """Returns the pks of the tutorials which have been never read by the
+    user since their last note was added."""
+    if user is None:
+        user = get_current_user()
+
+    return get_unread_pks(TutorialRead, tutorials, user,
+                          'tutorial', 'note', 'last_note')
+
+
 def mark_read(tutorial):
     """Mark a tutorial as read for the user."""
     if tutorial.last_note is not None:
@@ -900,3 +952,74 @@ class Validation(models.Model):
 
     def is_reject(self):
         return self.status == 'REJECT'
+
+    def get_publication(self):
+        """Returns the last publication of this version, if any."""
+        return self.publications.order_by('pk').last()
+
+
+class Publication(models.Model):
+
+    """Publication of a validated version, run by the publish_tutorials
+    command."""
+    class Meta:
+        verbose_name = 'Publication'
+        verbose_name_plural = 'Publications'
+
+    validation = models.ForeignKey(Validation,
+                                   verbose_name='Validation',
+                                   related_name='publications')
+    is_major = models.BooleanField('Version majeure', default=False)
+    status = models.CharField(
+        max_length=10,
+        choices=PUBLICATION_STATUS_CHOICES,
+        default='PENDING',
+        db_index=True)
+    progress = models.IntegerField('Avancement', default=0)
+    step = models.CharField('Étape', max_length=80, blank=True)
+    log = models.TextField('Journal', blank=True)
+    date_creation = models.DateTimeField('Date de création',
+                                         auto_now_add=True)
+    date_start = models.DateTimeField('Date de début', blank=True, null=True)
+    date_end = models.DateTimeField('Date de fin', blank=True, null=True)
+
+    def __unicode__(self):
+        return u'{0} ({1})'.format(self.validation.tutorial.title,
+                                   self.get_status_display())
+
+    def is_finished(self):
+        return self.status in ('DONE', 'FAILED')
+
+    def is_failed(self):
+        return self.status == 'FAILED'
+
+    def set_progress(self, progress, step):
+        """Saves the progress without touching the other fields."""
+        self.progress = progress
+        self.step = step
+        Publication.objects.filter(pk=self.pk).update(progress=progress,
+                                                      step=step)
+
+
+def fail_stale_publications():
+    """Marks as failed the publications running for longer than
+    TUTORIAL_PUBLICATION_TIMEOUT, whose worker has probably been stopped, so
+    the tutorials can be validated again. Returns their number."""
+    limit = datetime.now() - \
+        timedelta(seconds=settings.TUTORIAL_PUBLICATION_TIMEOUT)
+    return Publication.objects\
+        .filter(Q(date_start__lt=limit)
+                | Q(date_start__isnull=True, date_creation__lt=limit),
+                status='RUNNING')\
+        .update(status='FAILED', step=u'Interrompue', date_end=datetime.now())
+
+
+def forget_tutorial_menu(sender, **kwargs):
+    """Forget the categories of the published tutorials in the navbar."""
+    cache.delete(TUTORIAL_MENU_CACHE_KEY)
+
+
+for model in (Tutorial, Category, SubCategory, CategorySubCategory):
+    post_save.connect(forget_tutorial_menu, sender=model)
+    post_delete.connect(forget_tutorial_menu, sender=model)
+m2m_changed.connect(forget_tutorial_menu, sender=Tutorial.subcategory.through)
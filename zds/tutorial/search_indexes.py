@@ -1,6 +1,7 @@
 # coding: utf-8
 
 from django.db.models import Q
+from django.utils.html import strip_tags
 
 from haystack import indexes
 
@@ -21,6 +22,19 @@ class TutorialIndex(indexes.SearchIndex, indexes.Indexable):
         """Only tutorials online."""
         return self.get_model().objects.filter(sha_public__isnull=False)
 
+    def get_related_updates(self, pks):
+        """Parts, chapters and extracts of the tutorials, which are indexed
+        from their published version too."""
+        parts = Part.objects.filter(tutorial__in=pks)
+        chapters = Chapter.objects.filter(Q(tutorial__in=pks)
+                                          | Q(part__tutorial__in=pks))
+        extracts = Extract.objects\
+            .filter(Q(chapter__tutorial__in=pks)
+                    | Q(chapter__part__tutorial__in=pks))
+        return [(Part, set(parts.values_list('pk', flat=True))),
+                (Chapter, set(chapters.values_list('pk', flat=True))),
+                (Extract, set(extracts.values_list('pk', flat=True)))]
+
 
 class PartIndex(indexes.SearchIndex, indexes.Indexable):
     text = indexes.CharField(document=True, use_template=True)
@@ -56,11 +70,15 @@ class ExtractIndex(indexes.SearchIndex, indexes.Indexable):
     text = indexes.CharField(document=True, use_template=True)
     title = indexes.CharField(model_attr='title')
     chapter = indexes.CharField(model_attr='chapter')
-    txt = indexes.CharField(model_attr='text')
+    txt = indexes.CharField()
 
     def get_model(self):
         return Extract
 
+    def prepare_txt(self, obj):
+        """Text of the published version, without HTML."""
+        return strip_tags(obj.get_text_online() or u'')
+
     def index_queryset(self, using=None):
         """Only extracts online."""
         return self.get_model() .objects.filter(Q(chapter__tutorial__sha_public__isnull=False)
@@ -1,21 +1,26 @@
 # coding: utf-8
 
+from datetime import datetime, timedelta
 import os
 import shutil
 
 from django.conf import settings
-from django.core import mail
+from django.core.management import call_command
 from django.core.urlresolvers import reverse
 from django.test import TestCase
 from django.test.utils import override_settings
+from git import Repo
 
 from zds.member.factories import ProfileFactory, StaffProfileFactory
 from zds.mp.models import PrivateTopic
 from zds.settings import SITE_ROOT
 from zds.tutorial.factories import BigTutorialFactory, MiniTutorialFactory, PartFactory, \
     ChapterFactory, NoteFactory
-from zds.tutorial.models import Note, Tutorial, Validation
-from zds.utils.models import Alert
+from zds.tutorial import models as tutorial_models
+from zds.tutorial.models import Note, Tutorial, Validation, Publication, \
+    Extract
+from zds.utils.models import Alert, QueuedMail
+from zds.utils.tutorials import get_blob, get_blob_index
 
 
 @override_settings(MEDIA_ROOT=os.path.join(SITE_ROOT, 'media-test'))
@@ -28,6 +33,7 @@ from zds.utils.models import Alert
     REPO_ARTICLE_PATH=os.path.join(
         SITE_ROOT,
         'articles-data-test'))
+@override_settings(TUTORIAL_PUBLICATION_ASYNC=False)
 class BigTutorialTests(TestCase):
 
     def setUp(self):
@@ -108,9 +114,163 @@ class BigTutorialTests(TestCase):
             },
             follow=False)
         self.assertEqual(pub.status_code, 302)
-        self.assertEquals(len(mail.outbox), 1)
+        self.assertEquals(QueuedMail.objects.count(), 1)
+
+        QueuedMail.objects.all().delete()
+
+    def test_get_blob(self):
+        """Test the reading of the files of a version of the tutorial."""
+        repo = Repo(self.bigtuto.get_path())
+        tree = repo.commit(self.bigtuto.sha_draft).tree
+
+        # every file of the commit is found, at any depth
+        for item in tree.traverse():
+            if item.type == 'blob':
+                self.assertEqual(
+                    get_blob(tree, item.path),
+                    item.data_stream.read().decode('utf-8'))
+        self.assertEqual(get_blob(tree, './manifest.json'),
+                         get_blob(tree, 'manifest.json'))
+        self.assertIsNone(get_blob(tree, 'nothing.md'))
+
+        # the tree is read only once
+        self.assertIs(get_blob_index(tree),
+                      get_blob_index(repo.commit(self.bigtuto.sha_draft).tree))
+
+    def test_public_manifest(self):
+        """Test that the public manifest is read once per request."""
+        opened = []
+
+        class CountingRepo(Repo):
+
+            def __init__(self, *args, **kwargs):
+                opened.append(args)
+                super(CountingRepo, self).__init__(*args, **kwargs)
+
+        tutorial_models.Repo = CountingRepo
+        try:
+            tuto = Tutorial.objects.get(pk=self.bigtuto.pk)
+            with self.assertNumQueries(0):
+                for i in range(10):
+                    tuto.get_prod_path()
+                    tuto.load_json_for_public()
+            self.assertLessEqual(len(opened), 1)
+
+            # the manifest given to the views can be modified freely
+            tuto.load_json_for_public()['title'] = u'Autre titre'
+            self.assertNotEqual(tuto.load_json_for_public()['title'],
+                                u'Autre titre')
+
+            del opened[:]
+            result = self.client.get(
+                reverse(
+                    'zds.tutorial.views.view_tutorial_online',
+                    args=[
+                        self.bigtuto.pk,
+                        self.bigtuto.slug]),
+                follow=True)
+            self.assertEqual(result.status_code, 200)
+            self.assertLessEqual(len(opened), 1)
+        finally:
+            tutorial_models.Repo = Repo
+
+    def test_publication_queue(self):
+        """Test that validated tutorials are published by the command."""
+        bigtuto = BigTutorialFactory()
+        bigtuto.authors.add(self.user_author)
+        bigtuto.save()
+        PartFactory(tutorial=bigtuto, position_in_tutorial=1)
+
+        # ask, reserve and validate the tutorial
+        pub = self.client.post(
+            reverse('zds.tutorial.views.ask_validation'),
+            {
+                'tutorial': bigtuto.pk,
+                'text': u'Ce tuto est excellent',
+                'version': bigtuto.sha_draft
+            },
+            follow=False)
+        self.assertEqual(pub.status_code, 302)
+        validation = Validation.objects.get(tutorial__pk=bigtuto.pk)
+        pub = self.client.get(
+            reverse('zds.tutorial.views.reservation', args=[validation.pk]),
+            follow=False)
+        self.assertEqual(pub.status_code, 302)
+        with self.settings(TUTORIAL_PUBLICATION_ASYNC=True):
+            pub = self.client.post(
+                reverse('zds.tutorial.views.valid_tutorial'),
+                {
+                    'tutorial': bigtuto.pk,
+                    'text': u'Ce tuto est excellent',
+                    'is_major': True
+                },
+                follow=False)
+        self.assertEqual(pub.status_code, 302)
 
-        mail.outbox = []
+        # nothing is published during the request
+        publication = Publication.objects.get(validation=validation)
+        self.assertEqual(publication.status, 'PENDING')
+        self.assertIsNone(Tutorial.objects.get(pk=bigtuto.pk).sha_public)
+        self.assertEquals(QueuedMail.objects.count(), 0)
+        result = self.client.get(
+            reverse('zds.tutorial.views.list_validation'))
+        self.assertContains(result, u'Publication : 0 %')
+
+        call_command('publish_tutorials')
+        publication = Publication.objects.get(pk=publication.pk)
+        self.assertEqual(publication.status, 'DONE')
+        self.assertEqual(publication.progress, 100)
+        self.assertEqual(Validation.objects.get(pk=validation.pk).status,
+                         'ACCEPT')
+        self.assertEqual(Tutorial.objects.get(pk=bigtuto.pk).sha_public,
+                         validation.version)
+        self.assertEquals(QueuedMail.objects.count(), 1)
+
+    def test_stale_publication(self):
+        """Test that a publication whose worker stopped doesn't prevent the
+        tutorial from being validated again."""
+        bigtuto = BigTutorialFactory()
+        bigtuto.authors.add(self.user_author)
+        bigtuto.save()
+        PartFactory(tutorial=bigtuto, position_in_tutorial=1)
+        self.client.post(
+            reverse('zds.tutorial.views.ask_validation'),
+            {
+                'tutorial': bigtuto.pk,
+                'text': u'Ce tuto est excellent',
+                'version': bigtuto.sha_draft
+            },
+            follow=False)
+        validation = Validation.objects.get(tutorial__pk=bigtuto.pk)
+        self.client.get(
+            reverse('zds.tutorial.views.reservation', args=[validation.pk]),
+            follow=False)
+        running = Publication.objects.create(validation=validation,
+                                             status='RUNNING',
+                                             date_start=datetime.now())
+
+        def validate():
+            with self.settings(TUTORIAL_PUBLICATION_ASYNC=True):
+                self.client.post(
+                    reverse('zds.tutorial.views.valid_tutorial'),
+                    {
+                        'tutorial': bigtuto.pk,
+                        'text': u'Ce tuto est excellent',
+                    },
+                    follow=False)
+
+        # a running publication is waited for
+        validate()
+        self.assertEqual(Publication.objects.count(), 1)
+
+        # but not after TUTORIAL_PUBLICATION_TIMEOUT
+        Publication.objects.filter(pk=running.pk).update(
+            date_start=datetime.now() - timedelta(
+                seconds=settings.TUTORIAL_PUBLICATION_TIMEOUT + 1))
+        validate()
+        self.assertEqual(Publication.objects.get(pk=running.pk).status,
+                         'FAILED')
+        self.assertEqual(validation.get_publication().status, 'PENDING')
 
     def test_add_note(self):
         """To test add note for tutorial."""
@@ -384,6 +544,19 @@ class BigTutorialTests(TestCase):
 
         self.assertEqual(Tutorial.objects.all().count(), 2)
 
+        # the whole tutorial is imported in a single commit
+        tuto = Tutorial.objects.exclude(pk=self.bigtuto.pk).get()
+        repo = Repo(tuto.get_path())
+        self.assertEqual(len(list(repo.iter_commits())), 1)
+        self.assertEqual(repo.head.commit.hexsha, tuto.sha_draft)
+        tree = repo.commit(tuto.sha_draft).tree
+        self.assertIsNotNone(get_blob(tree, "manifest.json"))
+        extracts = Extract.objects.filter(
+            chapter__part__tutorial=tuto)
+        self.assertTrue(extracts.count() > 0)
+        for extract in extracts:
+            self.assertIsNotNone(get_blob(tree, extract.text))
+
     def test_url_for_guest(self):
         """Test simple get request by guest."""
 
@@ -698,7 +871,7 @@ class BigTutorialTests(TestCase):
             PrivateTopic.objects.filter(
                 author=self.user).count(),
             1)
-        self.assertEquals(len(mail.outbox), 0)
+        self.assertEquals(QueuedMail.objects.count(), 0)
 
     def tearDown(self):
         if os.path.isdir(settings.REPO_PATH):
@@ -721,6 +894,7 @@ class BigTutorialTests(TestCase):
     REPO_ARTICLE_PATH=os.path.join(
         SITE_ROOT,
         'articles-data-test'))
+@override_settings(TUTORIAL_PUBLICATION_ASYNC=False)
 class MiniTutorialTests(TestCase):
 
     def setUp(self):
@@ -778,9 +952,9 @@ class MiniTutorialTests(TestCase):
             },
             follow=False)
         self.assertEqual(pub.status_code, 302)
-        self.assertEquals(len(mail.outbox), 1)
+        self.assertEquals(QueuedMail.objects.count(), 1)
 
-        mail.outbox = []
+        QueuedMail.objects.all().delete()
 
     def test_add_note(self):
         """To test add note for tutorial."""
@@ -1216,7 +1390,7 @@ class MiniTutorialTests(TestCase):
             PrivateTopic.objects.filter(
                 author=self.user).count(),
             1)
-        self.assertEquals(len(mail.outbox), 0)
+        self.assertEquals(QueuedMail.objects.count(), 0)
 
     def tearDown(self):
         if os.path.isdir(settings.REPO_PATH):
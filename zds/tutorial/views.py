@@ -2,6 +2,8 @@
 # -*- coding: utf-8 -*-
 from collections import OrderedDict
 from datetime import datetime
+from itertools import imap
+from multiprocessing import Pool
 from operator import attrgetter
 from urllib import urlretrieve
 from urlparse import urlparse
@@ -9,6 +11,8 @@ import json
 import os.path
 import re
 import shutil
+import subprocess
+import traceback
 import zipfile
 
 from PIL import Image as ImagePIL
@@ -16,9 +20,10 @@ from django.conf import settings
 from django.contrib import messages
 from django.contrib.auth.decorators import login_required, permission_required
 from django.contrib.auth.models import User
+from django.core.cache import cache
 from django.core.exceptions import PermissionDenied
 from django.core.files import File
-from django.core.paginator import Paginator, PageNotAnInteger, EmptyPage
+from django.core.paginator import EmptyPage
 from django.core.urlresolvers import reverse
 from django.db import transaction
 from django.db.models import Q
@@ -32,19 +37,23 @@ from lxml import etree
 from forms import TutorialForm, PartForm, ChapterForm, EmbdedChapterForm, \
     ExtractForm, ImportForm, NoteForm, AskValidationForm, ValidForm, RejectForm
 from models import Tutorial, Part, Chapter, Extract, Validation, never_read, \
-    mark_read, Note
+    mark_read, Note, Publication, get_public_manifest_key, \
+    fail_stale_publications
 from zds.gallery.models import Gallery, UserGallery, Image
 from zds.member.decorator import can_write_and_read_now
 from zds.member.models import get_info_old_tuto, Profile
 from zds.member.views import get_client_ip
 from zds.utils import render_template
 from zds.utils import slugify
+from zds.utils.downloads import serve_archive, serve_file
+from zds.utils.messages import prepare_messages
+from zds.utils.misc import invalidate_home_cache
 from zds.utils.models import Alert
 from zds.utils.models import Category, Licence, CommentLike, CommentDislike, \
     SubCategory
 from zds.utils.mps import send_mp
-from zds.utils.paginator import paginator_range
-from zds.utils.templatetags.emarkdown import emarkdown
+from zds.utils.paginator import paginator_range, seek_page
+from zds.utils.templatetags.emarkdown import emarkdown, get_markdown_instance
 from zds.utils.tutorials import get_blob, export_tutorial_to_md, move
 
 
@@ -139,6 +148,16 @@ def list_validation(request):
                                                         )).filter(tutorial__subcategory__in=[subcategory]) \
                 .order_by("date_proposition"
                           ).all()
+
+    # Last publication of each validation, for all of them at once.
+
+    validations = list(validations)
+    publications = dict((publication.validation_id, publication)
+                        for publication in Publication.objects
+                        .filter(validation__in=validations)
+                        .order_by("pk"))
+    for validation in validations:
+        validation.publication = publications.get(validation.pk)
     return render_template("tutorial/validation/index.html",
                            {"validations": validations})
 
@@ -325,50 +344,30 @@ def valid_tutorial(request):
         version=tutorial.sha_validation).latest("date_proposition")
 
     if request.user == validation.validator:
-        (output, err) = MEP(tutorial, tutorial.sha_validation)
-        messages.info(request, output)
-        messages.error(request, err)
+        fail_stale_publications()
+        publication = validation.get_publication()
+        if publication is not None and not publication.is_finished():
+            messages.error(request,
+                           u"La publication de ce tutoriel est déjà en cours.")
+            return redirect(tutorial.get_absolute_url() + "?version="
+                            + validation.version)
         validation.comment_validator = request.POST["text"]
-        validation.status = "ACCEPT"
-        validation.date_validation = datetime.now()
         validation.save()
 
-        # Update sha_public with the sha of validation. We don't update sha_draft.
-        # So, the user can continue to edit his tutorial in offline.
-
-        if request.POST.get('is_major', False) or tutorial.sha_public is None:
-            tutorial.pubdate = datetime.now()
-        tutorial.sha_public = validation.version
-        tutorial.sha_validation = None
-        tutorial.save()
-        messages.success(request, u"Le tutoriel a bien été validé.")
+        # The publication is done by the publish_tutorials command, the
+        # tutorial is public once it is finished.
 
-        # send feedback
-
-        for author in tutorial.authors.all():
-            msg = (
-                u'Félicitations **{0}** ! Ton zeste [{1}]({2}) '
-                u'a été publié par [{3}]({4}) ! Les lecteurs du monde entier '
-                u'peuvent venir l\'éplucher et réagir a son sujet. '
-                u'Je te conseille de rester a leur écoute afin '
-                u'd\'apporter des corrections/compléments.'
-                u'Un Tutoriel vivant et a jour est bien plus lu '
-                u'qu\'un sujet abandonné !'
-                .format(author.username,
-                        tutorial.title,
-                        tutorial.get_absolute_url_online(),
-                        validation.validator.username,
-                        settings.SITE_URL + validation.validator.profile.get_absolute_url()))
-            bot = get_object_or_404(User, username=settings.BOT_ACCOUNT)
-            send_mp(
-                bot,
-                [author],
-                u"Publication : {0}".format(tutorial.title),
-                "",
-                msg,
-                True,
-                direct=False,
-            )
+        publication = Publication.objects.create(
+            validation=validation,
+            is_major=bool(request.POST.get('is_major', False)))
+        if settings.TUTORIAL_PUBLICATION_ASYNC:
+            messages.success(request,
+                             u"Le tutoriel a bien été validé, "
+                             u"sa publication est en cours.")
+        elif publish(publication):
+            messages.success(request, u"Le tutoriel a bien été validé.")
+        else:
+            messages.error(request, u"La publication du tutoriel a échoué.")
         return redirect(tutorial.get_absolute_url() + "?version="
                         + validation.version)
     else:
@@ -379,6 +378,73 @@ def valid_tutorial(request):
                         + validation.version)
 
 
+def publish(publication):
+    """Runs a publication and makes its version the public one."""
+
+    validation = publication.validation
+    tutorial = validation.tutorial
+    publication.status = "RUNNING"
+    publication.date_start = datetime.now()
+    publication.save()
+    try:
+        (output, err) = MEP(tutorial, validation.version, publication)
+    except Exception:
+        publication.status = "FAILED"
+        publication.log += traceback.format_exc().decode("utf-8")
+        publication.date_end = datetime.now()
+        publication.save()
+        return False
+
+    validation.status = "ACCEPT"
+    validation.date_validation = datetime.now()
+    validation.save()
+
+    # Update sha_public with the sha of validation. We don't update sha_draft.
+    # So, the user can continue to edit his tutorial in offline.
+
+    if publication.is_major or tutorial.sha_public is None:
+        tutorial.pubdate = datetime.now()
+    tutorial.sha_public = validation.version
+    tutorial.sha_validation = None
+    tutorial.save()
+    invalidate_home_cache('tutorials')
+
+    publication.status = "DONE"
+    publication.progress = 100
+    if err:
+        publication.log += err
+    publication.date_end = datetime.now()
+    publication.save()
+
+    # send feedback
+
+    bot = User.objects.get(username=settings.BOT_ACCOUNT)
+    for author in tutorial.authors.all():
+        msg = (
+            u'Félicitations **{0}** ! Ton zeste [{1}]({2}) '
+            u'a été publié par [{3}]({4}) ! Les lecteurs du monde entier '
+            u'peuvent venir l\'éplucher et réagir a son sujet. '
+            u'Je te conseille de rester a leur écoute afin '
+            u'd\'apporter des corrections/compléments.'
+            u'Un Tutoriel vivant et a jour est bien plus lu '
+            u'qu\'un sujet abandonné !'
+            .format(author.username,
+                    tutorial.title,
+                    tutorial.get_absolute_url_online(),
+                    validation.validator.username,
+                    settings.SITE_URL + validation.validator.profile.get_absolute_url()))
+        send_mp(
+            bot,
+            [author],
+            u"Publication : {0}".format(tutorial.title),
+            "",
+            msg,
+            True,
+            direct=False,
+        )
+    return True
+
+
 @can_write_and_read_now
 @login_required
 @permission_required("tutorial.change_tutorial", raise_exception=True)
@@ -403,6 +469,7 @@ def invalid_tutorial(request, tutorial_pk):
     tutorial.sha_validation = validation.version
     tutorial.pubdate = None
     tutorial.save()
+    invalidate_home_cache('tutorials')
     messages.success(request, u"Le tutoriel a bien été dépublié.")
     return redirect(tutorial.get_absolute_url() + "?version="
                     + validation.version)
@@ -634,10 +701,11 @@ def view_tutorial(request, tutorial_pk, tutorial_slug):
     # Find the good manifest file
 
     repo = Repo(tutorial.get_path())
+    tree = repo.commit(sha).tree
 
     # Load the tutorial.
 
-    manifest = get_blob(repo.commit(sha).tree, "manifest.json")
+    manifest = get_blob(tree, "manifest.json")
     mandata = json.loads(manifest)
 
     # If it's a small tutorial, fetch its chapter
@@ -647,15 +715,13 @@ def view_tutorial(request, tutorial_pk, tutorial_slug):
             chapter = mandata["chapter"]
             chapter["path"] = tutorial.get_path()
             chapter["type"] = "MINI"
-            chapter["intro"] = get_blob(repo.commit(sha).tree,
-                                        "introduction.md")
-            chapter["conclu"] = get_blob(repo.commit(sha).tree, "conclusion.md"
-                                         )
+            chapter["intro"] = get_blob(tree, "introduction.md")
+            chapter["conclu"] = get_blob(tree, "conclusion.md")
             cpt = 1
             for ext in chapter["extracts"]:
                 ext["position_in_chapter"] = cpt
                 ext["path"] = tutorial.get_path()
-                ext["txt"] = get_blob(repo.commit(sha).tree, ext["text"])
+                ext["txt"] = get_blob(tree, ext["text"])
                 cpt += 1
         else:
             chapter = None
@@ -683,7 +749,7 @@ def view_tutorial(request, tutorial_pk, tutorial_slug):
                     ext["chapter"] = chapter
                     ext["position_in_chapter"] = cpt_e
                     ext["path"] = tutorial.get_path()
-                    ext["txt"] = get_blob(repo.commit(sha).tree, ext["text"])
+                    ext["txt"] = get_blob(tree, ext["text"])
                     cpt_e += 1
                 cpt_c += 1
             cpt_p += 1
@@ -798,39 +864,29 @@ def view_tutorial_online(request, tutorial_pk, tutorial_slug):
 
     # Find all notes of the tutorial.
 
-    notes = Note.objects.filter(tutorial__pk=tutorial.pk).order_by("position"
-                                                                   ).all()
+    notes = Note.objects.filter(tutorial__pk=tutorial.pk)\
+        .select_related("author__profile", "editor")
 
     # Retrieve pk of the last note. If there aren't notes for the tutorial, we
     # initialize this last note at 0.
 
     last_note_pk = 0
+    last_position = 0
     if tutorial.last_note:
         last_note_pk = tutorial.last_note.pk
+        last_position = tutorial.last_note.position
 
-    # Handle pagination
+    # Handle pagination, with the last note of the previous page
 
-    paginator = Paginator(notes, settings.POSTS_PER_PAGE)
     try:
         page_nbr = int(request.GET["page"])
     except KeyError:
         page_nbr = 1
     try:
-        notes = paginator.page(page_nbr)
-    except PageNotAnInteger:
-        notes = paginator.page(1)
+        res, num_pages = seek_page(notes, page_nbr, last_position)
     except EmptyPage:
         raise Http404
-    res = []
-    if page_nbr != 1:
-
-        # Show the last note of the previous page
-
-        last_page = paginator.page(page_nbr - 1).object_list
-        last_note = last_page[len(last_page) - 1]
-        res.append(last_note)
-    for note in notes:
-        res.append(note)
+    res = prepare_messages(res, request.user)
 
     # Build form to send a note for the current tutorial.
 
@@ -840,7 +896,7 @@ def view_tutorial_online(request, tutorial_pk, tutorial_slug):
         "chapter": chapter,
         "parts": parts,
         "notes": res,
-        "pages": paginator_range(page_nbr, paginator.num_pages),
+        "pages": paginator_range(page_nbr, num_pages),
         "nb": page_nbr,
         "last_note_pk": last_note_pk,
         "form": form,
@@ -1043,7 +1099,8 @@ def view_part(
     # find the good manifest file
 
     repo = Repo(tutorial.get_path())
-    manifest = get_blob(repo.commit(sha).tree, "manifest.json")
+    tree = repo.commit(sha).tree
+    manifest = get_blob(tree, "manifest.json")
     mandata = json.loads(manifest)
     parts = mandata["parts"]
     cpt_p = 1
@@ -1053,10 +1110,8 @@ def view_part(
             part["path"] = tutorial.get_path()
             part["slug"] = slugify(part["title"])
             part["position_in_tutorial"] = cpt_p
-            part["intro"] = get_blob(repo.commit(sha).tree, part["introduction"
-                                                                 ])
-            part["conclu"] = get_blob(repo.commit(sha).tree, part["conclusion"
-                                                                  ])
+            part["intro"] = get_blob(tree, part["introduction"])
+            part["conclu"] = get_blob(tree, part["conclusion"])
             cpt_c = 1
             for chapter in part["chapters"]:
                 chapter["part"] = part
@@ -1322,7 +1377,8 @@ def view_chapter(
     # find the good manifest file
 
     repo = Repo(tutorial.get_path())
-    manifest = get_blob(repo.commit(sha).tree, "manifest.json")
+    tree = repo.commit(sha).tree
+    manifest = get_blob(tree, "manifest.json")
     mandata = json.loads(manifest)
     parts = mandata["parts"]
     cpt_p = 1
@@ -1349,16 +1405,14 @@ def view_chapter(
             chapter["get_absolute_url"] = part["get_absolute_url"] \
                 + "{0}/".format(chapter["slug"])
             if chapter_slug == slugify(chapter["title"]):
-                chapter["intro"] = get_blob(repo.commit(sha).tree,
-                                            chapter["introduction"])
-                chapter["conclu"] = get_blob(repo.commit(sha).tree,
-                                             chapter["conclusion"])
+                chapter["intro"] = get_blob(tree, chapter["introduction"])
+                chapter["conclu"] = get_blob(tree, chapter["conclusion"])
                 cpt_e = 1
                 for ext in chapter["extracts"]:
                     ext["chapter"] = chapter
                     ext["position_in_chapter"] = cpt_e
                     ext["path"] = tutorial.get_path()
-                    ext["txt"] = get_blob(repo.commit(sha).tree, ext["text"])
+                    ext["txt"] = get_blob(tree, ext["text"])
                     cpt_e += 1
             chapter_tab.append(chapter)
             if chapter_slug == slugify(chapter["title"]):
@@ -1990,242 +2044,124 @@ def import_content(
     # add create date
 
     tutorial.create_at = datetime.now()
-    tree = etree.parse(tuto)
-    racine_big = tree.xpath("/bigtuto")
-    racine_mini = tree.xpath("/minituto")
-    if len(racine_big) > 0:
+    racine = etree.parse(tuto).getroot()
+    if racine.tag == "bigtuto":
 
         # it's a big tuto
 
         tutorial.type = "BIG"
-        tutorial_title = tree.xpath("/bigtuto/titre")[0]
-        tutorial_intro = tree.xpath("/bigtuto/introduction")[0]
-        tutorial_conclu = tree.xpath("/bigtuto/conclusion")[0]
-        tutorial.title = tutorial_title.text.strip()
-        tutorial.description = tutorial_title.text.strip()
-        tutorial.images = "images"
-        tutorial.introduction = "introduction.md"
-        tutorial.conclusion = "conclusion.md"
-
-        # Creating the gallery
-
-        gal = Gallery()
-        gal.title = tutorial_title.text
-        gal.slug = slugify(tutorial_title.text)
-        gal.pubdate = datetime.now()
-        gal.save()
-
-        # Attach user to gallery
-
-        userg = UserGallery()
-        userg.gallery = gal
-        userg.mode = "W"  # write mode
-        userg.user = request.user
-        userg.save()
-        tutorial.gallery = gal
-        tutorial.save()
-        tuto_path = os.path.join(settings.REPO_PATH, str(tutorial.pk) + "_"
-                                 + slugify(tutorial.title))
-        mapping = upload_images(images, tutorial)
-        maj_repo_tuto(
-            request,
-            new_slug_path=tuto_path,
-            tuto=tutorial,
-            introduction=replace_real_url(tutorial_intro.text, mapping),
-            conclusion=replace_real_url(tutorial_conclu.text, mapping),
-            action="add",
-        )
-        tutorial.authors.add(request.user)
-        part_count = 1
-        for partie in tree.xpath("/bigtuto/parties/partie"):
-            part_title = tree.xpath("/bigtuto/parties/partie["
-                                    + str(part_count) + "]/titre")[0]
-            part_intro = tree.xpath("/bigtuto/parties/partie["
-                                    + str(part_count) + "]/introduction")[0]
-            part_conclu = tree.xpath("/bigtuto/parties/partie["
-                                     + str(part_count) + "]/conclusion")[0]
+    elif racine.tag == "minituto":
+
+        # it's a mini tuto
+
+        tutorial.type = "MINI"
+    else:
+        return
+    tutorial_title = racine.find("titre").text
+    tutorial.title = tutorial_title.strip()
+    tutorial.description = tutorial_title.strip()
+    tutorial.images = "images"
+    tutorial.introduction = "introduction.md"
+    tutorial.conclusion = "conclusion.md"
+
+    # Creating the gallery
+
+    gal = Gallery()
+    gal.title = tutorial_title
+    gal.slug = slugify(tutorial_title)
+    gal.pubdate = datetime.now()
+    gal.save()
+
+    # Attach user to gallery
+
+    userg = UserGallery()
+    userg.gallery = gal
+    userg.mode = "W"  # write mode
+    userg.user = request.user
+    userg.save()
+    tutorial.gallery = gal
+    tutorial.save()
+    mapping = upload_images(images, tutorial)
+    tutorial.authors.add(request.user)
+
+    # The tree is walked once: the rows are created in bulk, one level after
+    # the other, and the files are kept to be committed at once.
+
+    files = OrderedDict()
+    files[tutorial.introduction] = replace_real_url(
+        racine.find("introduction").text, mapping)
+    files[tutorial.conclusion] = replace_real_url(
+        racine.find("conclusion").text, mapping)
+    if tutorial.type == "BIG":
+        parts = []
+        for (part_count, partie) in enumerate(
+                racine.iterfind("parties/partie"), 1):
             part = Part()
-            part.title = part_title.text.strip()
+            part.title = partie.find("titre").text.strip()
+            part.slug = slugify(part.title)
             part.position_in_tutorial = part_count
             part.tutorial = tutorial
-            part.introduction = os.path.join(slugify(part_title.text.strip()),
-                                             "introduction.md")
-            part.conclusion = os.path.join(slugify(part_title.text.strip()),
-                                           "conclusion.md")
-            part_path = os.path.join(os.path.join(settings.REPO_PATH,
-                                                  str(part.tutorial.pk) + "_"
-                                                  + part.tutorial.slug),
-                                     slugify(part.title))
-            part.save()
-            maj_repo_part(
-                request,
-                None,
-                part_path,
-                part,
-                replace_real_url(part_intro.text, mapping),
-                replace_real_url(part_conclu.text, mapping),
-                action="add",
-            )
-            chapter_count = 1
-            for chapitre in tree.xpath("/bigtuto/parties/partie["
-                                       + str(part_count)
-                                       + "]/chapitres/chapitre"):
-                chapter_title = tree.xpath(
-                    "/bigtuto/parties/partie[" +
-                    str(part_count) +
-                    "]/chapitres/chapitre[" +
-                    str(chapter_count) +
-                    "]/titre")[0]
-                chapter_intro = tree.xpath(
-                    "/bigtuto/parties/partie[" +
-                    str(part_count) +
-                    "]/chapitres/chapitre[" +
-                    str(chapter_count) +
-                    "]/introduction")[0]
-                chapter_conclu = tree.xpath(
-                    "/bigtuto/parties/partie[" +
-                    str(part_count) +
-                    "]/chapitres/chapitre[" +
-                    str(chapter_count) +
-                    "]/conclusion")[0]
+            part.introduction = os.path.join(part.slug, "introduction.md")
+            part.conclusion = os.path.join(part.slug, "conclusion.md")
+            files[part.introduction] = replace_real_url(
+                partie.find("introduction").text, mapping)
+            files[part.conclusion] = replace_real_url(
+                partie.find("conclusion").text, mapping)
+            parts.append((part, partie))
+        Part.objects.bulk_create([item[0] for item in parts])
+        saved_parts = dict((part.position_in_tutorial, part) for part
+                           in Part.objects.filter(tutorial=tutorial))
+        chapters = []
+        for (part, partie) in parts:
+            part = saved_parts[part.position_in_tutorial]
+            for (chapter_count, chapitre) in enumerate(
+                    partie.iterfind("chapitres/chapitre"), 1):
                 chapter = Chapter()
-                chapter.title = chapter_title.text.strip()
+                chapter.title = chapitre.find("titre").text.strip()
+                chapter.slug = slugify(chapter.title)
                 chapter.position_in_part = chapter_count
-                chapter.position_in_tutorial = part_count * chapter_count
+                chapter.position_in_tutorial = part.position_in_tutorial \
+                    * chapter_count
                 chapter.part = part
-                chapter.introduction = os.path.join(
-                    part.slug,
-                    os.path.join(
-                        slugify(
-                            chapter_title.text.strip()),
-                        "introduction.md"))
-                chapter.conclusion = os.path.join(
-                    part.slug,
-                    os.path.join(
-                        slugify(
-                            chapter_title.text.strip()),
-                        "conclusion.md"))
-                chapter_path = os.path.join(
-                    os.path.join(
-                        os.path.join(
-                            settings.REPO_PATH,
-                            str(
-                                chapter.part.tutorial.pk) +
-                            "_" +
-                            chapter.part.tutorial.slug),
-                        chapter.part.slug),
-                    slugify(
-                        chapter.title))
-                chapter.save()
-                maj_repo_chapter(
-                    request,
-                    new_slug_path=chapter_path,
-                    chapter=chapter,
-                    introduction=replace_real_url(chapter_intro.text,
-                                                  mapping),
-                    conclusion=replace_real_url(chapter_conclu.text, mapping),
-                    action="add",
-                )
-                extract_count = 1
-                for souspartie in tree.xpath("/bigtuto/parties/partie["
-                                             + str(part_count) + "]/chapitres/chapitre["
-                                             + str(chapter_count) + "]/sousparties/souspartie"):
-                    extract_title = tree.xpath(
-                        "/bigtuto/parties/partie[" +
-                        str(part_count) +
-                        "]/chapitres/chapitre[" +
-                        str(chapter_count) +
-                        "]/sousparties/souspartie[" +
-                        str(extract_count) +
-                        "]/titre")[0]
-                    extract_text = tree.xpath(
-                        "/bigtuto/parties/partie[" +
-                        str(part_count) +
-                        "]/chapitres/chapitre[" +
-                        str(chapter_count) +
-                        "]/sousparties/souspartie[" +
-                        str(extract_count) +
-                        "]/texte")[0]
-                    extract = Extract()
-                    extract.title = extract_title.text.strip()
-                    extract.position_in_chapter = extract_count
-                    extract.chapter = chapter
-                    extract.text = extract.get_path(relative=True)
-                    extract.save()
-                    maj_repo_extract(
-                        request,
-                        new_slug_path=extract.get_path(),
-                        extract=extract,
-                        text=replace_real_url(
-                            extract_text.text,
-                            mapping),
-                        action="add")
-                    extract_count += 1
-                chapter_count += 1
-            part_count += 1
-    elif len(racine_mini) > 0:
-
-        # it's a mini tuto
-
-        tutorial.type = "MINI"
-        tutorial_title = tree.xpath("/minituto/titre")[0]
-        tutorial_intro = tree.xpath("/minituto/introduction")[0]
-        tutorial_conclu = tree.xpath("/minituto/conclusion")[0]
-        tutorial.title = tutorial_title.text.strip()
-        tutorial.description = tutorial_title.text.strip()
-        tutorial.images = "images"
-        tutorial.introduction = "introduction.md"
-        tutorial.conclusion = "conclusion.md"
-
-        # Creating the gallery
-
-        gal = Gallery()
-        gal.title = tutorial_title.text
-        gal.slug = slugify(tutorial_title.text)
-        gal.pubdate = datetime.now()
-        gal.save()
-
-        # Attach user to gallery
-
-        userg = UserGallery()
-        userg.gallery = gal
-        userg.mode = "W"  # write mode
-        userg.user = request.user
-        userg.save()
-        tutorial.gallery = gal
-        tutorial.save()
-        tuto_path = os.path.join(settings.REPO_PATH, str(tutorial.pk) + "_"
-                                 + slugify(tutorial.title))
-        mapping = upload_images(images, tutorial)
-        maj_repo_tuto(
-            request,
-            new_slug_path=tuto_path,
-            tuto=tutorial,
-            introduction=replace_real_url(tutorial_intro.text, mapping),
-            conclusion=replace_real_url(tutorial_conclu.text, mapping),
-            action="add",
-        )
-        tutorial.authors.add(request.user)
+                chapter.introduction = os.path.join(part.slug, chapter.slug,
+                                                    "introduction.md")
+                chapter.conclusion = os.path.join(part.slug, chapter.slug,
+                                                  "conclusion.md")
+                files[chapter.introduction] = replace_real_url(
+                    chapitre.find("introduction").text, mapping)
+                files[chapter.conclusion] = replace_real_url(
+                    chapitre.find("conclusion").text, mapping)
+                chapters.append((chapter, chapitre))
+        Chapter.objects.bulk_create([item[0] for item in chapters])
+        saved_chapters = dict(((chapter.part_id, chapter.position_in_part),
+                               chapter) for chapter
+                              in Chapter.objects.filter(part__tutorial=tutorial)
+                              .select_related("part"))
+        souspartie_lists = []
+        for (chapter, chapitre) in chapters:
+            chapter = saved_chapters[(chapter.part.pk,
+                                      chapter.position_in_part)]
+            souspartie_lists.append(
+                (chapter, chapitre.iterfind("sousparties/souspartie")))
+    else:
         chapter = Chapter()
         chapter.tutorial = tutorial
         chapter.save()
-        extract_count = 1
-        for souspartie in tree.xpath("/minituto/sousparties/souspartie"):
-            extract_title = tree.xpath("/minituto/sousparties/souspartie["
-                                       + str(extract_count) + "]/titre")[0]
-            extract_text = tree.xpath("/minituto/sousparties/souspartie["
-                                      + str(extract_count) + "]/texte")[0]
+        souspartie_lists = [
+            (chapter, racine.iterfind("sousparties/souspartie"))]
+    extracts = []
+    for (chapter, sousparties) in souspartie_lists:
+        for (extract_count, souspartie) in enumerate(sousparties, 1):
             extract = Extract()
-            extract.title = extract_title.text.strip()
+            extract.title = souspartie.find("titre").text.strip()
             extract.position_in_chapter = extract_count
             extract.chapter = chapter
             extract.text = extract.get_path(relative=True)
-            extract.save()
-            maj_repo_extract(request, new_slug_path=extract.get_path(),
-                             extract=extract,
-                             text=replace_real_url(extract_text.text,
-                                                   mapping), action="add")
-            extract_count += 1
+            files[extract.text] = replace_real_url(
+                souspartie.find("texte").text, mapping)
+            extracts.append(extract)
+    Extract.objects.bulk_create(extracts)
+    init_repo_tuto(request, tutorial, files)
 
 
 @can_write_and_read_now
@@ -2270,6 +2206,38 @@ def import_tuto(request):
 
 # Handling repo
 
+def init_repo_tuto(request, tutorial, files):
+    """Creates the repository of a new tutorial with all its files (a dict of
+    their contents by relative path) and its manifest, in a single commit."""
+
+    path = tutorial.get_path()
+    repo = Repo.init(path, bare=False)
+    for (relative_path, content) in files.iteritems():
+        file_path = os.path.join(path, relative_path)
+        if not os.path.exists(os.path.dirname(file_path)):
+            os.makedirs(os.path.dirname(file_path), mode=0o777)
+        out_file = open(file_path, "w")
+        out_file.write(smart_str(content).strip())
+        out_file.close()
+    tutorial.dump_json(path=os.path.join(path, "manifest.json"))
+    index = repo.index
+    index.add(list(files) + ["manifest.json"])
+    aut_user = str(request.user.pk)
+    aut_email = str(request.user.email)
+    if aut_email is None or aut_email.strip() == "":
+        aut_email = "inconnu@zestedesavoir.com"
+    com = index.commit(
+        "Import du tutoriel",
+        author=Actor(
+            aut_user,
+            aut_email),
+        committer=Actor(
+            aut_user,
+            aut_email))
+    tutorial.sha_draft = com.hexsha
+    tutorial.save()
+
+
 def maj_repo_tuto(
     request,
     old_slug_path=None,
@@ -2520,13 +2488,7 @@ def download(request):
     tutorial = get_object_or_404(Tutorial, pk=request.GET["tutoriel"])
     ph = os.path.join(settings.REPO_PATH, str(tutorial.pk) + "_"
                       + tutorial.slug)
-    repo = Repo(ph)
-    repo.archive(open(ph + ".tar", "w"))
-    response = HttpResponse(open(ph + ".tar", "rb").read(),
-                            mimetype="application/tar")
-    response["Content-Disposition"] = \
-        "attachment; filename={0}.tar".format(tutorial.slug)
-    return response
+    return serve_archive(request, ph, "{0}.tar".format(tutorial.slug))
 
 
 
@@ -2535,17 +2497,11 @@ def download_markdown(request):
     """Download a markdown tutorial."""
 
     tutorial = get_object_or_404(Tutorial, pk=request.GET["tutoriel"])
-    response = HttpResponse(
-        open(
-            os.path.join(
-                tutorial.get_prod_path(),
-                tutorial.slug +
-                ".md"),
-            "rb").read(),
-        mimetype="application/txt")
-    response["Content-Disposition"] = \
-        "attachment; filename={0}.md".format(tutorial.slug)
-    return response
+    return serve_file(request,
+                      os.path.join(tutorial.get_prod_path(),
+                                   tutorial.slug + ".md"),
+                      "application/txt",
+                      "{0}.md".format(tutorial.slug))
 
 
 
@@ -2553,17 +2509,11 @@ def download_html(request):
     """Download a pdf tutorial."""
 
     tutorial = get_object_or_404(Tutorial, pk=request.GET["tutoriel"])
-    response = HttpResponse(
-        open(
-            os.path.join(
-                tutorial.get_prod_path(),
-                tutorial.slug +
-                ".html"),
-            "rb").read(),
-        mimetype="text/html")
-    response["Content-Disposition"] = \
-        "attachment; filename={0}.html".format(tutorial.slug)
-    return response
+    return serve_file(request,
+                      os.path.join(tutorial.get_prod_path(),
+                                   tutorial.slug + ".html"),
+                      "text/html",
+                      "{0}.html".format(tutorial.slug))
 
 
 
@@ -2571,17 +2521,11 @@ def download_pdf(request):
     """Download a pdf tutorial."""
 
     tutorial = get_object_or_404(Tutorial, pk=request.GET["tutoriel"])
-    response = HttpResponse(
-        open(
-            os.path.join(
-                tutorial.get_prod_path(),
-                tutorial.slug +
-                ".pdf"),
-            "rb").read(),
-        mimetype="application/pdf")
-    response["Content-Disposition"] = \
-        "attachment; filename={0}.pdf".format(tutorial.slug)
-    return response
+    return serve_file(request,
+                      os.path.join(tutorial.get_prod_path(),
+                                   tutorial.slug + ".pdf"),
+                      "application/pdf",
+                      "{0}.pdf".format(tutorial.slug))
 
 
 
@@ -2589,17 +2533,11 @@ def download_epub(request):
     """Download an epub tutorial."""
 
     tutorial = get_object_or_404(Tutorial, pk=request.GET["tutoriel"])
-    response = HttpResponse(
-        open(
-            os.path.join(
-                tutorial.get_prod_path(),
-                tutorial.slug +
-                ".epub"),
-            "rb").read(),
-        mimetype="application/epub")
-    response["Content-Disposition"] = \
-        "attachment; filename={0}.epub".format(tutorial.slug)
-    return response
+    return serve_file(request,
+                      os.path.join(tutorial.get_prod_path(),
+                                   tutorial.slug + ".epub"),
+                      "application/epub",
+                      "{0}.epub".format(tutorial.slug))
 
 
 def get_url_images(md_text, pt):
@@ -2610,7 +2548,13 @@ def get_url_images(md_text, pt):
     # if text is empty don't download
 
     if md_text is not None:
-        imgs = re.findall(regex, md_text)
+
+        # an image used several times is downloaded once
+
+        imgs = []
+        for img in re.findall(regex, md_text):
+            if img not in imgs:
+                imgs.append(img)
         for img in imgs:
 
             # decompose images
@@ -2679,17 +2623,61 @@ def markdown_to_out(md_text):
                   md_text)
 
 
-def MEP(tutorial, sha):
+def convert_file(args):
+    """Writes a markdown file of a published tutorial and its HTML version in
+    the production directory.
+
+    It runs in the processes of the publication pool, so it must not use the
+    database or the cache, nor write anything shared by several files (the
+    images are downloaded before).
+
+    """
+    (prod_path, fichier, md_file_contenu) = args
+
+    # convert to out format
+
+    out_file = open(os.path.join(prod_path, fichier), "w")
+    if md_file_contenu is not None:
+        out_file.write(markdown_to_out(md_file_contenu.encode("utf-8")))
+    out_file.close()
+    target = os.path.join(prod_path, fichier + ".html")
+    try:
+        html_file = open(target, "w")
+    except IOError:
+
+        # handle limit of 255 on windows
+
+        target = u"\\\\?\{0}".format(target)
+        html_file = open(target, "w")
+    if md_file_contenu is not None:
+        html_file.write(get_markdown_instance(Inline=False)
+                        .convert(md_file_contenu).encode("utf-8"))
+    html_file.close()
+    return fichier
+
+
+def MEP(tutorial, sha, publication=None):
     (output, err) = (None, None)
+
+    def progress(value, step):
+        if publication is not None:
+            publication.set_progress(value, step)
+
     repo = Repo(tutorial.get_path())
-    manifest = get_blob(repo.commit(sha).tree, "manifest.json")
+    tree = repo.commit(sha).tree
+    manifest = get_blob(tree, "manifest.json")
     tutorial_version = json.loads(manifest)
-    if os.path.isdir(tutorial.get_prod_path()):
+
+    # this version is about to become the public one
+    cache.set(get_public_manifest_key(tutorial.pk, sha), manifest, None)
+    prod_path = tutorial.get_prod_path()
+    progress(0, u"Copie des fichiers")
+    if os.path.isdir(prod_path):
         try:
-            shutil.rmtree(tutorial.get_prod_path())
+            shutil.rmtree(prod_path)
         except:
-            shutil.rmtree(u"\\\\?\{0}".format(tutorial.get_prod_path()))
-    shutil.copytree(tutorial.get_path(), tutorial.get_prod_path())
+            shutil.rmtree(u"\\\\?\{0}".format(prod_path))
+    shutil.copytree(tutorial.get_path(), prod_path)
 
     # collect md files
 
@@ -2713,71 +2701,84 @@ def MEP(tutorial, sha):
             for extract in chapter["extracts"]:
                 fichiers.append(extract["text"])
 
-    # convert markdown file to html file
+    # convert markdown file to html file, in parallel
 
-    for fichier in fichiers:
-        md_file_contenu = get_blob(repo.commit(sha).tree, fichier)
+    progress(10, u"Conversion des fichiers")
+    conversions = [(prod_path, fichier, get_blob(tree, fichier))
+                   for fichier in fichiers]
 
-        # download images
+    # download the images of all the files at once, before the workers
 
-        get_url_images(md_file_contenu, tutorial.get_prod_path())
+    get_url_images(u"\n".join(md_file_contenu
+                               for (path, fichier, md_file_contenu)
+                               in conversions
+                               if md_file_contenu is not None),
+                   prod_path)
 
-        # convert to out format
-
-        out_file = open(os.path.join(tutorial.get_prod_path(), fichier), "w")
-        if md_file_contenu is not None:
-            out_file.write(markdown_to_out(md_file_contenu.encode("utf-8")))
-        out_file.close()
-        target = os.path.join(tutorial.get_prod_path(), fichier + ".html")
-        os.chdir(os.path.dirname(target))
-        try:
-            html_file = open(target, "w")
-        except IOError:
-
-            # handle limit of 255 on windows
-
-            target = u"\\\\?\{0}".format(target)
-            html_file = open(target, "w")
-        if md_file_contenu is not None:
-            html_file.write(emarkdown(md_file_contenu))
-        html_file.close()
+    pool = None
+    if settings.TUTORIAL_PUBLICATION_PROCESSES > 1 and len(conversions) > 1:
+        pool = Pool(settings.TUTORIAL_PUBLICATION_PROCESSES)
+        results = pool.imap_unordered(convert_file, conversions)
+    else:
+        results = imap(convert_file, conversions)
+    try:
+        for (cpt, fichier) in enumerate(results):
+            progress(10 + 60 * (cpt + 1) / len(conversions),
+                     u"Conversion des fichiers")
+    finally:
+        if pool is not None:
+            pool.terminate()
 
     # load markdown out
 
+    progress(70, u"Export du tutoriel")
     contenu = export_tutorial_to_md(tutorial).lstrip()
-    out_file = open(os.path.join(tutorial.get_prod_path(), tutorial.slug
-                                 + ".md"), "w")
+    md_path = os.path.join(prod_path, tutorial.slug + ".md")
+    out_file = open(md_path, "w")
     out_file.write(smart_str(contenu))
     out_file.close()
 
+    # load pandoc, the three exports run at the same time
+
+    progress(80, u"Génération des exports HTML, PDF et EPUB")
+    pandoc = settings.PANDOC_LOC + "pandoc"
+    out_path = os.path.join(prod_path, tutorial.slug)
+    commands = [
+        [pandoc, "--latex-engine=xelatex", "-s", "-S", "--toc", md_path,
+         "-o", out_path + ".html"],
+        [pandoc, "--latex-engine=xelatex",
+         "--template=../../assets/tex/template.tex", "-s", "-S", "-N",
+         "--toc", "-V", "documentclass=scrbook", "-V", "lang=francais",
+         "-V", "mainfont=Verdana", "-V", "monofont=Andale Mono",
+         "-V", "fontsize=12pt", "-V", "geometry:margin=1in", md_path,
+         "-o", out_path + ".pdf"],
+        [pandoc, "-s", "-S", "--toc", md_path, "-o", out_path + ".epub"],
+    ]
+
     # define whether to log pandoc's errors
-    
-    pandoc_debug_str = ""
+
+    log = None
     if settings.PANDOC_LOG_STATE:
-        pandoc_debug_str = " 2>&1 | tee -a "+settings.PANDOC_LOG
-    
-    # load pandoc
-
-    os.chdir(tutorial.get_prod_path())
-    os.system(settings.PANDOC_LOC
-              + "pandoc --latex-engine=xelatex -s -S --toc "
-              + os.path.join(tutorial.get_prod_path(), tutorial.slug)
-              + ".md -o " + os.path.join(tutorial.get_prod_path(),
-                                         tutorial.slug) + ".html"+pandoc_debug_str)
-    os.system(settings.PANDOC_LOC + "pandoc " + "--latex-engine=xelatex "
-              + "--template=../../assets/tex/template.tex " + "-s " + "-S "
-              + "-N " + "--toc " + "-V documentclass=scrbook "
-              + "-V lang=francais " + "-V mainfont=Verdana "
-              + "-V monofont=\"Andale Mono\" " + "-V fontsize=12pt "
-              + "-V geometry:margin=1in "
-              + os.path.join(tutorial.get_prod_path(), tutorial.slug) + ".md "
-              + "-o " + os.path.join(tutorial.get_prod_path(), tutorial.slug)
-              + ".pdf"+pandoc_debug_str)
-    os.system(settings.PANDOC_LOC + "pandoc -s -S --toc "
-              + os.path.join(tutorial.get_prod_path(), tutorial.slug)
-              + ".md -o " + os.path.join(tutorial.get_prod_path(),
-                                         tutorial.slug) + ".epub"+pandoc_debug_str)
-    os.chdir(settings.SITE_ROOT)
+        log = open(settings.PANDOC_LOG, "a")
+    errors = []
+    processes = []
+    try:
+        for command in commands:
+            try:
+                processes.append((command[-1],
+                                  subprocess.Popen(command, cwd=prod_path,
+                                                   stdout=log, stderr=log)))
+            except OSError as e:
+                errors.append(u"{0} : {1}\n".format(command[-1], e))
+        for (target, process) in processes:
+            if process.wait() != 0:
+                errors.append(u"{0} : code {1}\n".format(
+                    target, process.returncode))
+    finally:
+        if log is not None:
+            log.close()
+    if errors:
+        err = u"".join(errors)
     return (output, err)
 
 
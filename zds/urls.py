@@ -3,70 +3,10 @@
 from django.conf.urls import patterns, include, url
 from django.conf.urls.static import static
 from django.contrib import admin
-from django.contrib.sitemaps import GenericSitemap, Sitemap
-
-from zds.article.models import Article
-from zds.forum.models import Category, Forum, Topic
-from zds.tutorial.models import Tutorial
 
 from . import settings
 
 
-# SiteMap data
-class TutoSitemap(Sitemap):
-    changefreq = 'weekly'
-    priority = 1
-
-    def items(self):
-        return Tutorial.objects.filter(sha_public__isnull=False)
-
-    def lastmod(self, tuto):
-        if tuto.update is None:
-            return tuto.pubdate
-        else:
-            return tuto.update
-
-    def location(self, tuto):
-        return tuto.get_absolute_url_online()
-
-
-class ArticleSitemap(Sitemap):
-    changefreq = 'weekly'
-    priority = 1
-
-    def items(self):
-        return Article.objects.filter(sha_public__isnull=False)
-
-    def lastmod(self, article):
-        if article.update is None:
-            return article.pubdate
-        else:
-            return article.update
-
-    def location(self, article):
-        return article.get_absolute_url_online()
-
-sitemaps = {
-    'tutos': TutoSitemap,
-    'articles': ArticleSitemap,
-    'categories': GenericSitemap(
-        {'queryset': Category.objects.all()},
-        changefreq='yearly',
-        priority=0.7
-    ),
-    'forums': GenericSitemap(
-        {'queryset': Forum.objects.filter(group__isnull=True)},
-        changefreq='yearly',
-        priority=0.7
-    ),
-    'topics': GenericSitemap(
-        {'queryset': Topic.objects.filter(is_locked=False), 'date_field': 'pubdate'},
-        changefreq='hourly',
-        priority=0.7
-    ),
-}
-
-
 admin.autodiscover()
 
 
@@ -91,13 +31,10 @@ urlpatterns = patterns('',
                        ) + static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
 
 # SiteMap URLs
-urlpatterns += patterns('django.contrib.sitemaps.views',
-                        (r'^sitemap\.xml$',
-                         'index',
-                         {'sitemaps': sitemaps}),
-                        (r'^sitemap-(?P<section>.+)\.xml$',
-                            'sitemap',
-                            {'sitemaps': sitemaps}),
+urlpatterns += patterns('',
+                        url(r'^sitemap\.xml$', 'zds.pages.views.sitemap'),
+                        url(r'^(?P<filename>sitemap-[\w-]+\.xml\.gz)$',
+                            'zds.pages.views.sitemap'),
                         )
 
 if settings.SERVE:
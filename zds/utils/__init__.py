@@ -1,5 +1,8 @@
 # coding: utf-8
 
+import time
+
+from django.core.urlresolvers import get_resolver
 from django.template import RequestContext, defaultfilters
 
 from django.shortcuts import render_to_response
@@ -22,7 +25,10 @@ def get_current_user():
 def get_current_request():
     return getattr(_thread_locals, 'request', None)
 
-def get_git_version():
+_git_version = None
+
+
+def read_git_version():
     try :
         repo = Repo(settings.SITE_ROOT)
         branch = repo.active_branch
@@ -32,6 +38,22 @@ def get_git_version():
     except:
         return {'name':'', 'url':''}
 
+
+def get_git_version():
+    """Branch and commit of the site, read once per process."""
+    global _git_version
+    if _git_version is None:
+        _git_version = read_git_version()
+    return _git_version
+
+
+def prepare_process():
+    """Computes before the first request the data which don't change while
+    the process runs."""
+    get_git_version()
+    # Imports all the views, with the data they load (quotes, smileys, etc.)
+    get_resolver(None).url_patterns
+
 class ThreadLocals(object):
 
     def process_request(self, request):
@@ -43,8 +65,15 @@ def render_template(tmpl, dct=None):
     if dct is None:
         dct = {}
     dct['git_version']=get_git_version()
-    return render_to_response(
-        tmpl, dct, context_instance=RequestContext(get_current_request()))
+    request = get_current_request()
+    start = time.time()
+    response = render_to_response(
+        tmpl, dct, context_instance=RequestContext(request))
+    # Measured for TimingMiddleware
+    if request is not None:
+        request.template_time = getattr(request, 'template_time', 0) \
+            + time.time() - start
+    return response
 
 
 def slugify(text):
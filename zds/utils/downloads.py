@@ -0,0 +1,186 @@
+# coding: utf-8
+
+import os
+import re
+import subprocess
+
+from django.conf import settings
+from django.http import Http404, HttpResponse, HttpResponseNotModified, \
+    StreamingHttpResponse
+from django.utils.http import parse_etags, quote_etag
+from git import Repo
+
+
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+def etag_matches(request, etag):
+    """Whether the client already has this version of the download."""
+    header = request.META.get('HTTP_IF_NONE_MATCH')
+    if not header:
+        return False
+    etags = parse_etags(header)
+    return '*' in etags or unquote_etag(etag) in etags
+
+
+def unquote_etag(etag):
+    return parse_etags(etag)[0]
+
+
+def read_chunks(fh, start=0, length=None):
+    """Reads an opened file by chunks of DOWNLOAD_CHUNK_SIZE bytes, from the
+    start position and up to length bytes, then closes it."""
+    try:
+        fh.seek(start)
+        while length is None or length > 0:
+            size = settings.DOWNLOAD_CHUNK_SIZE
+            if length is not None:
+                size = min(size, length)
+                length -= size
+            data = fh.read(size)
+            if not data:
+                break
+            yield data
+    finally:
+        fh.close()
+
+
+def parse_range(request, size, etag):
+    """Bounds (first and last bytes included) of the single range asked by
+    the client, or None for the whole file. Raises ValueError if the range
+    can't be satisfied."""
+    header = request.META.get('HTTP_RANGE')
+    if not header:
+        return None
+    # The range is of an older version of the file
+    if request.META.get('HTTP_IF_RANGE', etag) != etag:
+        return None
+    match = RANGE_RE.match(header.strip())
+    # Several ranges aren't supported, the whole file is sent
+    if match is None:
+        return None
+    start, end = match.groups()
+    if not start and not end:
+        return None
+    if not start:
+        # The last bytes of the file
+        start = max(0, size - int(end))
+        end = size - 1
+    else:
+        start = int(start)
+        end = min(int(end), size - 1) if end else size - 1
+    if start > end or start >= size:
+        raise ValueError(header)
+    return start, end
+
+
+def get_accel_redirect(path):
+    """Internal URL of a file for nginx, from the DOWNLOAD_ACCEL_REDIRECT
+    mapping of directories to locations, or None."""
+    path = os.path.abspath(path)
+    for directory, location in settings.DOWNLOAD_ACCEL_REDIRECT.items():
+        directory = os.path.join(os.path.abspath(directory), '')
+        if path.startswith(directory):
+            return location.rstrip('/') + '/' + path[len(directory):]
+    return None
+
+
+def set_attachment(response, filename):
+    response['Content-Disposition'] = \
+        'attachment; filename={0}'.format(filename)
+    return response
+
+
+def serve_file(request, path, content_type, filename):
+    """Sends a file as an attachment without loading it in memory.
+
+    The web server sends it itself when DOWNLOAD_SENDFILE is set. Otherwise
+    it is read by chunks, a single range of it can be asked, and the client
+    gets a 304 when it already has this version (its ETag is computed from
+    the size and the time of modification of the file).
+
+    """
+    try:
+        stat = os.stat(path)
+    except OSError:
+        raise Http404
+    etag = quote_etag('{0:x}-{1:x}'.format(stat.st_size,
+                                           int(stat.st_mtime)))
+    if etag_matches(request, etag):
+        response = HttpResponseNotModified()
+        response['ETag'] = etag
+        return response
+
+    if settings.DOWNLOAD_SENDFILE == 'X-Sendfile':
+        response = HttpResponse(content_type=content_type)
+        response['X-Sendfile'] = path
+        response['ETag'] = etag
+        return set_attachment(response, filename)
+    if settings.DOWNLOAD_SENDFILE == 'X-Accel-Redirect':
+        url = get_accel_redirect(path)
+        if url is not None:
+            response = HttpResponse(content_type=content_type)
+            response['X-Accel-Redirect'] = url
+            response['ETag'] = etag
+            return set_attachment(response, filename)
+
+    size = stat.st_size
+    try:
+        bounds = parse_range(request, size, etag)
+    except ValueError:
+        response = HttpResponse(status=416)
+        response['Content-Range'] = 'bytes */{0}'.format(size)
+        return response
+
+    fh = open(path, 'rb')
+    if bounds is None:
+        response = StreamingHttpResponse(read_chunks(fh),
+                                         content_type=content_type)
+        response['Content-Length'] = str(size)
+    else:
+        start, end = bounds
+        response = StreamingHttpResponse(
+            read_chunks(fh, start, end - start + 1),
+            content_type=content_type,
+            status=206)
+        response['Content-Length'] = str(end - start + 1)
+        response['Content-Range'] = 'bytes {0}-{1}/{2}'.format(start, end,
+                                                               size)
+    response['Accept-Ranges'] = 'bytes'
+    response['ETag'] = etag
+    return set_attachment(response, filename)
+
+
+def read_process(process):
+    """Reads the output of a process by chunks, then waits for it."""
+    try:
+        while True:
+            data = process.stdout.read(settings.DOWNLOAD_CHUNK_SIZE)
+            if not data:
+                break
+            yield data
+    finally:
+        # If the client left, git stops writing to the closed pipe
+        process.stdout.close()
+        process.wait()
+
+
+def serve_archive(request, path, filename):
+    """Sends a tar archive of the last commit of a repository, as git
+    archive writes it. The ETag is the hash of the commit."""
+    try:
+        commit = Repo(path).head.commit.hexsha
+    except Exception:
+        raise Http404
+    etag = quote_etag(commit)
+    if etag_matches(request, etag):
+        response = HttpResponseNotModified()
+        response['ETag'] = etag
+        return response
+
+    process = subprocess.Popen(['git', 'archive', '--format=tar', commit],
+                               cwd=path, stdout=subprocess.PIPE)
+    response = StreamingHttpResponse(read_process(process),
+                                     content_type='application/tar')
+    response['ETag'] = etag
+    return set_attachment(response, filename)
@@ -0,0 +1,122 @@
+# coding: utf-8
+
+from datetime import datetime, timedelta
+import logging
+
+from django.conf import settings
+from django.core.mail import EmailMultiAlternatives, get_connection
+from django.core.mail.backends.base import BaseEmailBackend
+
+from zds.utils.models import QueuedMail
+
+
+logger = logging.getLogger('zds.mailqueue')
+
+
+class QueuedEmailBackend(BaseEmailBackend):
+
+    """Email backend storing the messages in the database.
+
+    The messages are saved in the current transaction, so they are only seen
+    by the send_queued_mails command once it is committed, and dropped if it
+    is rolled back. Only their recipients, subject, sender, text and HTML are
+    stored: messages with copies, attachments or headers are refused, or
+    only logged and left out with fail_silently.
+
+    """
+
+    def send_messages(self, email_messages):
+        now = datetime.now()
+        mails = []
+        for message in email_messages:
+            if message.cc or message.bcc or message.attachments \
+                    or message.extra_headers:
+                error = u'Les emails en copie, avec des pièces jointes ou ' \
+                    u'des en-têtes ne peuvent pas être mis en attente'
+                if not self.fail_silently:
+                    raise ValueError(error)
+                logger.error(u'%s : %s', error, message.subject)
+                continue
+            if not message.to:
+                continue
+            body_html = u''
+            for content, mimetype in getattr(message, 'alternatives', []):
+                if mimetype == 'text/html':
+                    body_html = content
+            mails.append(QueuedMail(subject=message.subject,
+                                    from_email=message.from_email,
+                                    to=u'\n'.join(message.to),
+                                    body=message.body,
+                                    body_html=body_html,
+                                    next_try=now))
+        QueuedMail.objects.bulk_create(mails)
+        return len(mails)
+
+
+def build_message(mail, connection=None):
+    """Rebuilds the email message of a queued mail."""
+    message = EmailMultiAlternatives(mail.subject, mail.body, mail.from_email,
+                                     mail.to.split(u'\n'),
+                                     connection=connection)
+    if mail.body_html:
+        message.attach_alternative(mail.body_html, 'text/html')
+    return message
+
+
+def send_queued_mails(batch_size=None):
+    """Sends the queued mails which are due, over a single connection.
+
+    The connection is only opened once there is a mail to send. A mail which
+    can't be sent is tried again later, waiting twice as long after each
+    failure, and given up after MAIL_QUEUE_MAX_ATTEMPTS attempts. Returns the
+    numbers of sent and failed mails.
+
+    """
+    if batch_size is None:
+        batch_size = settings.MAIL_QUEUE_BATCH_SIZE
+    connection = get_connection(settings.MAIL_QUEUE_BACKEND)
+    opened = False
+    sent = failed = 0
+    try:
+        while True:
+            now = datetime.now()
+            mails = list(QueuedMail.objects
+                         .filter(failed=False, next_try__lte=now)
+                         .order_by('next_try', 'pk')[:batch_size])
+            if not mails:
+                break
+            for mail in mails:
+                # Claim the mail, in case another worker runs at the same time
+                claimed = QueuedMail.objects\
+                    .filter(pk=mail.pk, next_try=mail.next_try)\
+                    .update(next_try=now + timedelta(
+                        seconds=settings.MAIL_QUEUE_RETRY_DELAY))
+                if not claimed:
+                    continue
+
+                try:
+                    if not opened:
+                        connection.open()
+                        opened = True
+                    build_message(mail, connection).send()
+                except Exception as e:
+                    # the connection is opened again for the next mail, else
+                    # each message would open and close its own
+                    connection.close()
+                    opened = False
+                    mail.attempts += 1
+                    mail.last_error = u'{0!r}'.format(e)
+                    if mail.attempts >= settings.MAIL_QUEUE_MAX_ATTEMPTS:
+                        mail.failed = True
+                    mail.next_try = now + timedelta(
+                        seconds=settings.MAIL_QUEUE_RETRY_DELAY
+                        * 2 ** (mail.attempts - 1))
+                    mail.save()
+                    failed += 1
+                else:
+                    mail.delete()
+                    sent += 1
+    finally:
+        if opened:
+            connection.close()
+    return sent, failed
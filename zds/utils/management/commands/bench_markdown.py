@@ -0,0 +1,65 @@
+# coding: utf-8
+
+from optparse import make_option
+import time
+
+from django.core.management.base import NoArgsCommand
+
+from zds.utils.templatetags.emarkdown import get_markdown_instance, \
+    render_markdown, _acquire_parser, _release_parser
+
+
+SAMPLE = u"""# Un titre
+
+Un paragraphe avec de l'*emphase*, du **gras**, un [lien](http://zestedesavoir.com)
+et quelques smileys :) :D ;)
+
+- un élément
+- un autre élément
+
+1. premier
+2. second
+
+```python
+def hello():
+    print "Hello world"
+```
+
+> Une citation
+"""
+
+
+class Command(NoArgsCommand):
+    help = u'Measure the number of Markdown renders per second.'
+
+    option_list = NoArgsCommand.option_list + (
+        make_option('--iterations', type='int', dest='iterations',
+                    default=200, help=u'Number of renders by scenario'),
+    )
+
+    def handle_noargs(self, **options):
+        iterations = options['iterations']
+
+        def fresh_parser():
+            get_markdown_instance(Inline=False).convert(SAMPLE)
+
+        def pooled_parser():
+            md = _acquire_parser(False)
+            try:
+                md.convert(SAMPLE)
+            finally:
+                _release_parser(md, False)
+
+        def cached_render():
+            render_markdown(SAMPLE)
+
+        for label, render in ((u'nouveau parseur', fresh_parser),
+                              (u'parseur réutilisé', pooled_parser),
+                              (u'rendu en cache', cached_render)):
+            render()
+            start = time.time()
+            for i in range(iterations):
+                render()
+            elapsed = time.time() - start
+            self.stdout.write(u'{0} : {1:.0f} rendus/s'.format(
+                label, iterations / elapsed if elapsed else float('inf')))
@@ -0,0 +1,23 @@
+# coding: utf-8
+
+from optparse import make_option
+
+from django.core.management.base import NoArgsCommand
+
+from zds.utils.sitemaps import generate_sitemaps
+
+
+class Command(NoArgsCommand):
+    help = u'Write the files of the sitemap which changed since the last ' \
+        u'run, and their index.'
+
+    option_list = NoArgsCommand.option_list + (
+        make_option('--force', action='store_true', dest='force',
+                    default=False,
+                    help=u'Write all the files, even the unchanged ones'),
+    )
+
+    def handle_noargs(self, **options):
+        written, unchanged = generate_sitemaps(options['force'])
+        self.stdout.write(u'{0} fichiers écrits, {1} inchangés'
+                          .format(written, unchanged))
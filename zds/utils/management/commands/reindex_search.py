@@ -0,0 +1,49 @@
+# coding: utf-8
+
+from datetime import timedelta
+from multiprocessing import Pool
+from optparse import make_option
+
+from django.core.management.base import NoArgsCommand
+from haystack import connections
+
+from zds.utils.search import close_db_connections, get_partitions, \
+    reindex_partition
+
+
+class Command(NoArgsCommand):
+    help = u'Index again every object, split in ranges of dates indexed by ' \
+        u'several processes.'
+
+    option_list = NoArgsCommand.option_list + (
+        make_option('--workers', type='int', dest='workers', default=4,
+                    help=u'Number of processes'),
+        make_option('--days', type='int', dest='days', default=30,
+                    help=u'Number of days of objects indexed by a process '
+                    u'at once'),
+    )
+
+    def handle_noargs(self, **options):
+        period = timedelta(days=options['days'])
+        partitions = []
+        for using in connections.connections_info:
+            unified_index = connections[using].get_unified_index()
+            for model in unified_index.get_indexed_models():
+                label = u'{0}.{1}'.format(model._meta.app_label,
+                                          model._meta.object_name)
+                for start, end in get_partitions(model, using, period):
+                    partitions.append((label, using, start, end))
+
+        close_db_connections()
+        pool = Pool(options['workers'], close_db_connections)
+        try:
+            counts = {}
+            for label, count in pool.imap_unordered(reindex_partition,
+                                                    partitions):
+                counts[label] = counts.get(label, 0) + count
+        finally:
+            pool.close()
+            pool.join()
+        for label in sorted(counts):
+            self.stdout.write(u'{0} : {1} documents indexés'.format(
+                label, counts[label]))
@@ -0,0 +1,21 @@
+# coding: utf-8
+
+from optparse import make_option
+
+from django.core.management.base import NoArgsCommand
+
+from zds.utils.mailqueue import send_queued_mails
+
+
+class Command(NoArgsCommand):
+    help = u'Send the queued mails which are due, over a single connection.'
+
+    option_list = NoArgsCommand.option_list + (
+        make_option('--batch-size', type='int', dest='batch_size',
+                    default=None, help=u'Number of mails read at once'),
+    )
+
+    def handle_noargs(self, **options):
+        sent, failed = send_queued_mails(options['batch_size'])
+        self.stdout.write(u'{0} emails envoyés, {1} en échec'.format(
+            sent, failed))
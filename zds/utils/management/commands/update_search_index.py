@@ -0,0 +1,31 @@
+# coding: utf-8
+
+from optparse import make_option
+import time
+
+from django.core.management.base import NoArgsCommand
+
+from zds.utils.search import update_search_index
+
+
+class Command(NoArgsCommand):
+    help = u'Send the objects saved or deleted since the last run to the ' \
+        u'search engine, in bulk.'
+
+    option_list = NoArgsCommand.option_list + (
+        make_option('--batch-size', type='int', dest='batch_size',
+                    default=None, help=u'Number of objects sent at once'),
+        make_option('--every', type='int', dest='every', default=None,
+                    help=u'Run again every given number of seconds, until '
+                    u'interrupted'),
+    )
+
+    def handle_noargs(self, **options):
+        while True:
+            updated, removed = update_search_index(options['batch_size'])
+            if updated or removed or not options['every']:
+                self.stdout.write(u'{0} documents indexés, {1} '
+                                  u'supprimés'.format(updated, removed))
+            if not options['every']:
+                break
+            time.sleep(options['every'])
@@ -0,0 +1,62 @@
+# coding: utf-8
+
+from django.contrib.auth.models import Permission, User
+from django.db.models import Q
+
+from zds.utils.models import Alert, Comment, CommentDislike, CommentLike
+
+
+def get_staff_pks(user_pks):
+    """Members among the given ones having the permission of the staff, like
+    User.has_perm('forum.change_post') does for each of them."""
+    permissions = Permission.objects.filter(content_type__app_label='forum',
+                                            codename='change_post')
+    return set(User.objects
+               .filter(pk__in=user_pks, is_active=True)
+               .filter(Q(is_superuser=True)
+                       | Q(user_permissions__in=permissions)
+                       | Q(groups__permissions__in=permissions))
+               .values_list('pk', flat=True))
+
+
+def prepare_messages(messages, user):
+    """Computes at once, for a page of messages, what misc/message.part.html
+    shows of each of them: whether their authors belong to the staff, the
+    votes of the user and the alerts.
+
+    The messages should come with select_related('author__profile',
+    'editor'). Returns them in a list.
+
+    """
+    messages = list(messages)
+    if not messages:
+        return messages
+
+    staff = get_staff_pks(set(message.author_id for message in messages))
+    for message in messages:
+        message.author.has_staff_perm = message.author_id in staff
+
+    # Private posts are neither voted nor alerted
+    if not isinstance(messages[0], Comment):
+        return messages
+
+    pks = [message.pk for message in messages]
+    liked = disliked = set()
+    if user.is_authenticated():
+        liked = set(CommentLike.objects
+                    .filter(user=user, comments__in=pks)
+                    .values_list('comments', flat=True))
+        disliked = set(CommentDislike.objects
+                       .filter(user=user, comments__in=pks)
+                       .values_list('comments', flat=True))
+    alerts = {}
+    for alert in Alert.objects\
+            .filter(comment__in=pks)\
+            .select_related('author__profile')\
+            .order_by('pubdate'):
+        alerts.setdefault(alert.comment_id, []).append(alert)
+    for message in messages:
+        message.user_liked = message.pk in liked
+        message.user_disliked = message.pk in disliked
+        message.alert_list = alerts.get(message.pk, [])
+    return messages
@@ -4,6 +4,10 @@ import os
 import string
 import uuid
 
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import F
+
 
 THUMB_MAX_WIDTH = 80
 THUMB_MAX_HEIGHT = 80
@@ -11,6 +15,46 @@ THUMB_MAX_HEIGHT = 80
 MEDIUM_MAX_WIDTH = 200
 MEDIUM_MAX_HEIGHT = 200
 
+# The home page, cached as a whole for anonymous visitors, and its parts
+HOME_CACHE_KEY = 'home-page'
+HOME_FRAGMENTS = ('tutorials', 'articles', 'topics')
+
+
+def get_home_fragment_key(fragment):
+    return 'home-{0}'.format(fragment)
+
+
+def invalidate_home_cache(*fragments):
+    """Forget the cached home page and the given parts of it (all of them
+    by default)."""
+    cache.delete_many([HOME_CACHE_KEY] +
+                      [get_home_fragment_key(fragment)
+                       for fragment in fragments or HOME_FRAGMENTS])
+
+
+# The navbar: the menus are the same for everybody, the alerts for all the
+# moderators and the private messages and notifications are cached for each
+# member. They are forgotten by signals connected next to the models they
+# depend on.
+FORUM_MENU_CACHE_KEY = 'navbar-forums'
+TUTORIAL_MENU_CACHE_KEY = 'navbar-tutorials'
+ALERTS_CACHE_KEY = 'navbar-alerts'
+
+
+def get_navbar_key(user_pk):
+    return 'navbar-member-{0}'.format(user_pk)
+
+
+def invalidate_navbar(user_pks):
+    """Forget the private messages and notifications of the members."""
+    cache.delete_many([get_navbar_key(pk) for pk in set(user_pks)])
+
+
+def forget_reader_navbar(sender, instance, **kwargs):
+    """Forget the notifications of a member who read, followed, joined or
+    left a topic (or a private topic)."""
+    invalidate_navbar([instance.user_id])
+
 
 def image_path(instance, filename):
     """Return path to an image."""
@@ -41,3 +85,61 @@ def has_changed(instance, field, manager='objects'):
     manager = getattr(instance.__class__, manager)
     old = getattr(manager.get(pk=instance.pk), field)
     return not getattr(instance, field) == old
+
+
+def get_unread_pks(read_model, objects, user, field, read_field, last_field):
+    """Returns the pks of the objects the user has never read since their last
+    message was added, using a single query.
+
+    ``read_model`` is the model keeping track of the reads (eg. TopicRead),
+    ``field`` its foreign key to the objects (eg. 'topic') and ``read_field``
+    its foreign key to the last message read (eg. 'post'). ``last_field`` is
+    the foreign key of the objects to their last message (eg. 'last_message').
+
+    Anonymous users are considered to have read everything.
+
+    """
+    objects = list(objects)
+    if len(objects) == 0 or user is None or not user.is_authenticated():
+        return set()
+
+    reads = set(read_model.objects
+                .filter(user=user,
+                        **{field + '__in': [obj.pk for obj in objects]})
+                .values_list(field, read_field))
+
+    return set(obj.pk for obj in objects
+               if (obj.pk, getattr(obj, last_field + '_id')) not in reads)
+
+
+# Counters of the messages of topics and private topics
+COUNTER_FIELDS = ('post_count', 'last_position')
+
+
+def get_fields_but_counters(instance):
+    """Fields saved by save_but_counters of the topics (or private topics):
+    their counters are only changed by allocate_position."""
+    return [field.name for field in instance._meta.fields
+            if not field.primary_key and field.name not in COUNTER_FIELDS]
+
+
+def allocate_position(topic):
+    """Counts a new message in a topic (or a private topic) and returns its
+    position.
+
+    The counters are incremented in database and the row stays locked until
+    the end of the transaction, so messages added at the same time get
+    different positions. It has to be called in the transaction saving the
+    message.
+
+    """
+    model = type(topic)
+    with transaction.atomic():
+        model.objects.filter(pk=topic.pk).update(
+            post_count=F('post_count') + 1,
+            last_position=F('last_position') + 1)
+        topic.post_count, topic.last_position = model.objects\
+            .filter(pk=topic.pk)\
+            .values_list(*COUNTER_FIELDS)\
+            .get()
+    return topic.last_position
@@ -5,10 +5,14 @@ import string
 import uuid
 
 from django.contrib.auth.models import User
+from django.contrib.contenttypes.models import ContentType
+from django.core.cache import cache
 from django.core.urlresolvers import reverse
 from django.utils.encoding import smart_text
 from django.db import models
+from django.db.models.signals import post_delete, post_save
 from zds.utils import slugify
+from zds.utils.misc import ALERTS_CACHE_KEY
 
 from model_utils.managers import InheritanceManager
 
@@ -161,7 +165,7 @@ class Comment(models.Model):
                                null=True, blank=True)
     ip_address = models.CharField('Adresse IP de l\'auteur ', max_length=39)
 
-    position = models.IntegerField('Position')
+    position = models.IntegerField('Position', db_index=True)
 
     text = models.TextField('Texte')
     text_html = models.TextField('Texte en Html')
@@ -229,6 +233,14 @@ class Alert(models.Model):
         verbose_name_plural = 'Alertes'
 
 
+def forget_alerts(sender, **kwargs):
+    cache.delete(ALERTS_CACHE_KEY)
+
+
+post_save.connect(forget_alerts, sender=Alert)
+post_delete.connect(forget_alerts, sender=Alert)
+
+
 class CommentLike(models.Model):
 
     """Set of like comments."""
@@ -269,3 +281,41 @@ class Tag(models.Model):
         self.title = smart_text(self.title)
         self.slug = slugify(self.title)
         super(Tag, self).save(*args, **kwargs)
+
+
+class QueuedMail(models.Model):
+
+    """Email waiting to be sent by the send_queued_mails command."""
+    class Meta:
+        verbose_name = 'Email en attente'
+        verbose_name_plural = 'Emails en attente'
+
+    subject = models.TextField('Sujet')
+    from_email = models.CharField('Expéditeur', max_length=254)
+    to = models.TextField('Destinataires')
+    body = models.TextField('Texte')
+    body_html = models.TextField('Texte en HTML', blank=True)
+    pubdate = models.DateTimeField('Date de création', auto_now_add=True)
+    next_try = models.DateTimeField('Prochain essai', db_index=True)
+    attempts = models.IntegerField('Nombre d\'essais', default=0)
+    failed = models.BooleanField('Abandonné', default=False)
+    last_error = models.TextField('Dernière erreur', blank=True)
+
+    def __unicode__(self):
+        return u'{0} : {1}'.format(self.to, self.subject)
+
+
+class SearchIndexUpdate(models.Model):
+
+    """Object saved or deleted, waiting to be sent to the search engine by the
+    update_search_index command."""
+    class Meta:
+        verbose_name = 'Mise à jour de l\'index de recherche'
+        verbose_name_plural = 'Mises à jour de l\'index de recherche'
+
+    content_type = models.ForeignKey(ContentType, verbose_name='Type')
+    object_id = models.PositiveIntegerField('Identifiant')
+    pubdate = models.DateTimeField('Date de création', auto_now_add=True)
+
+    def __unicode__(self):
+        return u'{0} {1}'.format(self.content_type, self.object_id)
@@ -1,8 +1,10 @@
 # coding: utf-8
 
 from datetime import datetime
-from zds.mp.models import PrivateTopic, PrivatePost
-from django.core.mail import EmailMultiAlternatives
+from zds.mp.models import PrivateTopic, PrivatePost, add_members, \
+    remove_member
+from zds.utils.misc import allocate_position
+from django.core.mail import EmailMultiAlternatives, get_connection
 from django.conf import settings
 from django.template import Context
 from django.template.loader import get_template
@@ -39,14 +41,17 @@ def send_mp(
     post.text = text
     post.text_html = emarkdown(text)
     post.pubdate = datetime.now()
-    post.position_in_topic = 1
+    post.position_in_topic = allocate_position(n_topic)
     post.save()
 
     n_topic.last_message = post
-    n_topic.save()
+    n_topic.save_but_counters()
+    add_members(n_topic, [author], unread=False)
+    add_members(n_topic, users)
 
     # send email
     if send_by_mail:
+        mails = []
         if direct:
             subject = "ZDS : " + n_topic.title
             from_email = "Zeste de Savoir <{0}>".format(settings.MAIL_NOREPLY)
@@ -66,10 +71,7 @@ def send_mp(
                     subject, message_txt, from_email, [
                         part.email])
                 msg.attach_alternative(message_html, "text/html")
-                try:
-                    msg.send()
-                except:
-                    msg = None
+                mails.append(msg)
         else:
             subject = "ZDS - MP: " + n_topic.title
             from_email = "Zeste de Savoir <{0}>".format(settings.MAIL_NOREPLY)
@@ -93,14 +95,14 @@ def send_mp(
                     subject, message_txt, from_email, [
                         part.email])
                 msg.attach_alternative(message_html, "text/html")
-                try:
-                    msg.send()
-                except:
-                    msg = None
+                mails.append(msg)
+        get_connection('zds.utils.mailqueue.QueuedEmailBackend',
+                       fail_silently=True).send_messages(mails)
     if leave:
         move = n_topic.participants.first()
         n_topic.author = move
         n_topic.participants.remove(move)
-        n_topic.save()
+        n_topic.save_but_counters()
+        remove_member(n_topic, author)
 
     return n_topic
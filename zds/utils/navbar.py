@@ -0,0 +1,240 @@
+# coding: utf-8
+
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import ObjectDoesNotExist
+from django.db.models import F, Min
+
+from zds.article.models import Reaction
+from zds.forum.models import Category as ForumCategory, Forum, Post, \
+    TopicFollowed, TopicRead
+from zds.mp.models import PrivatePost, PrivateTopicMember, PrivateTopicRead, \
+    get_unread_count
+from zds.tutorial.models import Note, Tutorial
+from zds.utils.misc import ALERTS_CACHE_KEY, FORUM_MENU_CACHE_KEY, \
+    TUTORIAL_MENU_CACHE_KEY, get_navbar_key
+from zds.utils.models import Alert, Category, CategorySubCategory
+
+
+def get_cached(key, compute):
+    value = cache.get(key)
+    if value is None:
+        value = compute()
+        cache.set(key, value, settings.NAVBAR_CACHE_TIMEOUT)
+    return value
+
+
+def get_forum_menu():
+    """Categories of the forums, with all their forums (which still have to be
+    filtered by the forums the user can read)."""
+    def compute():
+        forums = OrderedDict((category, []) for category in
+                             ForumCategory.objects.order_by('position'))
+        by_pk = dict((category.pk, category) for category in forums)
+        for forum in Forum.objects.order_by('position_in_category'):
+            forums[by_pk[forum.category_id]].append(forum)
+        return forums.items()
+    return get_cached(FORUM_MENU_CACHE_KEY, compute)
+
+
+def get_tutorial_menu():
+    """Categories containing published tutorials, with their main
+    subcategories."""
+    def compute():
+        published = set(Tutorial.objects
+                        .exclude(sha_public__isnull=True)
+                        .exclude(sha_public='')
+                        .values_list('subcategory', flat=True))
+        links = OrderedDict((category, []) for category in
+                            Category.objects.all())
+        by_pk = dict((category.pk, category) for category in links)
+        tutorials = set()
+        for link in CategorySubCategory.objects\
+                .filter(is_main=True)\
+                .select_related('subcategory'):
+            links[by_pk[link.category_id]].append(link.subcategory)
+            if link.subcategory_id in published:
+                tutorials.add(link.category_id)
+        return [(category, subcategories)
+                for (category, subcategories) in links.items()
+                if category.pk in tutorials]
+    return get_cached(TUTORIAL_MENU_CACHE_KEY, compute)
+
+
+def navbar_entry(title, url, post):
+    try:
+        avatar_url = post.author.profile.get_avatar_url()
+    except ObjectDoesNotExist:
+        avatar_url = ''
+    return {'title': title,
+            'url': url,
+            'author': post.author.username,
+            'avatar_url': avatar_url,
+            'pubdate': post.pubdate}
+
+
+def get_unread_posts(user):
+    """Followed topics with new messages, with the first unread one."""
+    topics = [followed.topic for followed in TopicFollowed.objects
+              .filter(user=user)
+              .select_related('topic')
+              .order_by('-topic__last_message__pubdate')]
+    reads = dict((read.topic_id, read.post) for read in TopicRead.objects
+                 .filter(user=user,
+                         topic__in=TopicFollowed.objects
+                         .filter(user=user)
+                         .values('topic'))
+                 .select_related('post'))
+    unread = [topic for topic in topics
+              if topic.pk not in reads
+              or reads[topic.pk].pk != topic.last_message_id]
+    if not unread:
+        return []
+
+    # Positions may have gaps (deleted posts): the first unread message of
+    # each topic is the lowest position after the last read one, found by
+    # grouped queries joined with the reads (the topics never read start at
+    # their first message), then all fetched at once.
+    firsts = {}
+    if any(topic.pk in reads for topic in unread):
+        firsts.update(Post.objects
+                      .filter(topic__in=[topic.pk for topic in unread
+                                         if topic.pk in reads],
+                              topic__topicread__user=user,
+                              topic__topicread__post__position__lt=F(
+                                  'position'))
+                      .values_list('topic')
+                      .annotate(Min('position'))
+                      .order_by())
+    if any(topic.pk not in reads for topic in unread):
+        firsts.update(Post.objects
+                      .filter(topic__in=[topic.pk for topic in unread
+                                         if topic.pk not in reads])
+                      .values_list('topic')
+                      .annotate(Min('position'))
+                      .order_by())
+    if firsts:
+        first_unread = dict((post.topic_id, post) for post in Post.objects
+                            .filter(topic__in=firsts.keys(),
+                                    position__in=set(firsts.values()))
+                            .select_related('author__profile')
+                            if firsts[post.topic_id] == post.position)
+    else:
+        first_unread = {}
+
+    entries = []
+    for topic in unread:
+        post = first_unread.get(topic.pk)
+        if post is None:
+            continue
+        last_read = reads.get(topic.pk, post)
+        last_read.topic = topic
+        entries.append(navbar_entry(topic.title,
+                                    last_read.get_absolute_url(),
+                                    post))
+    return entries
+
+
+def get_private_topics(user):
+    """Unread private topics, with their first unread message, then the last
+    read ones up to five topics, and the number of unread ones."""
+    members = PrivateTopicMember.objects\
+        .filter(user=user)\
+        .order_by('-last_activity')
+
+    unread = [member.privatetopic for member in members
+              .filter(is_unread=True)
+              .select_related('privatetopic')]
+    reads = dict((read.privatetopic_id, read.privatepost) for read in
+                 PrivateTopicRead.objects
+                 .filter(user=user, privatetopic__in=unread)
+                 .select_related('privatepost'))
+    firsts = {}
+    for privatetopic in unread:
+        read = reads.get(privatetopic.pk)
+        firsts[privatetopic.pk] = read.position_in_topic + 1 if read else 1
+    if unread:
+        first_unread = dict((post.privatetopic_id, post) for post in
+                            PrivatePost.objects
+                            .filter(privatetopic__in=firsts.keys(),
+                                    position_in_topic__in=set(
+                                        firsts.values()))
+                            .select_related('author__profile')
+                            if firsts[post.privatetopic_id] ==
+                            post.position_in_topic)
+    else:
+        first_unread = {}
+    unread_entries = []
+    for privatetopic in unread:
+        post = first_unread.get(privatetopic.pk)
+        if post is None:
+            continue
+        last_read = reads.get(privatetopic.pk, post)
+        last_read.privatetopic = privatetopic
+        unread_entries.append(navbar_entry(privatetopic.title,
+                                           last_read.get_absolute_url(),
+                                           post))
+
+    read_entries = []
+    read_count = max(0, 5 - len(unread_entries))
+    if read_count:
+        read_members = members\
+            .filter(is_unread=False)\
+            .select_related('privatetopic__last_message__author__profile')
+        for member in read_members[:read_count]:
+            privatetopic = member.privatetopic
+            post = privatetopic.last_message
+            if post is None:
+                continue
+            post.privatetopic = privatetopic
+            read_entries.append(navbar_entry(privatetopic.title,
+                                             post.get_absolute_url(),
+                                             post))
+    return {'unread': unread_entries,
+            'read': read_entries,
+            'count': get_unread_count(user)}
+
+
+def get_member_navbar(user):
+    """Private messages and notifications of a member, computed once per
+    request and cached until one of them changes."""
+    navbar = getattr(user, '_navbar', None)
+    if navbar is None:
+        navbar = get_cached(get_navbar_key(user.pk),
+                            lambda: {'privatetopics': get_private_topics(user),
+                                     'posts': get_unread_posts(user)})
+        user._navbar = navbar
+    return navbar
+
+
+def get_alerts():
+    """Last alerts, with the messages they are about, and their number."""
+    def compute():
+        alerts = list(Alert.objects
+                      .select_related('author')
+                      .order_by('-pubdate')[:10])
+        comments = {}
+        for (scope, model, related) in ((Alert.FORUM, Post, 'topic'),
+                                        (Alert.ARTICLE, Reaction, 'article'),
+                                        (Alert.TUTORIAL, Note, 'tutorial')):
+            pks = [alert.comment_id for alert in alerts
+                   if alert.scope == scope]
+            if pks:
+                comments.update((comment.pk, (comment, related))
+                                for comment in model.objects
+                                .filter(pk__in=pks)
+                                .select_related(related))
+        total = []
+        for alert in alerts:
+            if alert.comment_id not in comments:
+                continue
+            comment, related = comments[alert.comment_id]
+            total.append({'title': getattr(comment, related).title,
+                          'url': comment.get_absolute_url(),
+                          'pubdate': comment.pubdate,
+                          'author': alert.author,
+                          'text': alert.text})
+        return {'list': total, 'count': Alert.objects.count()}
+    return get_cached(ALERTS_CACHE_KEY, compute)
@@ -1,5 +1,41 @@
 # coding: utf-8
 
+from django.conf import settings
+from django.core.paginator import EmptyPage
+
+
+def get_num_pages(last_position, per_page=None):
+    """Number of pages of a list of messages, at least one."""
+    if per_page is None:
+        per_page = settings.POSTS_PER_PAGE
+    return max(1, (last_position + per_page - 1) // per_page)
+
+
+def seek_page(queryset, page_nbr, last_position, field='position',
+              per_page=None):
+    """Messages of a page, fetched by a range of positions instead of an
+    offset, with the last message of the previous page first.
+
+    Positions follow each other from 1, so the page is found in the index of
+    the positions however deep it is. Returns the messages and the number of
+    pages, or raises EmptyPage.
+
+    """
+    if per_page is None:
+        per_page = settings.POSTS_PER_PAGE
+    num_pages = get_num_pages(last_position, per_page)
+    if page_nbr < 1 or page_nbr > num_pages:
+        raise EmptyPage(u'La page {0} n\'existe pas'.format(page_nbr))
+
+    start = (page_nbr - 1) * per_page
+    if page_nbr > 1:
+        start -= 1
+    objects = list(queryset
+                   .filter(**{field + '__gt': start,
+                              field + '__lte': page_nbr * per_page})
+                   .order_by(field)[:per_page + 1])
+    return objects, num_pages
+
 
 def paginator_range(current, stop, start=1):
     assert(current <= stop)
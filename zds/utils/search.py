@@ -0,0 +1,121 @@
+# coding: utf-8
+
+from collections import defaultdict
+
+from django.conf import settings
+from django.contrib.contenttypes.models import ContentType
+from django.db import connections as db_connections
+from django.db.models import Max, Min, get_model
+from haystack import connections
+
+from zds.utils.models import SearchIndexUpdate
+
+
+def get_identifier(model, pk):
+    """Identifier of an object in the search engine, without loading it."""
+    return u'{0}.{1}.{2}'.format(model._meta.app_label,
+                                 model._meta.model_name, pk)
+
+
+def index_objects(model, pks, using):
+    """Sends the objects of a model which are indexed to the search engine,
+    and removes the others (deleted or no longer public) from it. Returns
+    the numbers of updated and removed documents."""
+    index = connections[using].get_unified_index().get_index(model)
+    backend = connections[using].get_backend()
+    objects = list(index.index_queryset(using=using).filter(pk__in=pks))
+    if objects:
+        backend.update(index, objects)
+    found = set(obj.pk for obj in objects)
+    missing = set(pks) - found
+    for pk in missing:
+        backend.remove(get_identifier(model, pk))
+    updated = len(objects)
+    removed = len(missing)
+
+    # Documents built from the objects, like the chapters of a tutorial
+    if hasattr(index, 'get_related_updates'):
+        for related_model, related_pks in index.get_related_updates(pks):
+            if related_pks:
+                counts = index_objects(related_model, related_pks, using)
+                updated += counts[0]
+                removed += counts[1]
+    return updated, removed
+
+
+def update_search_index(batch_size=None):
+    """Sends the queued objects to the search engine, by batches of objects
+    of the same model. Returns the numbers of updated and removed documents.
+
+    """
+    if batch_size is None:
+        batch_size = settings.SEARCH_INDEX_BATCH_SIZE
+    updated = removed = 0
+    while True:
+        updates = list(SearchIndexUpdate.objects.order_by('pk')[:batch_size])
+        if not updates:
+            break
+        pks = defaultdict(set)
+        for update in updates:
+            pks[update.content_type_id].add(update.object_id)
+        for content_type_id, model_pks in pks.items():
+            model = ContentType.objects.get_for_id(content_type_id)\
+                .model_class()
+            for using in connections.connections_info:
+                counts = index_objects(model, model_pks, using)
+                updated += counts[0]
+                removed += counts[1]
+        SearchIndexUpdate.objects\
+            .filter(pk__in=[update.pk for update in updates])\
+            .delete()
+    return updated, removed
+
+
+def get_partitions(model, using, period):
+    """Ranges of dates splitting the objects of a model to index, or a
+    single unbounded range if its index has no date."""
+    index = connections[using].get_unified_index().get_index(model)
+    field = index.get_updated_field()
+    if not field:
+        return [(None, None)]
+    bounds = index.index_queryset(using=using)\
+        .aggregate(start=Min(field), end=Max(field))
+    if bounds['start'] is None:
+        return []
+    partitions = []
+    start = bounds['start']
+    while start <= bounds['end']:
+        partitions.append((start, start + period))
+        start += period
+    return partitions
+
+
+def close_db_connections():
+    # The processes of the pool must not share the connections of the parent
+    for connection in db_connections.all():
+        connection.close()
+
+
+def reindex_partition(partition):
+    """Indexes the objects of a model updated in a range of dates, by
+    batches. Runs in a worker process of the reindex_search command."""
+    label, using, start, end = partition
+    model = get_model(*label.split('.'))
+    index = connections[using].get_unified_index().get_index(model)
+    backend = connections[using].get_backend()
+    queryset = index.build_queryset(using=using, start_date=start,
+                                    end_date=end).order_by('pk')
+    batch_size = settings.SEARCH_INDEX_BATCH_SIZE
+    count = 0
+    last_pk = None
+    while True:
+        batch = queryset
+        if last_pk is not None:
+            batch = batch.filter(pk__gt=last_pk)
+        batch = list(batch[:batch_size])
+        if not batch:
+            break
+        backend.update(index, batch)
+        count += len(batch)
+        last_pk = batch[-1].pk
+    return label, count
@@ -0,0 +1,46 @@
+# coding: utf-8
+
+# Only imported by haystack itself, from the HAYSTACK_SIGNAL_PROCESSOR setting:
+# the module must not be loaded before haystack.
+
+from django.contrib.contenttypes.models import ContentType
+from django.db.models.signals import post_delete, post_save
+from haystack.signals import BaseSignalProcessor
+
+from zds.utils.models import SearchIndexUpdate
+
+
+class QueuedSignalProcessor(BaseSignalProcessor):
+
+    """Queues the indexed objects which are saved or deleted, instead of
+    sending them one by one to the search engine during the request. The
+    update_search_index command of zds.utils.search sends them in bulk."""
+
+    def setup(self):
+        self.indexed_models = set()
+        post_save.connect(self.enqueue)
+        post_delete.connect(self.enqueue)
+
+    def teardown(self):
+        post_save.disconnect(self.enqueue)
+        post_delete.disconnect(self.enqueue)
+
+    def get_indexed_models(self):
+        if not self.indexed_models:
+            self.indexed_models = set()
+            for connection in self.connections.all():
+                unified_index = connection.get_unified_index()
+                models = unified_index.get_indexed_models()
+                # The syncdb of South hides the migrated applications, the
+                # indexes are looked for again once it is done
+                if not models:
+                    unified_index.reset()
+                self.indexed_models.update(models)
+        return self.indexed_models
+
+    def enqueue(self, sender, instance, raw=False, **kwargs):
+        if raw or sender not in self.get_indexed_models():
+            return
+        SearchIndexUpdate.objects.create(
+            content_type=ContentType.objects.get_for_model(sender),
+            object_id=instance.pk)
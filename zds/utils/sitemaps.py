@@ -0,0 +1,301 @@
+# coding: utf-8
+
+import errno
+import gzip
+import json
+import os
+import time
+from xml.sax.saxutils import escape
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.urlresolvers import reverse
+from django.db.models import Count, Max
+from django.utils.functional import cached_property
+
+from zds.article.models import Article
+from zds.forum.models import Category, Forum, Topic
+from zds.tutorial.models import Tutorial
+from zds.utils import slugify
+
+
+SITEMAP_INDEX = 'sitemap.xml'
+SITEMAP_STATE = 'sitemap-state.json'
+
+# Cache key held by the request generating the sitemap again, for at most
+# SITEMAP_LOCK_TIMEOUT seconds.
+SITEMAP_LOCK_KEY = 'sitemap-generation'
+SITEMAP_LOCK_TIMEOUT = 10 * 60
+
+# Values given to reverse() then replaced by the fields of each row. They are
+# numbers to match the patterns of the primary keys as well as of the slugs.
+URL_SAMPLE = 4242424240
+
+HEADER = '<?xml version="1.0" encoding="UTF-8"?>\n'
+URLSET = '<urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">\n'
+SITEMAPINDEX = \
+    '<sitemapindex xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">\n'
+
+
+def get_url_format(view, count):
+    """Format string of the URLs of a view taking count arguments: the view
+    is reversed once for all the rows of a section."""
+    samples = [str(URL_SAMPLE + i) for i in range(count)]
+    url = reverse(view, args=samples)
+    for (i, sample) in enumerate(samples):
+        url = url.replace(sample, '{' + str(i) + '}')
+    return url
+
+
+class Section(object):
+    """Part of the sitemap, read from the rows of values_list(*fields) and
+    split in files of SITEMAP_MAX_URLS primary keys. The URLs are those of
+    the view with url_args arguments, and the last modification of a file is
+    the most recent value of its lastmod_fields."""
+    name = None
+    view = None
+    url_args = 1
+    changefreq = None
+    priority = None
+    fields = ('pk',)
+    lastmod_fields = ()
+
+    def queryset(self):
+        raise NotImplementedError
+
+    @cached_property
+    def url_format(self):
+        return get_url_format(self.view, self.url_args)
+
+    def location(self, row):
+        return self.url_format.format(*row[1:])
+
+    def lastmod(self, row):
+        return None
+
+
+class ContentSection(Section):
+    changefreq = 'weekly'
+    priority = 1
+    url_args = 2
+    fields = ('pk', 'title', 'pubdate', 'update')
+    lastmod_fields = ('pubdate', 'update')
+
+    def location(self, row):
+        return self.url_format.format(row[0], slugify(row[1]))
+
+    def lastmod(self, row):
+        return row[3] or row[2]
+
+
+class TutorialSection(ContentSection):
+    name = 'tutos'
+    view = 'zds.tutorial.views.view_tutorial_online'
+
+    def queryset(self):
+        return Tutorial.objects.filter(sha_public__isnull=False)
+
+
+class ArticleSection(ContentSection):
+    name = 'articles'
+    view = 'zds.article.views.view_online'
+
+    def queryset(self):
+        return Article.objects.filter(sha_public__isnull=False)
+
+
+class CategorySection(Section):
+    name = 'categories'
+    view = 'zds.forum.views.cat_details'
+    changefreq = 'yearly'
+    priority = 0.7
+    fields = ('pk', 'slug')
+
+    def queryset(self):
+        return Category.objects.all()
+
+
+class ForumSection(Section):
+    name = 'forums'
+    view = 'zds.forum.views.details'
+    changefreq = 'yearly'
+    priority = 0.7
+    url_args = 2
+    fields = ('pk', 'category__slug', 'slug')
+
+    def queryset(self):
+        return Forum.objects.filter(group__isnull=True)
+
+
+class TopicSection(Section):
+    name = 'topics'
+    view = 'zds.forum.views.topic'
+    changefreq = 'hourly'
+    priority = 0.7
+    url_args = 2
+    fields = ('pk', 'title', 'pubdate', 'last_message__pubdate')
+    lastmod_fields = ('pubdate', 'last_message__pubdate')
+
+    def queryset(self):
+        return Topic.objects.filter(is_locked=False,
+                                    forum__group__isnull=True)
+
+    def location(self, row):
+        return self.url_format.format(row[0], slugify(row[1]))
+
+    def lastmod(self, row):
+        return row[3] or row[2]
+
+
+SECTIONS = (TutorialSection(), ArticleSection(), CategorySection(),
+            ForumSection(), TopicSection())
+
+
+def get_filename(section, number):
+    return 'sitemap-{0}-{1}.xml.gz'.format(section.name, number)
+
+
+def get_pk_range(number):
+    size = settings.SITEMAP_MAX_URLS
+    return {'pk__gt': number * size, 'pk__lte': (number + 1) * size}
+
+
+def get_files(section):
+    """Files of a section: their number, and the number of URLs and the last
+    modification they would have, in one query for each of them."""
+    last_pk = section.queryset().aggregate(last=Max('pk'))['last']
+    if last_pk is None:
+        return []
+    aggregates = dict(('lastmod{0}'.format(i), Max(field))
+                      for (i, field) in enumerate(section.lastmod_fields))
+    files = []
+    for number in range((last_pk - 1) // settings.SITEMAP_MAX_URLS + 1):
+        result = section.queryset()\
+            .filter(**get_pk_range(number))\
+            .aggregate(count=Count('pk'), **aggregates)
+        if not result['count']:
+            continue
+        dates = [result[key] for key in aggregates if result[key]]
+        lastmod = max(dates).isoformat() if dates else None
+        files.append((number, result['count'], lastmod))
+    return files
+
+
+def get_url_lines(section, number):
+    """Lines of a file of a section, streamed from the database without
+    building the objects."""
+    yield HEADER
+    yield URLSET
+    rows = section.queryset()\
+        .filter(**get_pk_range(number))\
+        .order_by('pk')\
+        .values_list(*section.fields)\
+        .iterator()
+    for row in rows:
+        line = [u'<url><loc>{0}</loc>'.format(
+            escape(settings.SITE_URL + section.location(row)))]
+        lastmod = section.lastmod(row)
+        if lastmod is not None:
+            line.append(u'<lastmod>{0}</lastmod>'.format(
+                lastmod.strftime('%Y-%m-%d')))
+        if section.changefreq is not None:
+            line.append(u'<changefreq>{0}</changefreq>'.format(
+                section.changefreq))
+        if section.priority is not None:
+            line.append(u'<priority>{0}</priority>'.format(section.priority))
+        line.append(u'</url>\n')
+        yield u''.join(line).encode('utf-8')
+    yield '</urlset>\n'
+
+
+def get_index_lines(state):
+    yield HEADER
+    yield SITEMAPINDEX
+    for filename in sorted(state):
+        count, lastmod = state[filename]
+        line = [u'<sitemap><loc>{0}/{1}</loc>'.format(
+            escape(settings.SITE_URL), filename)]
+        if lastmod is not None:
+            line.append(u'<lastmod>{0}</lastmod>'.format(lastmod[:10]))
+        line.append(u'</sitemap>\n')
+        yield u''.join(line).encode('utf-8')
+    yield '</sitemapindex>\n'
+
+
+def write_file(path, lines, compress=False):
+    """Writes the lines in a temporary file which then replaces the file, so
+    that an incomplete file is never served."""
+    temp = '{0}.{1}.tmp'.format(path, os.getpid())
+    fh = gzip.open(temp, 'wb') if compress else open(temp, 'wb')
+    try:
+        for line in lines:
+            fh.write(line)
+    finally:
+        fh.close()
+    os.rename(temp, path)
+
+
+def read_state(root):
+    """Number of URLs and last modification of each file, when they were
+    last written."""
+    try:
+        with open(os.path.join(root, SITEMAP_STATE), 'r') as fh:
+            return json.load(fh)
+    except (IOError, ValueError):
+        return {}
+
+
+def generate_sitemaps(force=False):
+    """Writes the files of the sitemap which changed since the last time (or
+    all of them if force is set) in SITEMAP_ROOT, then their index. Returns
+    the numbers of written and unchanged files."""
+    root = settings.SITEMAP_ROOT
+    try:
+        os.makedirs(root)
+    except OSError as e:
+        if e.errno != errno.EEXIST:
+            raise
+    previous = read_state(root)
+    state = {}
+    written = unchanged = 0
+    for section in SECTIONS:
+        for (number, count, lastmod) in get_files(section):
+            filename = get_filename(section, number)
+            path = os.path.join(root, filename)
+            state[filename] = [count, lastmod]
+            if force or previous.get(filename) != state[filename] \
+                    or not os.path.isfile(path):
+                write_file(path, get_url_lines(section, number), True)
+                written += 1
+            else:
+                unchanged += 1
+
+    # Files whose objects were all deleted
+    for filename in set(previous) - set(state):
+        try:
+            os.remove(os.path.join(root, filename))
+        except OSError:
+            pass
+
+    write_file(os.path.join(root, SITEMAP_INDEX), get_index_lines(state))
+    write_file(os.path.join(root, SITEMAP_STATE), [json.dumps(state)])
+    return written, unchanged
+
+
+def get_sitemap_path(filename):
+    """Path of a file of the sitemap, which is generated again first when
+    the index is missing or older than SITEMAP_TIMEOUT seconds (if the
+    command doesn't run). Only one request generates it, the others serve the
+    existing files meanwhile."""
+    index = os.path.join(settings.SITEMAP_ROOT, SITEMAP_INDEX)
+    try:
+        age = time.time() - os.path.getmtime(index)
+    except OSError:
+        age = None
+    if (age is None or age > settings.SITEMAP_TIMEOUT) \
+            and cache.add(SITEMAP_LOCK_KEY, True, SITEMAP_LOCK_TIMEOUT):
+        try:
+            generate_sitemaps()
+        finally:
+            cache.delete(SITEMAP_LOCK_KEY)
+    return os.path.join(settings.SITEMAP_ROOT, filename)
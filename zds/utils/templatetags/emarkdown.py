@@ -1,7 +1,11 @@
 # coding: utf-8
 
 from django import template
+from django.conf import settings
+from django.core.cache import cache
 from django.utils.safestring import mark_safe
+from hashlib import sha1
+import threading
 import time
 import re
 
@@ -35,6 +39,55 @@ def get_markdown_instance(Inline=False):
                            )
     return md
 
+
+# Building a parser loads the extension and compiles the whole smileys table,
+# so parsers are kept in a pool and reset between two documents.
+_parsers = {True: [], False: []}
+_parsers_lock = threading.Lock()
+
+
+def _acquire_parser(inline):
+    with _parsers_lock:
+        if _parsers[inline]:
+            return _parsers[inline].pop()
+    return get_markdown_instance(Inline=inline)
+
+
+def _release_parser(md, inline):
+    md.reset()
+    with _parsers_lock:
+        if len(_parsers[inline]) < settings.MARKDOWN_POOL_SIZE:
+            _parsers[inline].append(md)
+
+
+def render_markdown(text, inline=False):
+    """Converts the text to HTML (utf-8 encoded) using a pooled parser.
+
+    The result is cached by content hash, texts longer than
+    MARKDOWN_CACHE_MAX_LENGTH are never cached.
+
+    """
+    key = None
+    if len(text) <= settings.MARKDOWN_CACHE_MAX_LENGTH:
+        if isinstance(text, unicode):
+            digest = sha1(text.encode('utf-8')).hexdigest()
+        else:
+            digest = sha1(text).hexdigest()
+        key = 'emarkdown-{0}-{1}'.format(int(inline), digest)
+        html = cache.get(key)
+        if html is not None:
+            return html
+
+    md = _acquire_parser(inline)
+    try:
+        html = md.convert(text).encode('utf-8')
+    finally:
+        _release_parser(md, inline)
+
+    if key is not None:
+        cache.set(key, html, settings.MARKDOWN_CACHE_TIMEOUT)
+    return html
+
 register = template.Library()
 
 
@@ -46,16 +99,12 @@ def humane_time(t, conf={}):
 
 @register.filter(needs_autoescape=False)
 def emarkdown(text):
-    return mark_safe(
-        get_markdown_instance(
-            Inline=False).convert(text).encode('utf-8'))
+    return mark_safe(render_markdown(text, inline=False))
 
 
 @register.filter(needs_autoescape=False)
 def emarkdown_inline(text):
-    return mark_safe(
-        get_markdown_instance(
-            Inline=True).convert(text).encode('utf-8').strip())
+    return mark_safe(render_markdown(text, inline=True).strip())
 
 
 def sub_hd1(g):
@@ -2,11 +2,10 @@
 
 from django import template
 
-from zds.article.models import never_read as never_read_article, Validation as ArticleValidation, Reaction
-from zds.forum.models import TopicFollowed, never_read as never_read_topic, Post
-from zds.mp.models import PrivateTopic, never_privateread
-from zds.utils.models import Alert
-from zds.tutorial.models import never_read as never_read_tutorial, Validation as TutoValidation, Note
+from zds.article.models import get_unread_articles, Validation as ArticleValidation
+from zds.forum.models import TopicFollowed, get_unread_topics
+from zds.tutorial.models import get_unread_tutorials, Validation as TutoValidation
+from zds.utils.navbar import get_alerts, get_member_navbar
 
 
 register = template.Library()
@@ -14,10 +13,12 @@ register = template.Library()
 
 @register.filter('is_read')
 def is_read(topic):
-    if never_read_topic(topic):
-        return False
-    else:
-        return True
+    return topic.pk not in get_unread_topics([topic])
+
+
+@register.filter('unread_topics')
+def unread_topics(topics, user):
+    return get_unread_topics(topics, user)
 
 
 @register.filter('followed_topics')
@@ -32,49 +33,18 @@ def followed_topics(user):
 
 @register.filter('interventions_topics')
 def interventions_topics(user):
-    topicsfollowed = TopicFollowed.objects.filter(user=user)\
-        .order_by('-topic__last_message__pubdate')
-
-    posts_unread = []
-
-    for topicfollowed in topicsfollowed:
-        if never_read_topic(topicfollowed.topic):
-            posts_unread.append((topicfollowed.topic.first_unread_post()))
-
-    return posts_unread
+    return get_member_navbar(user)['posts']
 
 
 @register.filter('interventions_privatetopics')
 def interventions_privatetopics(user):
-    topicsfollowed = PrivateTopic.objects.filter(author=user)\
-        .order_by('-last_message__pubdate')
-    topicspart = PrivateTopic.objects.filter(participants__in=[user])\
-        .order_by('-last_message__pubdate')
-    privatetopics_unread = []
-    privatetopics_read = []
-
-    for topicfollowed in topicsfollowed:
-        if never_privateread(topicfollowed):
-            privatetopics_unread.append(topicfollowed)
-        else:
-            privatetopics_read.append(topicfollowed)
-
-    for topicpart in topicspart:
-        if never_privateread(topicpart):
-            privatetopics_unread.append(topicpart)
-        else:
-            privatetopics_read.append(topicpart)
-
-    privateread_topics_count = 5 - \
-        (len(privatetopics_unread) if len(privatetopics_unread) < 5 else 5)
-    return {'unread': privatetopics_unread,
-            'read': privatetopics_read[:privateread_topics_count]}
+    return get_member_navbar(user)['privatetopics']
 
 
 @register.simple_tag(name='reads_topic')
 def reads_topic(topic, user):
     if user.is_authenticated():
-        if never_read_topic(topic, user):
+        if topic.pk in get_unread_topics([topic], user):
             return ''
         else:
             return 'secondary'
@@ -85,7 +55,7 @@ def reads_topic(topic, user):
 @register.simple_tag(name='reads_article')
 def reads_article(article, user):
     if user.is_authenticated():
-        if never_read_article(article, user):
+        if article.pk in get_unread_articles([article], user):
             return ''
         else:
             return 'secondary'
@@ -96,7 +66,7 @@ def reads_article(article, user):
 @register.simple_tag(name='reads_tutorial')
 def reads_tutorial(tutorial, user):
     if user.is_authenticated():
-        if never_read_tutorial(tutorial, user):
+        if tutorial.pk in get_unread_tutorials([tutorial], user):
             return ''
         else:
             return 'secondary'
@@ -128,37 +98,12 @@ def alerts_validation_articles(user):
 
 @register.filter(name='alerts_list')
 def alerts_list(user):
-    total = []
-    alerts = Alert.objects.all().order_by('-pubdate')[:10]
-    for alert in alerts:
-        if alert.scope == Alert.FORUM:
-            post = Post.objects.get(pk=alert.comment.pk)
-            total.append({'title': post.topic.title,
-                          'url': post.get_absolute_url(),
-                          'pubdate': post.pubdate,
-                          'author': alert.author,
-                          'text': alert.text})
-        if alert.scope == Alert.ARTICLE:
-            reaction = Reaction.objects.get(pk=alert.comment.pk)
-            total.append({'title': reaction.article.title,
-                          'url': reaction.get_absolute_url(),
-                          'pubdate': reaction.pubdate,
-                          'author': alert.author,
-                          'text': alert.text})
-        if alert.scope == Alert.TUTORIAL:
-            note = Note.objects.get(pk=alert.comment.pk)
-            total.append({'title': note.tutorial.title,
-                          'url': note.get_absolute_url(),
-                          'pubdate': note.pubdate,
-                          'author': alert.author,
-                          'text': alert.text})
-
-    return total
+    return get_alerts()['list']
 
 
 @register.filter(name='alerts_count')
 def alerts_count(user):
     if user.is_authenticated():
-        return Alert.objects.count()
+        return get_alerts()['count']
     else:
         return 0
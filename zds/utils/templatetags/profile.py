@@ -5,7 +5,6 @@ from django import template
 from django.contrib.auth.models import User
 
 from zds.member.models import Profile
-from zds.utils.models import Comment, CommentLike, CommentDislike
 
 
 register = template.Library()
@@ -37,6 +36,14 @@ def mode(mode):
         return 'eye'
 
 
+def is_staff_member(user):
+    # The pages of messages check it for all their authors at once (see
+    # zds.utils.messages.prepare_messages)
+    if hasattr(user, 'has_staff_perm'):
+        return user.has_staff_perm
+    return user.has_perm('forum.change_post')
+
+
 @register.filter('state')
 def state(user):
     try:
@@ -47,24 +54,10 @@ def state(user):
             state = 'BAN'
         elif not profile.can_write_now():
             state = 'LS'
-        elif user.has_perm('forum.change_post'):
+        elif is_staff_member(user):
             state = 'STAFF'
         else:
             state = None
     except Profile.DoesNotExist:
         state = None
     return state
-
-
-@register.filter('liked')
-def liked(user, comment_pk):
-    comment = Comment.objects.get(pk=comment_pk)
-    return CommentLike.objects.filter(comments=comment, user=user).count() > 0
-
-
-@register.filter('disliked')
-def disliked(user, comment_pk):
-    comment = Comment.objects.get(pk=comment_pk)
-    return CommentDislike.objects.filter(
-        comments=comment,
-        user=user).count() > 0
@@ -6,6 +6,7 @@ from django import template
 from git import *
 
 from zds.utils import slugify
+from zds.utils.tutorials import get_blob
 
 
 register = template.Library()
@@ -19,16 +20,11 @@ def repo_tuto(tutorial, sha=None):
                 'conclusion': tutorial.get_conclusion()}
     else:
         repo = Repo(tutorial.get_path())
-        bls = repo.commit(sha).tree.blobs
-        for bl in bls:
-            if bl.path == 'introduction.md':
-                intro = bl.data_stream.read()
-            if bl.path == 'conclusion.md':
-                conclu = bl.data_stream.read()
+        tree = repo.commit(sha).tree
 
         return {
-            'introduction': intro.decode('utf-8'),
-            'conclusion': conclu.decode('utf-8')}
+            'introduction': get_blob(tree, 'introduction.md'),
+            'conclusion': get_blob(tree, 'conclusion.md')}
 
 
 @register.filter('repo_part')
@@ -38,16 +34,11 @@ def repo_part(part, sha=None):
                 'conclusion': part.get_conclusion()}
     else:
         repo = Repo(part['path'])
-        bls = repo.commit(sha).tree.blobs
-        for bl in bls:
-            if bl.path == 'introduction.md':
-                intro = bl.data_stream.read()
-            if bl.path == 'conclusion.md':
-                conclu = bl.data_stream.read()
+        tree = repo.commit(sha).tree
 
         return {
-            'introduction': intro.decode('utf-8'),
-            'conclusion': conclu.decode('utf-8')}
+            'introduction': get_blob(tree, 'introduction.md'),
+            'conclusion': get_blob(tree, 'conclusion.md')}
 
 
 @register.filter('repo_chapter')
@@ -60,15 +51,10 @@ def repo_chapter(chapter, sha=None):
         if chapter['type'] == 'MINI':
             return {'introduction': None, 'conclusion': None}
         else:
-            bls = repo.commit(sha).tree.blobs
-            for bl in bls:
-                if bl.path == 'introduction.md':
-                    intro = bl.data_stream.read()
-                if bl.path == 'conclusion.md':
-                    conclu = bl.data_stream.read()
+            tree = repo.commit(sha).tree
             return {
-                'introduction': intro.decode('utf-8'),
-                'conclusion': conclu.decode('utf-8')}
+                'introduction': get_blob(tree, 'introduction.md'),
+                'conclusion': get_blob(tree, 'conclusion.md')}
 
 
 @register.filter('repo_extract')
@@ -77,12 +63,10 @@ def repo_extract(extract, sha=None):
         return {'text': extract.get_text()}
     else:
         repo_e = Repo(extract['path'])
-        bls_e = repo_e.commit(sha).tree.blobs
-
-        for bl in bls_e:
-            if bl.path == slugify(extract['title']) + '.md':
-                text = bl.data_stream.read()
-                return {'text': text.decode('utf-8')}
+        text = get_blob(repo_e.commit(sha).tree,
+                        slugify(extract['title']) + '.md')
+        if text is not None:
+            return {'text': text}
     return {'text': ''}
 
 
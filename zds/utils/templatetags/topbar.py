@@ -2,8 +2,8 @@
 
 from django import template
 
-from zds.forum.models import Category as fCategory
-from zds.utils.models import Category, SubCategory, CategorySubCategory
+from zds.forum.models import get_readable_forums
+from zds.utils.navbar import get_forum_menu, get_tutorial_menu
 
 
 register = template.Library()
@@ -11,19 +11,13 @@ register = template.Library()
 
 @register.filter('top_categories')
 def top_categories(user):
-    categories = fCategory.objects.order_by('position').all()
-
-    return categories
+    return get_forum_menu()
 
 
 @register.filter('auth_forums')
 def auth_forums(forums, user):
-    auth = []
-    for forum in forums:
-        if forum.can_read(user):
-            auth.append(forum)
-
-    return auth
+    readable = get_readable_forums(user)
+    return [forum for forum in forums if forum.pk in readable]
 
 
 @register.filter('auth_forum')
@@ -33,10 +27,4 @@ def auth_forum(forum, user):
 
 @register.filter('top_categories_tuto')
 def top_categories_tuto(user):
-    cats = []
-    categories = Category.objects.all()
-    for categorie in categories :
-        if categorie.get_tutos().count() > 0:
-            cats.append(categorie)
-    
-    return cats
+    return get_tutorial_menu()
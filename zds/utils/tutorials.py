@@ -3,6 +3,8 @@
 from collections import OrderedDict
 from datetime import datetime
 import os
+import threading
+from django.conf import settings
 from django.template import Context
 from django.template.loader import get_template
 from git import *
@@ -90,22 +92,40 @@ def export_tutorial(tutorial):
     return dct
 
 
+# Git objects are immutable: the blobs of a tree never change, so they are
+# read once and kept in a process-level LRU keyed by the tree sha.
+_blob_indexes = OrderedDict()
+_blob_indexes_lock = threading.Lock()
+
+
+def get_blob_index(tree):
+    """Returns a dict of the contents of all the blobs of the tree, by path."""
+    with _blob_indexes_lock:
+        index = _blob_indexes.pop(tree.hexsha, None)
+        if index is not None:
+            _blob_indexes[tree.hexsha] = index
+            return index
+
+    index = {}
+    for item in tree.traverse():
+        if item.type == 'blob':
+            index[os.path.normpath(item.path)] = item.data_stream.read()
+
+    with _blob_indexes_lock:
+        _blob_indexes[tree.hexsha] = index
+        while len(_blob_indexes) > settings.GIT_BLOB_INDEX_SIZE:
+            _blob_indexes.popitem(last=False)
+    return index
+
+
 def get_blob(tree, chemin):
-    for bl in tree.blobs:
-        try:
-            if os.path.abspath(bl.path) == os.path.abspath(chemin):
-                data = bl.data_stream.read()
-                return data.decode('utf-8')
-        except:
-            return ""
-    if len(tree.trees) > 0:
-        for tr in tree.trees:
-            result = get_blob(tr, chemin)
-            if result is not None:
-                return result
-        return None
-    else:
+    data = get_blob_index(tree).get(os.path.normpath(chemin))
+    if data is None:
         return None
+    try:
+        return data.decode('utf-8')
+    except UnicodeDecodeError:
+        return ""
 
 
 def export_tutorial_to_md(tutorial):
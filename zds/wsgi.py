@@ -24,6 +24,9 @@ os.environ.setdefault("DJANGO_SETTINGS_MODULE", "zds.settings")
 # setting points here.
 application = get_wsgi_application()
 
+from zds.utils import prepare_process
+prepare_process()
+
 # Apply WSGI middleware here.
 # from helloworld.wsgi import HelloWorldApplication
 # application = HelloWorldApplication(application)